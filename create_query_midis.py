@@ -3,13 +3,16 @@ import sys
 
 from tqdm import tqdm
 
+import project.algorithms.core.constants as constants
+from project.algorithms.core.feature_cache import configure_feature_cache
 from project.algorithms.create_queries import create_indexed_queries, create_modified_queries, create_random_queries
 import argparse
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Create a series of query from a set of MIDI files based on several"
                                                  " strategies.")
-    parser.add_argument("mid_files", help="A path to a folder containing MIDI files to create the queries from.")
+    parser.add_argument("mid_files", help="A path to a folder containing MIDI files to create the queries from (or to "
+                                          "a corpus file created by pack_corpus.py).")
     parser.add_argument("number_of_queries", help="The number of query MIDI files to generate "
                                                   "(default: %(default)s)", type=int, default=400)
     parser.add_argument("output_name", help="The name of the folder these MIDIs should be placed in. This folder "
@@ -17,6 +20,16 @@ if __name__ == "__main__":
     parser.add_argument("--rng_seed", help="The seed to be used for any random number generation "
                                            "(default: %(default)s)", default=None)
 
+    parser.add_argument("--cache_dir", type=str, default=None,
+                        help="If set, cache the features computed from each MIDI file (note timelines, tempo maps "
+                             "etc.) in this folder, so they aren't computed again next time. The folder can also be "
+                             f"set with the {constants.FEATURE_CACHE_DIR_VARIABLE} environment variable "
+                             "(default: no cache)")
+
+    parser.add_argument("--no_cache", action="store_true",
+                        help=f"If set, don't cache features, even if {constants.FEATURE_CACHE_DIR_VARIABLE} is set "
+                             "(default: %(default)s)")
+
     strategies = parser.add_subparsers(title="query_strategies", dest="query_strategy", required=True)
 
     indexed_parser = strategies.add_parser("indexed",
@@ -39,6 +52,14 @@ if __name__ == "__main__":
                                 choices=["graph", "pitch_vector"],
                                 help="Choose which algorithm to create segments for. (default: %(default)s)")
 
+    indexed_parser.add_argument("--segmenter",
+                                default="lbdm",
+                                choices=["lbdm", "lbdm_clustering", "online_lbdm"],
+                                help="If the graph algorithm is chosen, whether to split each file where its LBDM "
+                                     "profile is above a fixed threshold (lbdm), a threshold chosen by clustering "
+                                     "the profile (lbdm_clustering), or a fixed threshold as the notes are read "
+                                     "(online_lbdm) (default: %(default)s)")
+
     indexed_parser.add_argument("--melody_track",
                                 type=int,
                                 default=0,
@@ -64,6 +85,14 @@ if __name__ == "__main__":
                                      choices=["graph", "pitch_vector"],
                                      help="Choose which algorithm to create segments for. (default: %(default)s)")
 
+    modified_ind_parser.add_argument("--segmenter",
+                                     default="lbdm",
+                                     choices=["lbdm", "lbdm_clustering", "online_lbdm"],
+                                     help="If the graph algorithm is chosen, whether to split each file where its LBDM "
+                                          "profile is above a fixed threshold (lbdm), a threshold chosen by clustering "
+                                          "the profile (lbdm_clustering), or a fixed threshold as the notes are read "
+                                          "(online_lbdm) (default: %(default)s)")
+
     modified_ind_parser.add_argument("--melody_track",
                                      type=int,
                                      default=0,
@@ -129,6 +158,7 @@ if __name__ == "__main__":
                                help="The maximum length of the randomly sampled segments (default: %(default)s).")
 
     args = parser.parse_args()
+    configure_feature_cache(args.cache_dir, not args.no_cache)
     output_path = pathlib.Path(f"mid/queries/{args.output_name}")
     try:
         output_path.mkdir(parents=True, exist_ok=False)
@@ -149,12 +179,14 @@ if __name__ == "__main__":
         if args.query_strategy == "indexed":
             print("Indexed segments chosen")
             segments = create_indexed_queries(args.algorithm[0], args.number_of_queries, args.mid_files,
-                                              args.melody_track, args.rng_seed, segmenter_args=segmenter_args)
+                                              args.melody_track, args.rng_seed, segmenter=args.segmenter,
+                                              segmenter_args=segmenter_args)
         else:
             print("Indexed (modified) segments chosen")
             segments = create_modified_queries(args.algorithm[0], args.number_of_queries, args.mid_files,
                                                args.melody_track, args.rng_seed,
-                                               args.transpose, args.duration_transform, segmenter_args=segmenter_args)
+                                               args.transpose, args.duration_transform, segmenter=args.segmenter,
+                                               segmenter_args=segmenter_args)
     elif args.query_strategy == "random":
         print("Random segments chosen")
         segments = create_random_queries(args.number_of_queries, args.mid_files, args.melody_track,
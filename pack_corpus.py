@@ -0,0 +1,40 @@
+import argparse
+import glob
+import sys
+import time
+
+import project.algorithms.core.constants as constants
+from project.algorithms.core.corpus import pack_corpus, CORPUS_EXTENSION
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Pack a set of MIDI files into a single corpus file, which can be "
+                                                 "given to segment.py and create_query_midis.py instead of the MIDI "
+                                                 "files themselves (so each MIDI file doesn't need to be read again)")
+    parser.add_argument("midi_paths", nargs="+", type=str,
+                        help="Path to MIDI file(s) to pack")
+
+    parser.add_argument("-o", "--output", type=str, default=f"mid/corpus/{time.strftime(constants.TIME_FORMAT)}"
+                                                            f"{CORPUS_EXTENSION}",
+                        help=f"Where to save the corpus. The filename should end with {CORPUS_EXTENSION}. The "
+                             f"default is mid/corpus/<current time>{CORPUS_EXTENSION}")
+
+    args = parser.parse_args()
+    paths = []
+    for mid_path in args.midi_paths:
+        paths.extend(glob.glob(mid_path))
+
+    if len(paths) == 0:
+        sys.stderr.write("Error: no MIDI files correspond to the path(s) given\n")
+        sys.stderr.flush()
+        sys.exit(1)
+
+    if not args.output.endswith(CORPUS_EXTENSION):
+        sys.stderr.write(f"Error: the corpus filename must end with {CORPUS_EXTENSION}\n")
+        sys.stderr.flush()
+        sys.exit(1)
+
+    pack_start = time.time()
+    num_packed = pack_corpus(sorted(paths), args.output)
+    pack_end = time.time()
+    print(f"Packed {num_packed} of {len(paths)} MIDI files into {args.output}. "
+          f"It took {pack_end - pack_start} seconds")
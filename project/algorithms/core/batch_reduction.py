@@ -0,0 +1,264 @@
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from project.algorithms.core import scoring
+from project.algorithms.core.note_array import NoteArray
+from project.algorithms.core.note_segment import NoteSegment
+from project.algorithms.core.signature_timeline import SignatureTimeline
+
+
+class BatchReduction:
+
+    def __init__(self, notes: NoteArray, offsets: np.ndarray, segment_indices: np.ndarray, levels: np.ndarray,
+                 weights: np.ndarray):
+        """
+        Every reduction (see ``NoteSegment.reduce_segment``) of every segment of a track, stored as a ragged array:
+        the notes of every reduction are held in one NoteArray, and each *row* (a segment at some level of reduction)
+        is a range of it, ``notes[offsets[row]:offsets[row + 1]]``. Level 0 holds the original segments, and level
+        ``i`` holds the reductions of the segments of level ``i - 1`` which had more than one note. The rows are in
+        order of level, then segment.
+
+        Use ``BatchReduction.from_segments`` to reduce a list of segments.
+
+        Args:
+            notes: The notes of every row
+            offsets: The index in ``notes`` of the first note of each row (with one extra element, the number of notes)
+            segment_indices: The index of the original segment each row is a reduction of
+            levels: The level of reduction of each row
+            weights: The weight of each row: the weight ``reduce_segment`` gave the reduction from the previous level
+                of the same segment (0 for the original segments)
+        """
+        self.notes = notes
+        self.offsets = offsets
+        self.segment_indices = segment_indices
+        self.levels = levels
+        self.weights = weights
+
+    @staticmethod
+    def from_segments(segments: Sequence[NoteSegment]) -> "BatchReduction":
+        """
+        Repeatedly reduce each segment until it has at most one note, giving the same reductions (and weights) as
+        calling ``reduce_segment`` on each segment in turn. Rather than reducing one segment at a time, every segment
+        still being reduced is reduced at once, level by level: the sliding window of each segment moves along in
+        step with all the others, so the work done in Python depends on the number of windows in the longest
+        segment rather than the total number of windows.
+
+        Args:
+            segments: The segments to reduce. They must all be from the same track of the same MIDI file
+
+        Returns:
+            A BatchReduction containing the segments and all their reductions
+        """
+        if len(segments) == 0:
+            return BatchReduction(NoteArray.empty(), np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int64),
+                                  np.empty(0, dtype=np.int64), np.empty(0))
+
+        ticks_per_beat = segments[0].ticks_per_beat
+        signatures = segments[0].signatures
+
+        level_notes = [NoteArray.concatenate([segment.notes for segment in segments])]
+        level_offsets = [np.cumsum([0] + [len(segment.notes) for segment in segments], dtype=np.int64)]
+        level_segments = [np.arange(len(segments), dtype=np.int64)]
+        level_weights = [np.zeros(len(segments))]
+        while True:
+            notes, offsets, segment_indices = level_notes[-1], level_offsets[-1], level_segments[-1]
+            # only segments with more than one note are reduced any further
+            counts = np.diff(offsets)
+            reducible = np.flatnonzero(counts > 1)
+            if len(reducible) == 0:
+                break
+            reducible_notes = notes[np.repeat(counts > 1, counts)]
+            reducible_offsets = np.cumsum(np.concatenate(([0], counts[reducible])), dtype=np.int64)
+
+            reduced_notes, reduced_offsets, weights = BatchReduction.__reduce_level(
+                reducible_notes, reducible_offsets, ticks_per_beat, signatures)
+            level_notes.append(reduced_notes)
+            level_offsets.append(reduced_offsets)
+            level_segments.append(segment_indices[reducible])
+            level_weights.append(weights)
+
+        # join the levels together, moving the offsets of each level past the notes of the levels before it
+        level_starts = np.cumsum([0] + [len(notes) for notes in level_notes])
+        offsets = np.concatenate([level_offsets[level][:-1] + level_starts[level] for level in range(len(level_notes))]
+                                 + [level_starts[-1:]])
+        return BatchReduction(NoteArray.concatenate(level_notes), offsets.astype(np.int64),
+                              np.concatenate(level_segments),
+                              np.concatenate([np.full(len(segment_indices), level, dtype=np.int64)
+                                              for level, segment_indices in enumerate(level_segments)]),
+                              np.concatenate(level_weights))
+
+    @staticmethod
+    def __reduce_level(notes: NoteArray, offsets: np.ndarray, ticks_per_beat: int,
+                       signatures: SignatureTimeline) -> Tuple[NoteArray, np.ndarray, np.ndarray]:
+        """
+        Reduce several segments (each with at least 2 notes) once, as ``NoteSegment.reduce_segment`` would.
+
+        Args:
+            notes: The notes of every segment
+            offsets: The index in ``notes`` of the first note of each segment, followed by the number of notes
+            ticks_per_beat: The ticks_per_beat of the MIDI file the segments are from
+            signatures: The time and key signatures of the track the segments are from
+
+        Returns:
+            A (notes, offsets, weights) tuple: the notes of every reduced segment, the offsets of each reduced segment
+            within them, and the weight of each reduction
+        """
+        num_segments = len(offsets) - 1
+        counts = np.diff(offsets)
+        note_segments = np.repeat(np.arange(num_segments), counts)
+        start_times = notes.start_times
+        end_times = notes.end_times
+        beats, consonances, functionals = scoring.score_notes(start_times, notes.pitches, notes.chord_roots,
+                                                              ticks_per_beat, signatures)
+
+        # the notes of each segment in order of onset (keeping notes with the same onset in their original order). The
+        # onsets are moved so the onsets of each segment lie in a separate band, which the windows of the segment are
+        # clipped to, so the notes within the window of every segment can be found with one binary search
+        onset_order = np.lexsort((start_times, note_segments))
+        in_order = bool(np.all(onset_order == np.arange(len(onset_order))))
+        segment_firsts = np.minimum.reduceat(start_times, offsets[:-1])
+        segment_lasts = np.maximum.reduceat(start_times, offsets[:-1]) + 1
+        band_sizes = segment_lasts - segment_firsts + 1
+        band_shifts = np.concatenate(([0], np.cumsum(band_sizes)[:-1])) - segment_firsts
+        shifted_onsets = start_times[onset_order] + band_shifts[note_segments]
+
+        window_sizes = np.minimum.reduceat(notes.durations, offsets[:-1]) * 2
+        positions = start_times[offsets[:-1]].astype(np.result_type(start_times, end_times))
+        segment_ends = end_times[offsets[1:] - 1]
+        weights = np.zeros(num_segments)
+        # the segment, start, end and chosen note of each reduced note, in the order they were created
+        new_segments: List[np.ndarray] = []
+        new_starts: List[np.ndarray] = []
+        new_ends: List[np.ndarray] = []
+        new_sources: List[np.ndarray] = []
+
+        active = np.flatnonzero(positions < segment_ends)
+        while len(active) > 0:
+            range_starts = positions[active] if np.issubdtype(positions.dtype, np.integer) else \
+                np.trunc(positions[active])
+            range_ends = range_starts + window_sizes[active]
+            first = np.searchsorted(shifted_onsets, np.clip(range_starts, segment_firsts[active], segment_lasts[active])
+                                    + band_shifts[active], side="left")
+            last = np.searchsorted(shifted_onsets, np.clip(range_ends, segment_firsts[active], segment_lasts[active])
+                                   + band_shifts[active], side="left")
+            window_counts = last - first
+
+            # no notes: move on to the next window
+            empty = active[window_counts == 0]
+            positions[empty] += window_sizes[empty]
+
+            # one note: extend it to cover the window (if it doesn't already)
+            single = window_counts == 1
+            single_segments = active[single]
+            if len(single_segments) > 0:
+                sources = onset_order[first[single]]
+                window_ends = positions[single_segments] + window_sizes[single_segments]
+                ends = np.where(end_times[sources] > window_ends, end_times[sources], window_ends)
+                new_segments.append(single_segments)
+                new_starts.append(positions[single_segments].copy())
+                new_ends.append(ends)
+                new_sources.append(sources)
+                positions[single_segments] += ends - positions[single_segments]
+
+            # several notes: keep the most relevant one
+            multiple = window_counts > 1
+            multiple_segments = active[multiple]
+            if len(multiple_segments) > 0:
+                sizes = window_counts[multiple]
+                window_firsts = np.cumsum(sizes) - sizes
+                window_ids = np.repeat(np.arange(len(sizes)), sizes)
+                members = onset_order[np.repeat(first[multiple], sizes) + np.arange(sizes.sum()) -
+                                      np.repeat(window_firsts, sizes)]
+                if not in_order:
+                    # the notes of each window in their original order
+                    members = members[np.lexsort((members, window_ids))]
+
+                # determine the index of the note with the strongest weight, exactly as reduce_segment does: in case
+                # of a tie, first consider the one on the stronger beat, then the one with the stronger note
+                # consonance. If they are still tied, just keep the earlier note
+                strongest_index = np.zeros(len(sizes), dtype=np.int64)
+                strongest_total = np.zeros(len(sizes))
+                strongest_beat = np.zeros(len(sizes))
+                strongest_consonance = np.zeros(len(sizes))
+                strongest_functional = np.zeros(len(sizes))
+                prev_strongest_total = np.zeros(len(sizes))
+                for index in range(int(sizes.max())):
+                    valid = index < sizes
+                    member = members[window_firsts + np.minimum(index, sizes - 1)]
+                    beat, consonance, functional = beats[member], consonances[member], functionals[member]
+                    total = beat + consonance + functional
+                    stronger = valid & (total > strongest_total)
+                    tied = valid & ~stronger & (beat + consonance == strongest_total)
+                    tie_functional = tied & (functional > strongest_functional)
+                    tie_consonance = tied & ~tie_functional & (consonance > strongest_consonance)
+                    tie_beat = tied & ~tie_functional & ~tie_consonance & (beat > strongest_beat)
+                    update = stronger | tie_functional | tie_consonance | tie_beat
+
+                    prev_strongest_total = np.where(stronger, strongest_total, prev_strongest_total)
+                    strongest_total = np.where(stronger, total, strongest_total)
+                    strongest_index = np.where(update, index, strongest_index)
+                    strongest_beat = np.where(update, beat, strongest_beat)
+                    strongest_consonance = np.where(update, consonance, strongest_consonance)
+                    strongest_functional = np.where(update, functional, strongest_functional)
+
+                ends = end_times[members[window_firsts + sizes - 1]]
+                new_segments.append(multiple_segments)
+                new_starts.append(positions[multiple_segments].copy())
+                new_ends.append(ends)
+                new_sources.append(members[window_firsts + strongest_index])
+                positions[multiple_segments] += ends - positions[multiple_segments]
+                weights[multiple_segments] += (strongest_total - prev_strongest_total) / 3
+
+            active = active[positions[active] < segment_ends[active]]
+
+        if len(new_segments) == 0:
+            return NoteArray.empty(), np.zeros(num_segments + 1, dtype=np.int64), weights
+
+        # put the new notes in order of segment (each segment's notes were created in order)
+        segment_order = np.argsort(np.concatenate(new_segments), kind="stable")
+        sources = np.concatenate(new_sources)[segment_order]
+        reduced_notes = NoteArray(np.concatenate(new_starts)[segment_order], np.concatenate(new_ends)[segment_order],
+                                  notes.pitches[sources], notes.channels[sources], notes.chord_ids[sources],
+                                  notes.chords)
+        reduced_offsets = np.cumsum(np.concatenate(([0], np.bincount(np.concatenate(new_segments),
+                                                                      minlength=num_segments))), dtype=np.int64)
+        return reduced_notes, reduced_offsets, weights
+
+    @property
+    def num_levels(self) -> int:
+        """
+        Returns the number of levels in this reduction (including level 0, the original segments)
+
+        Returns:
+            The number of levels
+        """
+        return int(self.levels[-1]) + 1 if len(self.levels) > 0 else 0
+
+    def rows_at_level(self, level: int) -> np.ndarray:
+        """
+        Returns the rows at the given level of reduction
+
+        Args:
+            level: The level of reduction (0 for the original segments)
+
+        Returns:
+            An array containing the index of each row at that level, in order of segment
+        """
+        first, last = np.searchsorted(self.levels, [level, level + 1], side="left").tolist()
+        return np.arange(first, last)
+
+    def get_notes(self, row: int) -> NoteArray:
+        """
+        Returns the notes of a row (which share their memory with this BatchReduction)
+
+        Args:
+            row: The index of the row
+
+        Returns:
+            The notes of the segment (or reduction) in that row
+        """
+        return self.notes[self.offsets[row]:self.offsets[row + 1]]
+
+    def __len__(self) -> int:
+        return len(self.segment_indices)
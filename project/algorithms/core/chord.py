@@ -1,26 +1,39 @@
 from collections import defaultdict
-from typing import List
-
-import numpy as np
+from typing import List, Tuple
 
 import project.algorithms.core.constants as constants
+from project.algorithms.core.interning import Interned
 from enum import IntEnum, IntFlag
 
 
-class Chord:
+class Chord(metaclass=Interned):
+    __slots__ = ("root_tone", "norm_notes", "intern_id")
+
     def __init__(self, *notes: int):
         """
          Represents a *chord* i.e. a list of multiple notes playing at once. The root note is stored, as well as the
          normalized representation of the rest of the notes
 
          This class is needed to calculate the *functional* and *metrical* scores in reduction.
+
+         Chords are interned (see ``Interned``): creating a chord with the same notes as an existing chord returns the
+         existing chord, so chords must not be modified.
          Args:
              notes: a list of MIDI note values
          """
         if len(notes) == 0:
             raise ValueError("A chord must have at least one note")
-        self.root_tone = notes[0]
-        self.norm_notes = np.array(notes) - self.root_tone
+        self.root_tone = int(notes[0])
+        self.norm_notes = tuple(int(note) - self.root_tone for note in notes)
+
+    def intern_key(self) -> Tuple[int, ...]:
+        """
+        Returns the value identifying this chord when it is interned (see ``Interned``): its MIDI note values
+
+        Returns:
+            The MIDI note values of the chord, as a tuple
+        """
+        return (self.root_tone,) + self.norm_notes
 
     def to_midi_values(self) -> List[int]:
         """
@@ -29,39 +42,41 @@ class Chord:
         Returns:
             A list of MIDI values (as integers) corresponding to this chord's notes
         """
-        return list(self.norm_notes + self.root_tone)
+        return [self.root_tone + note for note in self.norm_notes]
 
-    def transpose(self, pitch_change: int):
+    def transpose(self, pitch_change: int) -> "Chord":
         """
         Move the note pitches up or down by a uniform amount.
 
         Args:
             pitch_change: The amount to increase or decrease the pitch of the chord by.
 
-
+        Returns:
+            The transposed chord. This chord is not modified.
         """
-        self.root_tone += pitch_change
-        if self.root_tone > constants.MAX_MIDI_VALUE:  # put root note back in bounds of MIDI notes
-            while self.root_tone > constants.MAX_MIDI_VALUE:
-                self.root_tone -= constants.OCTAVE_SEMITONE_COUNT
-        elif self.root_tone < constants.MIN_MIDI_VALUE:  # same as above but in reverse for notes < 0
-            while self.root_tone < constants.MIN_MIDI_VALUE:
-                self.root_tone += constants.OCTAVE_SEMITONE_COUNT
+        root_tone = self.root_tone + pitch_change
+        if root_tone > constants.MAX_MIDI_VALUE:  # put root note back in bounds of MIDI notes
+            while root_tone > constants.MAX_MIDI_VALUE:
+                root_tone -= constants.OCTAVE_SEMITONE_COUNT
+        elif root_tone < constants.MIN_MIDI_VALUE:  # same as above but in reverse for notes < 0
+            while root_tone < constants.MIN_MIDI_VALUE:
+                root_tone += constants.OCTAVE_SEMITONE_COUNT
 
         for note in self.norm_notes:  # check normalized notes as well
-            if self.root_tone + note > constants.MAX_MIDI_VALUE:
-                while self.root_tone + note > constants.MAX_MIDI_VALUE:
-                    self.root_tone -= constants.OCTAVE_SEMITONE_COUNT
+            if root_tone + note > constants.MAX_MIDI_VALUE:
+                while root_tone + note > constants.MAX_MIDI_VALUE:
+                    root_tone -= constants.OCTAVE_SEMITONE_COUNT
 
         for note in self.norm_notes:
-            if self.root_tone + note < constants.MIN_MIDI_VALUE:
-                while self.root_tone + note < constants.MIN_MIDI_VALUE:
-                    self.root_tone += constants.OCTAVE_SEMITONE_COUNT
+            if root_tone + note < constants.MIN_MIDI_VALUE:
+                while root_tone + note < constants.MIN_MIDI_VALUE:
+                    root_tone += constants.OCTAVE_SEMITONE_COUNT
 
         # assert constants.MIN_MIDI_VALUE <= self.root_tone <= constants.MAX_MIDI_VALUE
         # for note in self.norm_notes:
         #     assert constants.MIN_MIDI_VALUE <= self.root_tone + note <= constants.MAX_MIDI_VALUE, f"Expected a note \
         #     pitch between {constants.MIN_MIDI_VALUE } and {constants.MAX_MIDI_VALUE }, not {self.root_tone + note}"
+        return Chord(*[root_tone + note for note in self.norm_notes])
 
     def __str__(self) -> str:
         """
@@ -74,3 +89,7 @@ class Chord:
 
     def __repr__(self) -> str:
         return self.__str__()
+
+    def __reduce__(self):
+        # unpickle through the constructor, so unpickled chords are interned too
+        return Chord, tuple(self.to_midi_values())
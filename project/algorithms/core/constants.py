@@ -75,3 +75,8 @@ OCTAVE_SEMITONE_COUNT = 12
 MAX_MIDI_VALUE = 127
 MIN_MIDI_VALUE = 0
 TIME_FORMAT = "%Y%m%d_%H%M%S"
+# the environment variable naming the folder of the feature cache. features are only cached if it is set
+FEATURE_CACHE_DIR_VARIABLE = "MIDI_FEATURE_CACHE_DIR"
+FEATURE_CACHE_SIZE = 512 * 1024 * 1024  # bytes
+NOTE_STREAM_CHUNK_SIZE = 4096  # messages
+RECENT_SONG_FILES = 8  # MIDI files kept in memory after being read again by the song registry
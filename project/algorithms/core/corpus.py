@@ -0,0 +1,181 @@
+"""
+Packing a whole dataset of MIDI files into a single, memory-mapped *corpus* file, so the dataset can be opened without
+reading (or even opening) each MIDI file.
+"""
+import json
+import pathlib
+import struct
+import sys
+from typing import List, Iterator, Dict
+
+import numpy as np
+
+from project.algorithms.core.smf_reader import SmfFile, SmfTrack
+
+CORPUS_EXTENSION = ".corpus"
+CORPUS_MAGIC = b"MIDICORP"
+CORPUS_VERSION = 2
+# every column is aligned to this many bytes, so it can be viewed in place as an array of any dtype
+COLUMN_ALIGNMENT = 8
+
+# the columns of each SmfTrack, concatenated over every track in the corpus
+TRACK_COLUMNS = ["delta_ticks", "ticks", "statuses", "channels", "data1", "data2", "meta_types", "payload_offsets",
+                 "payload_lengths"]
+
+
+def is_corpus(path: str) -> bool:
+    """
+    Returns whether the file at ``path`` is a packed corpus (as created by ``pack_corpus``) rather than a MIDI file
+
+    Args:
+        path: The path of the file
+
+    Returns:
+        True if the path is a corpus file, False otherwise
+    """
+    return pathlib.Path(path).suffix == CORPUS_EXTENSION
+
+
+def pack_corpus(midi_paths: List[str], corpus_path: str) -> int:
+    """
+    Read each MIDI file in ``midi_paths`` and write them all to one corpus file at ``corpus_path``. The events of
+    every track (see ``SmfTrack``) are concatenated into one array per column, with a header recording the song name
+    and metadata of each file and where each of its tracks starts and ends within the columns.
+
+    Files which can't be read are skipped (and reported on stderr). Songs are identified by name (their filename,
+    without the directory or file extension) elsewhere, e.g. in rankings, so a file with the same name as a file
+    already in the corpus is also skipped.
+
+    Args:
+        midi_paths: The paths of the MIDI files to pack
+        corpus_path: Where to write the corpus file
+
+    Returns:
+        The number of MIDI files packed into the corpus
+    """
+    songs = []
+    tracks: List[SmfTrack] = []
+    song_paths: Dict[str, str] = {}
+    for midi_path in midi_paths:
+        name = pathlib.Path(midi_path).stem
+        if name in song_paths:
+            sys.stderr.write(f"Error for Midi File @ {midi_path}: a file with the same name ({song_paths[name]}) is "
+                             f"already in the corpus, so it won't be added to the corpus.\n")
+            sys.stderr.flush()
+            continue
+        try:
+            mid = SmfFile(midi_path)
+        except (OSError, EOFError, IndexError, KeyError, struct.error) as error:
+            sys.stderr.write(f"Error for Midi File @ {midi_path}: it could not be read ({error}), so it won't be "
+                             f"added to the corpus.\n")
+            sys.stderr.flush()
+            continue
+        songs.append({"filename": str(midi_path), "type": mid.type, "ticks_per_beat": mid.ticks_per_beat,
+                      "content_hash": mid.content_hash, "first_track": len(tracks), "num_tracks": len(mid.tracks)})
+        song_paths[name] = str(midi_path)
+        tracks.extend(mid.tracks)
+
+    columns: Dict[str, np.ndarray] = {}
+    for column in TRACK_COLUMNS:
+        columns[column] = np.concatenate([getattr(track, column) for track in tracks]) if len(tracks) > 0 \
+            else np.empty(0, dtype=np.int64)
+    columns["payload"] = np.frombuffer(b"".join(bytes(track.payload) for track in tracks), dtype=np.uint8)
+    # where the events (and payload) of each track start within the columns
+    columns["track_event_offsets"] = np.cumsum([0] + [len(track) for track in tracks], dtype=np.int64)
+    columns["track_payload_offsets"] = np.cumsum([0] + [len(track.payload) for track in tracks], dtype=np.int64)
+
+    # lay out the columns one after the other (after the header)
+    column_specs = {}
+    offset = 0
+    for name, array in columns.items():
+        column_specs[name] = {"dtype": array.dtype.str, "offset": offset, "length": len(array)}
+        offset += -(-array.nbytes // COLUMN_ALIGNMENT) * COLUMN_ALIGNMENT
+
+    header = json.dumps({"version": CORPUS_VERSION, "songs": songs, "columns": column_specs}).encode("utf-8")
+    header += b" " * (-len(header) % COLUMN_ALIGNMENT)
+
+    pathlib.Path(corpus_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(corpus_path, "wb") as file:
+        file.write(CORPUS_MAGIC)
+        file.write(struct.pack("<Q", len(header)))
+        file.write(header)
+        for array in columns.values():
+            file.write(array.tobytes())
+            file.write(b"\0" * (-array.nbytes % COLUMN_ALIGNMENT))
+
+    return len(songs)
+
+
+class Corpus:
+
+    def __init__(self, corpus_path: str):
+        """
+        A corpus of MIDI files packed into one file by ``pack_corpus``. The file is memory-mapped, and each song is
+        returned as an ``SmfFile`` whose tracks are *views* of the mapped columns, so no MIDI file is parsed (and only
+        the parts of the corpus that are used are actually read from disk).
+
+        Args:
+            corpus_path: The path of the corpus file
+        """
+        self.corpus_path = corpus_path
+        with open(corpus_path, "rb") as file:
+            if file.read(len(CORPUS_MAGIC)) != CORPUS_MAGIC:
+                raise OSError(f"{corpus_path} is not a corpus file")
+            header_length = struct.unpack("<Q", file.read(8))[0]
+            header = json.loads(file.read(header_length).decode("utf-8"))
+
+        if header["version"] != CORPUS_VERSION:
+            raise OSError(f"{corpus_path} has version {header['version']}, but version {CORPUS_VERSION} is expected")
+
+        self.songs = header["songs"]
+        # the filename of each song, without the directory or file extension
+        self.names = [pathlib.Path(song["filename"]).stem for song in self.songs]
+        data_start = len(CORPUS_MAGIC) + 8 + header_length
+        buffer = np.memmap(corpus_path, dtype=np.uint8, mode="r", offset=data_start)
+        self.columns: Dict[str, np.ndarray] = {}
+        for name, spec in header["columns"].items():
+            dtype = np.dtype(spec["dtype"])
+            self.columns[name] = buffer[spec["offset"]:spec["offset"] + spec["length"] * dtype.itemsize].view(dtype)
+        self.__song_indices = {name: i for i, name in enumerate(self.names)}
+
+    def get_track(self, index: int) -> SmfTrack:
+        """
+        Return the track at ``index`` (counting the tracks of every song in the corpus)
+
+        Args:
+            index: The index of the track within the corpus
+
+        Returns:
+            The track, as views of the corpus' columns
+        """
+        event_start, event_end = self.columns["track_event_offsets"][index:index + 2].tolist()
+        payload_start, payload_end = self.columns["track_payload_offsets"][index:index + 2].tolist()
+        events = {column: self.columns[column][event_start:event_end] for column in TRACK_COLUMNS}
+        return SmfTrack(events["delta_ticks"], events["statuses"], events["channels"], events["data1"],
+                        events["data2"], events["meta_types"], self.columns["payload"][payload_start:payload_end],
+                        events["payload_offsets"], events["payload_lengths"], events["ticks"])
+
+    def get_song(self, name: str) -> SmfFile:
+        """
+        Return the song with the given name
+
+        Args:
+            name: The name of the song (its filename, without the directory or file extension)
+
+        Returns:
+            The MIDI file of the song
+        """
+        return self[self.__song_indices[name]]
+
+    def __len__(self) -> int:
+        return len(self.songs)
+
+    def __getitem__(self, index: int) -> SmfFile:
+        song = self.songs[index]
+        tracks = [self.get_track(song["first_track"] + i) for i in range(song["num_tracks"])]
+        return SmfFile(song["filename"], song["type"], song["ticks_per_beat"], tracks, song["content_hash"],
+                       corpus_path=str(pathlib.Path(self.corpus_path).resolve()), corpus_index=index)
+
+    def __iter__(self) -> Iterator[SmfFile]:
+        for i in range(len(self)):
+            yield self[i]
@@ -0,0 +1,449 @@
+"""
+An on-disk cache of the features derived from MIDI files (note timelines, signatures, tempo changes etc.), so they're
+only computed once for each file, rather than once for every experiment that uses it.
+
+The cache is off unless a folder is given for it, either with the environment variable named by
+``constants.FEATURE_CACHE_DIR_VARIABLE`` or with the ``--cache_dir`` option of the scripts (see
+``configure_feature_cache``).
+"""
+import hashlib
+import json
+import os
+import pathlib
+import sys
+import weakref
+import zipfile
+from collections import OrderedDict, deque
+from typing import Dict, Optional, Tuple, List, Deque, Union, Callable
+
+import numpy as np
+from mido import MidiFile, Message
+
+from project.algorithms.core import constants
+from project.algorithms.core.chord import Chord
+from project.algorithms.core.midtools import get_note_timeline, get_track_signatures, get_track_tempo_changes, \
+    get_track_non_note_messages, get_track_non_note_indices
+from project.algorithms.core.note_array import NoteArray
+from project.algorithms.core.signature_timeline import SignatureTimeline
+from project.algorithms.core.smf_reader import SmfFile, SmfTrack
+from project.algorithms.core.tempo_map import TempoMap
+from project.algorithms.core.track_profile import TrackProfile
+from project.algorithms.graph_based import lbdm
+from project.algorithms.graph_based.signature import TimeSignature, KeySignature
+
+# increase this whenever the way a feature is computed (or stored) changes, so old cache entries are ignored
+FEATURE_CACHE_VERSION = 1
+FEATURE_CACHE_EXTENSION = ".npz"
+
+Features = Dict[str, np.ndarray]
+
+
+class FeatureCache:
+
+    def __init__(self, cache_dir: str, max_size: int, max_memory_entries: int = 64):
+        """
+        A cache of features derived from MIDI files. Each entry is a set of named numpy arrays, stored as an
+        (uncompressed) .npz file named after a hash of the entry's key. Keys are built (with ``FeatureCache.key``) from
+        the hash of the MIDI file's contents, the track the feature is from, and any parameters used to compute it,
+        so an entry is reused whenever the same feature of the same file is needed again, even if the file is moved
+        or renamed.
+
+        The cache is bounded in size: when it grows larger than ``max_size`` bytes the least recently used entries are
+        removed. The most recently used entries are also kept in memory, as the same feature is often needed several
+        times in a row (e.g. the signatures of a track, once for each segment of it).
+
+        Args:
+            cache_dir: The folder to store the cache in. It is created if it doesn't exist
+            max_size: The maximum total size of the cache on disk, in bytes
+            max_memory_entries: The number of entries to also keep in memory
+        """
+        self.cache_dir = pathlib.Path(cache_dir)
+        self.max_size = max_size
+        self.max_memory_entries = max_memory_entries
+        self.__memory_entries: Dict[str, Features] = OrderedDict()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.__size = sum(path.stat().st_size for path in self.cache_dir.glob(f"*{FEATURE_CACHE_EXTENSION}"))
+
+    @staticmethod
+    def key(content_hash: str, track_index: int, feature: str, **params) -> str:
+        """
+        Create the key of a feature of a track.
+
+        Args:
+            content_hash: The hash of the contents of the MIDI file the track is from
+            track_index: The index of the track in the MIDI file
+            feature: The name of the feature
+            **params: Any parameters used to compute the feature
+
+        Returns:
+            A string uniquely identifying the feature
+        """
+        key_data = json.dumps([FEATURE_CACHE_VERSION, content_hash, track_index, feature, params], sort_keys=True)
+        return hashlib.sha1(key_data.encode("utf-8")).hexdigest()
+
+    def __path(self, key: str) -> pathlib.Path:
+        return self.cache_dir / f"{key}{FEATURE_CACHE_EXTENSION}"
+
+    def get(self, key: str) -> Optional[Features]:
+        """
+        Get the entry with the given key, if it is in the cache. The returned arrays are read-only, as they may be
+        shared with other users of the cache.
+
+        Args:
+            key: The key of the entry
+
+        Returns:
+            None if the entry isn't cached, otherwise the named arrays of the entry
+        """
+        if key in self.__memory_entries:
+            self.__memory_entries.move_to_end(key)
+            return self.__memory_entries[key]
+
+        path = self.__path(key)
+        try:
+            with np.load(path, allow_pickle=False) as entry_file:
+                entry = {name: entry_file[name] for name in entry_file.files}
+            # mark the entry as recently used (so it is evicted last)
+            os.utime(path)
+        except (OSError, ValueError, zipfile.BadZipFile):
+            # not cached (or evicted by another process while it was being read)
+            return None
+
+        self.__remember(key, entry)
+        return entry
+
+    def put(self, key: str, entry: Features):
+        """
+        Add an entry to the cache, evicting the least recently used entries if the cache is then too large.
+
+        Args:
+            key: The key of the entry
+            entry: The named arrays to store
+        """
+        path = self.__path(key)
+        # write to a temporary file first, so other processes never see a partially written entry
+        temp_path = path.with_name(f"{key}.{os.getpid()}.tmp")
+        try:
+            with open(temp_path, "wb") as file:
+                np.savez(file, **entry)
+            # the entry may already have been written (e.g. by another process), in which case it's replaced
+            try:
+                replaced_size = path.stat().st_size
+            except OSError:
+                replaced_size = 0
+            os.replace(temp_path, path)
+            self.__size += path.stat().st_size - replaced_size
+        except OSError as error:
+            sys.stderr.write(f"Warning: could not write to the feature cache at {self.cache_dir} ({error})\n")
+            sys.stderr.flush()
+            return
+
+        self.__remember(key, entry)
+        if self.__size > self.max_size:
+            self.__evict()
+
+    def __remember(self, key: str, entry: Features):
+        """
+        Keep an entry in memory, forgetting the least recently used entry if there are too many.
+
+        Args:
+            key: The key of the entry
+            entry: The named arrays of the entry
+        """
+        for array in entry.values():
+            array.flags.writeable = False
+        self.__memory_entries[key] = entry
+        self.__memory_entries.move_to_end(key)
+        while len(self.__memory_entries) > self.max_memory_entries:
+            self.__memory_entries.popitem(last=False)
+
+    def __evict(self):
+        """
+        Remove the least recently used entries from disk until the cache is at most 90% of its maximum size (so the
+        cache isn't evicting on every write).
+        """
+        entries = []
+        for path in self.cache_dir.glob(f"*{FEATURE_CACHE_EXTENSION}"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        self.__size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self.__size <= self.max_size * 0.9:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                pass  # already removed by another process
+            self.__size -= size
+
+
+# the cache used by the get_cached_* functions. it's created when first needed (see get_feature_cache)
+_feature_cache: Optional[FeatureCache] = None
+_feature_cache_enabled = True
+# the SignatureTimeline of each track of each MIDI file still in use (see get_cached_signature_timeline)
+_signature_timelines: "weakref.WeakKeyDictionary[Union[MidiFile, SmfFile], Dict[int, SignatureTimeline]]" = \
+    weakref.WeakKeyDictionary()
+
+
+def get_feature_cache() -> Optional[FeatureCache]:
+    """
+    Return the feature cache used by the ``get_cached_*`` functions. By default, this is a cache of at most
+    ``constants.FEATURE_CACHE_SIZE`` bytes in the folder named by the environment variable
+    ``constants.FEATURE_CACHE_DIR_VARIABLE``, if it is set.
+
+    Returns:
+        The feature cache, or None if caching is disabled
+    """
+    global _feature_cache
+    cache_dir = os.environ.get(constants.FEATURE_CACHE_DIR_VARIABLE)
+    if _feature_cache is None and _feature_cache_enabled and cache_dir:
+        _feature_cache = FeatureCache(cache_dir, constants.FEATURE_CACHE_SIZE)
+    return _feature_cache
+
+
+def set_feature_cache(cache: Optional[FeatureCache]):
+    """
+    Change the feature cache used by the ``get_cached_*`` functions.
+
+    Args:
+        cache: The cache to use. If None, features are no longer cached.
+    """
+    global _feature_cache, _feature_cache_enabled
+    _feature_cache = cache
+    _feature_cache_enabled = cache is not None
+
+
+def configure_feature_cache(cache_dir: Optional[str], enabled: bool = True):
+    """
+    Configure the feature cache from the command line options of a script. The folder is passed on through the
+    environment variable ``constants.FEATURE_CACHE_DIR_VARIABLE``, so any worker processes use the same cache.
+
+    Args:
+        cache_dir: The folder to cache features in. If None, the folder in the environment variable is used (if set)
+        enabled: If False, features aren't cached, even if the environment variable is set
+    """
+    global _feature_cache, _feature_cache_enabled
+    if not enabled:
+        os.environ.pop(constants.FEATURE_CACHE_DIR_VARIABLE, None)
+    elif cache_dir is not None:
+        os.environ[constants.FEATURE_CACHE_DIR_VARIABLE] = cache_dir
+    _feature_cache = None
+    _feature_cache_enabled = enabled
+
+
+def __get_cached_feature(mid: Union[MidiFile, SmfFile], track_index: int, feature: str,
+                         compute: Callable[[], Features], **params) -> Features:
+    """
+    Get a feature of a track from the feature cache, computing (and caching) it if it isn't cached. Only files read
+    with ``SmfFile`` (which records the hash of the file's contents) are cached.
+
+    Args:
+        mid: The MIDI file containing the track
+        track_index: The index of the track
+        feature: The name of the feature
+        compute: A function computing the (named arrays of the) feature
+        **params: Any parameters used to compute the feature
+
+    Returns:
+        The named arrays of the feature
+    """
+    cache = get_feature_cache()
+    content_hash = mid.content_hash if isinstance(mid, SmfFile) else None
+    if cache is None or content_hash is None:
+        return compute()
+
+    key = FeatureCache.key(content_hash, track_index, feature, **params)
+    entry = cache.get(key)
+    if entry is None:
+        entry = compute()
+        cache.put(key, entry)
+    return entry
+
+
+def get_cached_note_timeline(mid: Union[MidiFile, SmfFile], track_index: int,
+                             chord_track_index: Optional[int] = None) -> NoteArray:
+    """
+    Returns the note timeline of a track, as ``midtools.get_note_timeline`` would, using the feature cache.
+
+    Args:
+        mid: The MIDI file containing the track
+        track_index: The index of the track
+        chord_track_index: The index of the track containing the chords of the MIDI file, if it exists
+
+    Returns:
+        A NoteArray containing the notes derived from the messages in the MIDI track
+    """
+    def compute() -> Features:
+        chord_track = mid.tracks[chord_track_index] if chord_track_index is not None else None
+        notes = get_note_timeline(mid.tracks[track_index], chord_track)
+        chord_notes = [chord.to_midi_values() for chord in notes.chords]
+        return {
+            "start_times": notes.start_times, "end_times": notes.end_times, "pitches": notes.pitches,
+            "channels": notes.channels, "chord_ids": notes.chord_ids,
+            "start_message_indices": notes.start_message_indices, "end_message_indices": notes.end_message_indices,
+            "chord_notes": np.array([note for chord in chord_notes for note in chord], dtype=np.int64),
+            "chord_offsets": np.cumsum([0] + [len(chord) for chord in chord_notes], dtype=np.int64)
+        }
+
+    entry = __get_cached_feature(mid, track_index, "note_timeline", compute, chord_track_index=chord_track_index)
+    chord_notes = entry["chord_notes"].tolist()
+    chord_offsets = entry["chord_offsets"].tolist()
+    chords = [Chord(*chord_notes[chord_offsets[i]:chord_offsets[i + 1]]) for i in range(len(chord_offsets) - 1)]
+    return NoteArray(entry["start_times"], entry["end_times"], entry["pitches"], entry["channels"],
+                     entry["chord_ids"], chords, entry["start_message_indices"], entry["end_message_indices"])
+
+
+def get_cached_track_signatures(mid: Union[MidiFile, SmfFile], track_index: int) \
+        -> Tuple[List[Tuple[int, TimeSignature]], List[Tuple[int, KeySignature]]]:
+    """
+    Returns the time and key signatures of a track, as ``midtools.get_track_signatures`` would, using the feature
+    cache.
+
+    Args:
+        mid: The MIDI file containing the track
+        track_index: The index of the track
+
+    Returns:
+        A Tuple of lists containing pairs of (time, signature) for both time and key signatures.
+    """
+    def compute() -> Features:
+        time_signatures, key_signatures = get_track_signatures(mid.tracks[track_index])
+        return {
+            "time_signature_ticks": np.array([time for time, _ in time_signatures], dtype=np.int64),
+            "numerators": np.array([signature.numerator for _, signature in time_signatures], dtype=np.int64),
+            "denominators": np.array([signature.denominator for _, signature in time_signatures], dtype=np.int64),
+            "key_signature_ticks": np.array([time for time, _ in key_signatures], dtype=np.int64),
+            "key_notes": np.array([signature.note for _, signature in key_signatures], dtype=np.int64),
+            "key_minors": np.array([signature.minor for _, signature in key_signatures], dtype=bool)
+        }
+
+    entry = __get_cached_feature(mid, track_index, "signatures", compute)
+    time_signatures = [(time, TimeSignature(numerator, denominator)) for time, numerator, denominator in
+                       zip(entry["time_signature_ticks"].tolist(), entry["numerators"].tolist(),
+                           entry["denominators"].tolist())]
+    key_signatures = [(time, KeySignature(constants.TWELVE_NOTE_SCALE_SHARP[note], minor)) for time, note, minor in
+                      zip(entry["key_signature_ticks"].tolist(), entry["key_notes"].tolist(),
+                          entry["key_minors"].tolist())]
+    return time_signatures, key_signatures
+
+
+def get_cached_signature_timeline(mid: Union[MidiFile, SmfFile], track_index: int) -> SignatureTimeline:
+    """
+    Returns the SignatureTimeline of a track. The timeline of each track is only built once for each MIDI file object
+    (from ``get_cached_track_signatures``), and the same timeline is returned every time after that, so it can be
+    shared between all the segments of the file. It is forgotten when the file is no longer used.
+
+    Args:
+        mid: The MIDI file containing the track
+        track_index: The index of the track
+
+    Returns:
+        The SignatureTimeline of the track
+    """
+    timelines = _signature_timelines.setdefault(mid, {})
+    if track_index not in timelines:
+        timelines[track_index] = SignatureTimeline(*get_cached_track_signatures(mid, track_index))
+    return timelines[track_index]
+
+
+def get_cached_tempo_map(mid: Union[MidiFile, SmfFile], track_index: int) -> TempoMap:
+    """
+    Returns the TempoMap of a track, as ``midtools.get_track_tempo_map`` would, using the feature cache for the
+    tempo changes of the track.
+
+    Args:
+        mid: The MIDI file containing the track
+        track_index: The index of the track
+
+    Returns:
+        The TempoMap of the track
+    """
+    track = mid.tracks[track_index]
+
+    def compute() -> Features:
+        tempo_changes = get_track_tempo_changes(track)
+        return {
+            "ticks": np.array([time for time, _ in tempo_changes], dtype=np.int64),
+            "tempos": np.array([tempo for _, tempo in tempo_changes], dtype=np.int64)
+        }
+
+    entry = __get_cached_feature(mid, track_index, "tempo_changes", compute)
+    if isinstance(track, SmfTrack):
+        message_ticks = track.ticks
+    else:
+        message_ticks = np.cumsum(np.array([message.time for message in track], dtype=np.int64))
+    return TempoMap(mid.ticks_per_beat, list(zip(entry["ticks"].tolist(), entry["tempos"].tolist())), message_ticks)
+
+
+def get_cached_track_profile(mid: Union[MidiFile, SmfFile], track_index: int) -> TrackProfile:
+    """
+    Returns the TrackProfile of a track (see ``TrackProfile.from_track``), using the feature cache.
+
+    Args:
+        mid: The MIDI file containing the track
+        track_index: The index of the track
+
+    Returns:
+        The TrackProfile of the track
+    """
+    entry = __get_cached_feature(mid, track_index, "track_profile",
+                                 lambda: TrackProfile.from_track(mid.tracks[track_index], mid.ticks_per_beat)
+                                 .to_features())
+    return TrackProfile.from_features(entry)
+
+
+def get_cached_non_note_messages(mid: Union[MidiFile, SmfFile], track_index: int) -> Deque[Tuple[int, Message]]:
+    """
+    Returns the non-note messages of a track, as ``midtools.get_track_non_note_messages`` would, using the feature
+    cache for the positions of the messages within the track.
+
+    Args:
+        mid: The MIDI file containing the track
+        track_index: The index of the track
+
+    Returns:
+        A Deque containing messages relevant for saving a segment of the track as a MIDI file.
+    """
+    track = mid.tracks[track_index]
+    if not isinstance(track, SmfTrack):
+        return get_track_non_note_messages(track)
+
+    entry = __get_cached_feature(mid, track_index, "non_note_messages",
+                                 lambda: {"indices": get_track_non_note_indices(track)})
+    return deque((int(track.ticks[i]), track.to_message(i)) for i in entry["indices"].tolist())
+
+
+def get_cached_lbdm_profile(mid: Union[MidiFile, SmfFile], track_index: int, pitch_weight: float = 0.25,
+                            ioi_weight: float = 0.5, rest_weight: float = 0.25, max_pitch_difference: int = 12,
+                            max_time_difference: int = 4096) -> np.ndarray:
+    """
+    Returns the LBDM boundary strength profile of the notes of a track (see ``lbdm.lbdm``), using the feature cache.
+    The default degree of change function is always used.
+
+    Args:
+        mid: The MIDI file containing the track
+        track_index: The index of the track
+        pitch_weight: The relative importance of pitches in determining where boundaries are placed
+        ioi_weight: The relative importance of inter-onset intervals in determining where boundaries are placed
+        rest_weight: The relative importance of rests in determining where boundaries are placed
+        max_pitch_difference: The maximum value that a pitch interval can be
+        max_time_difference: The maximum value that a interonset/rest interval can be
+
+    Returns:
+        The boundary strength profile of the track
+    """
+    def compute() -> Features:
+        profile, _ = lbdm.lbdm(get_cached_note_timeline(mid, track_index), pitch_weight=pitch_weight,
+                               ioi_weight=ioi_weight, rest_weight=rest_weight,
+                               max_pitch_difference=max_pitch_difference, max_time_difference=max_time_difference)
+        return {"profile": profile}
+
+    return __get_cached_feature(mid, track_index, "lbdm_profile", compute, pitch_weight=pitch_weight,
+                                ioi_weight=ioi_weight, rest_weight=rest_weight,
+                                max_pitch_difference=max_pitch_difference,
+                                max_time_difference=max_time_difference)["profile"]
@@ -0,0 +1,64 @@
+from typing import Any, Dict, Hashable, List
+
+
+class Interned(type):
+
+    def __init__(cls, name, bases, namespace):
+        """
+        A metaclass for small immutable value types (chords, time and key signatures) which are shared between many
+        notes and segments. Creating an instance equal to one that already exists returns the existing instance, so
+        each distinct value is only stored once (and pickled once per pickle, as pickle keeps track of shared objects).
+
+        A class using this metaclass must define an ``intern_key`` method, returning a hashable value that is equal for
+        equal instances, and should have an ``intern_id`` slot: this is set to a small integer that uniquely identifies
+        the instance within its class (for the lifetime of the process), so it can be stored in integer arrays. Since
+        instances are shared they must never be modified; instead, methods that would change an instance should return
+        a new instance (e.g. ``Chord.transpose``). To preserve the sharing when unpickled, the class should also define
+        ``__reduce__`` so that unpickling calls the class again.
+
+        If ``intern_key`` returns None, the instance isn't interned (nor kept alive by the class): it is returned as
+        is, and its ``intern_id`` is None.
+        """
+        super().__init__(name, bases, namespace)
+        cls._instances: List[Any] = []
+        cls._instance_ids: Dict[Hashable, int] = {}
+        # the instance returned for each set of arguments the class has been called with, so creating an instance
+        # that already exists is a single dictionary lookup
+        cls._instances_by_args: Dict[Hashable, Any] = {}
+
+    def __call__(cls, *args, **kwargs):
+        args_key = (args, tuple(sorted(kwargs.items())))
+        try:
+            return cls._instances_by_args[args_key]
+        except KeyError:
+            pass
+        except TypeError:
+            args_key = None  # unhashable arguments
+
+        instance = super().__call__(*args, **kwargs)
+        key = instance.intern_key()
+        if key is None:
+            instance.intern_id = None
+            return instance
+        instance_id = cls._instance_ids.get(key)
+        if instance_id is None:
+            instance.intern_id = instance_id = len(cls._instances)
+            cls._instance_ids[key] = instance_id
+            cls._instances.append(instance)
+
+        instance = cls._instances[instance_id]
+        if args_key is not None:
+            cls._instances_by_args[args_key] = instance
+        return instance
+
+    def from_intern_id(cls, intern_id: int) -> Any:
+        """
+        Return the instance of this class with the given ``intern_id``
+
+        Args:
+            intern_id: The id of the instance
+
+        Returns:
+            The (shared) instance with that id
+        """
+        return cls._instances[intern_id]
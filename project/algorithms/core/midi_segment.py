@@ -1,26 +1,42 @@
 import pathlib
 from abc import ABC, abstractmethod
 from collections import deque
-from typing import Deque, Tuple, Optional
+from typing import Deque, Tuple, Optional, Union
 
 from mido import MidiFile, MidiTrack, Message
 
-from project.algorithms.core.midtools import get_track_non_note_messages
+from project.algorithms.core.feature_cache import get_cached_non_note_messages
+from project.algorithms.core.smf_reader import SmfFile
+from project.algorithms.core.song_registry import Song, register_song, get_song_file
 
 
 class MidiSegment(ABC):
 
-    def __init__(self, file: MidiFile, melody_track_ind: int):
+    def __init__(self, file: Union[MidiFile, SmfFile, Song], melody_track_ind: int):
         """
         Represents a subsection of a MIDI file. This is an *abstract* class and must be inherited to be useful.
 
+        The segment only keeps the ``Song`` identifying its MIDI file (see ``song_registry``), so pickling a segment
+        doesn't pickle the whole file. The file itself is only needed (and read again, if it's no longer in memory)
+        to save the segment as MIDI.
+
         Args:
-            file: The MIDI file the segment comes from
+            file: The MIDI file the segment comes from (or its Song)
             melody_track_ind: The index of the track containing the *melody* line of the MIDI file.
         """
-        self._file = file  # source track
+        self.song = register_song(file)  # source file
         self.melody_track_ind = melody_track_ind
 
+    @property
+    def _file(self) -> Union[MidiFile, SmfFile]:
+        """
+        Returns the MIDI file this segment comes from, reading it again if it's no longer in memory
+
+        Returns:
+            The MIDI file this segment comes from
+        """
+        return get_song_file(self.song)
+
     @property
     def _melody_track(self) -> MidiTrack:
         """
@@ -42,7 +58,7 @@ class MidiSegment(ABC):
             The ticks_per_beat of the MIDI file
 
         """
-        return self._file.ticks_per_beat
+        return self.song.ticks_per_beat
 
     @property
     def filename(self) -> str:
@@ -52,7 +68,7 @@ class MidiSegment(ABC):
         Returns:
                 The filename of the MIDI file this segment is from
         """
-        return str(pathlib.Path(self._file.filename).stem)
+        return str(pathlib.Path(self.song.filename).stem)
 
     def _get_melody_non_note_messages(self) -> Deque[Tuple[int, Message]]:
         """
@@ -62,7 +78,7 @@ class MidiSegment(ABC):
         Returns:
             A Deque containing messages relevant for saving this segment as a MIDI file.
         """
-        return get_track_non_note_messages(self._melody_track)
+        return get_cached_non_note_messages(self._file, self.melody_track_ind)
 
     def get_file_metadata(self):
         """
@@ -72,12 +88,13 @@ class MidiSegment(ABC):
         Returns:
             a dictionary containing the MIDI file's metadata
         """
+        file = self._file
         return {
-            "type": self._file.type,
-            "ticks_per_beat": self._file.ticks_per_beat,
-            "charset": self._file.charset,
-            "debug": self._file.debug,
-            "clip": self._file.clip
+            "type": file.type,
+            "ticks_per_beat": file.ticks_per_beat,
+            "charset": file.charset,
+            "debug": file.debug,
+            "clip": file.clip
         }
 
     def save_as_midi(self, filepath):
@@ -1,20 +1,34 @@
 """
 Common operation on MIDI files and objects
 """
+import bisect
 import re
+import weakref
 
-import mido
+import numpy as np
 
-from typing import Dict, List, Tuple, Optional, Deque
+from typing import Dict, List, Tuple, Optional, Deque, Union, Iterator
 from collections import OrderedDict, deque
 
-from mido import MidiTrack, MidiFile, Message, bpm2tempo, tick2second, MetaMessage
+from mido import MidiTrack, MidiFile, Message, MetaMessage
 
 from project.algorithms.core import constants
 from project.algorithms.core.chord import Chord
 from project.algorithms.core.note import Note
+from project.algorithms.core.note_array import NoteArray
+from project.algorithms.core import smf_reader
+from project.algorithms.core.smf_reader import SmfTrack
+from project.algorithms.core.tempo_map import TempoMap
+from project.algorithms.core.track_profile import TrackProfile
 from project.algorithms.graph_based.signature import TimeSignature, KeySignature
 
+# chord timelines of each chord track parsed so far, keyed by the id of the track
+_chord_timeline_cache: Dict[int, List[Tuple[Chord, int, int]]] = {}
+
+# any function taking a track accepts either a mido MidiTrack, or a track read by smf_reader (which is much faster to
+# read, and to process, as the messages are stored as numpy arrays)
+Track = Union[MidiTrack, SmfTrack]
+
 
 def is_note_off(msg: Message) -> bool:
     """
@@ -42,6 +56,57 @@ def is_note_on(msg: Message) -> bool:
     return msg.type == "note_on" and msg.velocity > 0
 
 
+def get_note_on_indices(track: Track) -> np.ndarray:
+    """
+    Returns the index of every note_on message in the track (not including note_on messages with a velocity of 0)
+
+    Args:
+        track: The track to find the note_on messages of
+
+    Returns:
+        A numpy array containing the index within the track of each note_on message, in order
+    """
+    if isinstance(track, SmfTrack):
+        return np.flatnonzero(track.note_on_mask)
+    else:
+        return np.array([i for i, msg in enumerate(track) if is_note_on(msg)], dtype=np.int64)
+
+
+def get_message_notes(track: Track, indices: np.ndarray) -> np.ndarray:
+    """
+    Returns the note (i.e. the pitch) of the note_on/note_off messages at the given indices of the track
+
+    Args:
+        track: The track containing the messages
+        indices: The indices of the messages within the track. These must all be note_on or note_off messages
+
+    Returns:
+        A numpy array containing the note of each message
+    """
+    if isinstance(track, SmfTrack):
+        return track.data1[indices].astype(np.int64)
+    else:
+        return np.array([track[i].note for i in indices.tolist()], dtype=np.int64)
+
+
+def has_end_of_track(track: Track) -> bool:
+    """
+    Returns whether the last message of the track is an end_of_track message
+
+    Args:
+        track: The track to check
+
+    Returns:
+        True if the track ends with an end_of_track message, False otherwise
+    """
+    if len(track) == 0:
+        return False
+    elif isinstance(track, SmfTrack):
+        return bool(track.meta_types[-1] == smf_reader.END_OF_TRACK_META)
+    else:
+        return track[-1].type == "end_of_track"
+
+
 def get_note_tally(mid: MidiFile) -> Dict[int, int]:
     """Returns a dictionary containing the occurrence of each note in the MIDI file.
 
@@ -54,17 +119,12 @@ def get_note_tally(mid: MidiFile) -> Dict[int, int]:
         number of occurences of the particular MIDI note.
     """
 
-    note_dict = {}
-    for i in range(128):
-        note_dict[i] = 0
-
+    note_tally = np.zeros(constants.MAX_MIDI_VALUE + 1, dtype=np.int64)
     for track in mid.tracks:
-        for msg in track:
-            # TODO: change to handle note_on/note_off pairs
-            if msg.type == "note_on":
-                note_dict[msg.note] += 1
+        # TODO: change to handle note_on/note_off pairs
+        note_tally += TrackProfile.from_track(track, mid.ticks_per_beat).note_tally
 
-    return note_dict
+    return dict(enumerate(note_tally.tolist()))
 
 
 def get_type_tally(mid: MidiFile) -> Dict[str, int]:
@@ -80,67 +140,90 @@ def get_type_tally(mid: MidiFile) -> Dict[str, int]:
     type_dict = {}
 
     for track in mid.tracks:
-        for msg in track:
-            # TODO: change to handle note_on/note_off pairs
-            if msg.type in type_dict:
-                type_dict[msg.type] += 1
-            else:
-                type_dict[msg.type] = 1
+        for msg_type, count in TrackProfile.from_track(track, mid.ticks_per_beat).type_tally.items():
+            type_dict[msg_type] = type_dict.get(msg_type, 0) + count
     return type_dict
 
 
-def get_start_offset(track: MidiTrack, ticks_per_beat: int) -> Tuple[float, int]:
+def get_track_tempo_map(track: Track, ticks_per_beat: int) -> TempoMap:
+    """
+    Build the ``TempoMap`` of a MidiTrack, which converts between ticks and seconds for that track. The time of each
+    message in the track is also precomputed. This should be built once per track, then shared between anything that
+    needs to convert times within the track.
+
+    Args:
+        track: The track to build a TempoMap for
+        ticks_per_beat: The ticks per beat of the MIDI file the track is from
+
+    Returns:
+        The TempoMap of the track
+    """
+    if isinstance(track, SmfTrack):
+        message_ticks = track.ticks
+    else:
+        message_ticks = np.cumsum(np.array([message.time for message in track], dtype=np.int64))
+    return TempoMap(ticks_per_beat, get_track_tempo_changes(track), message_ticks)
+
+
+def get_start_offset(track: Track, ticks_per_beat: int,
+                     tempo_map: Optional[TempoMap] = None) -> Tuple[float, int]:
     """
     Get the time (in seconds) and the index of the start of the first note in this MIDI track.
 
     Args:
         track: The track to find the start offset from
         ticks_per_beat: The ticks per beat of the MIDI track.
+        tempo_map: The TempoMap of the track. If None, it is built from the track.
 
     Returns:
         the time (in seconds) and the index of the *start* of the first note in this MIDI track.
     """
-    start_offset = 0
-    tempo = bpm2tempo(120)
-    first_note_on_ind = 0
-    for i, message in enumerate(track):
-        start_offset += tick2second(message.time, ticks_per_beat, tempo)
-        if is_note_on(message):
-            first_note_on_ind = i
-            break
-        elif message.type == "set_tempo":
-            tempo = message.tempo
+    if tempo_map is None:
+        tempo_map = get_track_tempo_map(track, ticks_per_beat)
+
+    if isinstance(track, SmfTrack):
+        note_on_indices = np.flatnonzero(track.note_on_mask)
+        if len(note_on_indices) > 0:
+            return float(tempo_map.message_seconds[note_on_indices[0]]), int(note_on_indices[0])
+    else:
+        for i, message in enumerate(track):
+            if is_note_on(message):
+                return float(tempo_map.message_seconds[i]), i
 
-    return start_offset, first_note_on_ind
+    # no notes: the offset is the end of the track
+    return (float(tempo_map.message_seconds[-1]) if len(track) > 0 else 0), 0
 
 
-def get_end_offset(track: MidiTrack, ticks_per_beat: int) -> Tuple[float, int]:
+def get_end_offset(track: Track, ticks_per_beat: int,
+                   tempo_map: Optional[TempoMap] = None) -> Tuple[float, int]:
     """
     Get the time (in seconds) and the index of the *end* of the last note in this MIDI track.
 
     Args:
         track: The track to find the end offset from
         ticks_per_beat: The ticks per beat of the MIDI track.
+        tempo_map: The TempoMap of the track. If None, it is built from the track.
 
     Returns:
         the time (in seconds) and the index in the track of the end of the last note in this MIDI track.
     """
-    tempo = bpm2tempo(120)
-    end_offset = 0
-    last_note_off = 0
-    last_note_off_ind = 0
-    for i, message in enumerate(track):
-        end_offset += tick2second(message.time, ticks_per_beat, tempo)
-        if is_note_off(message):
-            last_note_off = end_offset
-            last_note_off_ind = i
-        elif message.type == "set_tempo":
-            tempo = message.tempo
+    if tempo_map is None:
+        tempo_map = get_track_tempo_map(track, ticks_per_beat)
+
+    if isinstance(track, SmfTrack):
+        note_off_indices = np.flatnonzero(track.note_off_mask)
+        if len(note_off_indices) > 0:
+            return float(tempo_map.message_seconds[note_off_indices[-1]]), int(note_off_indices[-1])
+    else:
+        # search backwards, as the last note off is usually close to the end of the track
+        for i in range(len(track) - 1, -1, -1):
+            if is_note_off(track[i]):
+                return float(tempo_map.message_seconds[i]), i
 
-    return last_note_off, last_note_off_ind
+    return 0, 0
 
 
-def get_chord_timeline(chord_track: MidiTrack) -> List[Tuple[Chord, int, int]]:
+def get_chord_timeline(chord_track: Track) -> List[Tuple[Chord, int, int]]:
     """
     Given a MidiTrack containing a list of chords, return a timeline of what chords were playing at what time. This
     is represented as a list of (chord, start_time, stop_time) tuples.
@@ -156,15 +239,26 @@ def get_chord_timeline(chord_track: MidiTrack) -> List[Tuple[Chord, int, int]]:
     # off_dict = defaultdict(list)
     curr_time = 0
     last_note_off_time = 0
-    for i in range(len(chord_track)):
-        curr_time += chord_track[i].time
-        if is_note_on(chord_track[i]):
-            if curr_time not in on_dict.keys():
-                on_dict[curr_time] = []
-            on_dict[curr_time].append(chord_track[i].note)
-        elif is_note_off(chord_track[i]):
-            last_note_off_time = curr_time
-            # off_dict[curr_time].append(chord_track[i].note)
+    if isinstance(chord_track, SmfTrack):
+        note_on_indices = np.flatnonzero(chord_track.note_on_mask)
+        for (time, note) in zip(chord_track.ticks[note_on_indices].tolist(),
+                                chord_track.data1[note_on_indices].tolist()):
+            if time not in on_dict.keys():
+                on_dict[time] = []
+            on_dict[time].append(note)
+        note_off_indices = np.flatnonzero(chord_track.note_off_mask)
+        if len(note_off_indices) > 0:
+            last_note_off_time = int(chord_track.ticks[note_off_indices[-1]])
+    else:
+        for i in range(len(chord_track)):
+            curr_time += chord_track[i].time
+            if is_note_on(chord_track[i]):
+                if curr_time not in on_dict.keys():
+                    on_dict[curr_time] = []
+                on_dict[curr_time].append(chord_track[i].note)
+            elif is_note_off(chord_track[i]):
+                last_note_off_time = curr_time
+                # off_dict[curr_time].append(chord_track[i].note)
 
     if len(on_dict) == 0:
         return []
@@ -181,9 +275,85 @@ def get_chord_timeline(chord_track: MidiTrack) -> List[Tuple[Chord, int, int]]:
     return chords
 
 
-def get_note_timeline(track: MidiTrack, chord_track: Optional[mido.MidiTrack] = None) -> List[Note]:
+def get_cached_chord_timeline(chord_track: Track) -> List[Tuple[Chord, int, int]]:
+    """
+    Returns the same timeline as ``get_chord_timeline``, but only parses each chord track once: the timeline is cached
+    for as long as the track itself exists. The chords in the timeline are shared between every note they're attached
+    to (like all chords, they're interned and never modified: see ``Chord.transpose``).
+
+    Args:
+        chord_track: The track containing the chords.
+
+    Returns:
+        A list of (chord, start_time, stop_time) tuples showing which chords were playing at what time
+    """
+    cache_key = id(chord_track)
+    if cache_key not in _chord_timeline_cache:
+        _chord_timeline_cache[cache_key] = get_chord_timeline(chord_track)
+        # forget the timeline when the track is garbage collected (so its id can't be reused for a different track)
+        weakref.finalize(chord_track, _chord_timeline_cache.pop, cache_key, None)
+    return _chord_timeline_cache[cache_key]
+
+
+def attach_chords(notes: NoteArray, chord_timeline: List[Tuple[Chord, int, int]],
+                  onset_ticks: Optional[np.ndarray] = None):
+    """
+    Set the underlying chord of each note to the last chord in ``chord_timeline`` which started at or before the
+    note's onset. Rather than comparing every note with every chord, this is done with a single sorted merge (a binary
+    search of each onset within the chord start times). The chords themselves are not copied: ``notes`` refers to the
+    chords in the timeline by index.
+
+    Args:
+        notes: The notes to attach the chords to. These are modified in place
+        chord_timeline: A list of (chord, start_time, stop_time) tuples, as returned by ``get_chord_timeline``
+        onset_ticks: The onset (in ticks) of each note. If None, the start times of ``notes`` are used
+    """
+    if onset_ticks is None:
+        onset_ticks = notes.start_times
+    chord_starts = np.array([chord_start for _, chord_start, _ in chord_timeline], dtype=np.int64)
+    # test: and note.end_time <= chord_end
+    notes.chord_ids = np.searchsorted(chord_starts, onset_ticks, side="right").astype(np.int64) - 1
+    notes.chords = [chord for chord, _, _ in chord_timeline]
+
+
+def __get_smf_note_end_indices(track: SmfTrack, note_on_indices: np.ndarray) -> np.ndarray:
+    """
+    Find the note_off message that ends each note of an SmfTrack, without looping over the messages in Python. As
+    with MidiTracks, a note_off is assumed to end the last note_on of the same pitch before it (if there are several
+    note_offs for the same note_on, the last one is used).
+
+    Args:
+        track: The track containing the notes
+        note_on_indices: The index of each note_on message within the track
+
+    Returns:
+        The index within the track of the note_off message of each note, or -1 if the note never ends
+    """
+    end_message_indices = np.full(len(note_on_indices), -1, dtype=np.int64)
+    note_off_indices = np.flatnonzero(track.note_off_mask)
+    if len(note_on_indices) == 0 or len(note_off_indices) == 0:
+        return end_message_indices
+
+    # group the messages by pitch (in the order they occur): each note_off belongs to the last note_on before it in
+    # its group
+    message_indices = np.concatenate((note_on_indices, note_off_indices))
+    message_pitches = track.data1[message_indices]
+    order = np.lexsort((message_indices, message_pitches))
+    is_on = order < len(note_on_indices)
+    positions = np.arange(len(order))
+    last_on = np.maximum.accumulate(np.where(is_on, positions, -1))
+    # the last note_on before a note_off may be from a different group (i.e. with a different pitch)
+    matched = ~is_on & (last_on >= 0)
+    matched[matched] = message_pitches[order[last_on[matched]]] == message_pitches[order[matched]]
+
+    np.maximum.at(end_message_indices, order[last_on[matched]], message_indices[order[matched]])
+    return end_message_indices
+
+
+def get_note_timeline(track: Track, chord_track: Optional[Track] = None) -> NoteArray:
     """
-    Returns a list of notes derived from the messages within the MIDI track. The data stored within each note is
+    Returns the notes derived from the messages within the MIDI track, as a ``NoteArray``. The data stored for each
+    note is
     1. The start time of the note (in ticks)
     2. The end time of the note (in ticks)
     3. The note value being played
@@ -194,40 +364,178 @@ def get_note_timeline(track: MidiTrack, chord_track: Optional[mido.MidiTrack] =
         track: A track from a MIDI file
         chord_track: A track containing what chords were played in the midi file.
     Returns:
-        A list of notes derived from the messages in the MIDI track .
-
-    """
-    notes = []
+        A NoteArray containing the notes derived from the messages in the MIDI track .
+
+    """
+    if isinstance(track, SmfTrack):
+        note_on_indices = np.flatnonzero(track.note_on_mask)
+        end_message_indices = __get_smf_note_end_indices(track, note_on_indices)
+        notes = NoteArray(track.ticks[note_on_indices],
+                          np.where(end_message_indices >= 0, track.ticks[end_message_indices], -1),
+                          track.data1[note_on_indices].astype(np.int64),
+                          track.channels[note_on_indices].astype(np.int64),
+                          start_message_indices=note_on_indices.astype(np.int64),
+                          end_message_indices=end_message_indices)
+        if chord_track is not None:
+            attach_chords(notes, get_cached_chord_timeline(chord_track))
+        return notes
+
+    start_times = []
+    end_times = []
+    pitches = []
+    channels = []
+    start_message_indices = []
+    end_message_indices = []
     last_note_dict = {}
     curr_ticks = 0
-    for i in range(len(track)):
-        if is_note_on(track[i]):
+    for i, msg in enumerate(track):
+        if is_note_on(msg):
             # start of new note being played
-            notes.append(Note(curr_ticks + track[i].time, -1, track[i].note, track[i].channel, None, i, None))
-            last_note_dict[track[i].note] = len(notes) - 1
-        elif is_note_off(track[i]):
+            start_times.append(curr_ticks + msg.time)
+            end_times.append(-1)
+            pitches.append(msg.note)
+            channels.append(msg.channel)
+            start_message_indices.append(i)
+            end_message_indices.append(-1)
+            last_note_dict[msg.note] = len(pitches) - 1
+        elif is_note_off(msg):
             # note off (inc note on "running status")
             # naive: assume the previous note_on message was the one this note_off corresponds to
             # (not necessarily the case in polyphonic music)
-            notes[last_note_dict[track[i].note]].end_time = curr_ticks + track[i].time  # set the last note's end time
-            notes[last_note_dict[track[i].note]].end_message_index = i
-        curr_ticks += track[i].time
+            end_times[last_note_dict[msg.note]] = curr_ticks + msg.time  # set the last note's end time
+            end_message_indices[last_note_dict[msg.note]] = i
+        curr_ticks += msg.time
+
+    notes = NoteArray(np.array(start_times, dtype=np.int64), np.array(end_times, dtype=np.int64),
+                      np.array(pitches, dtype=np.int64), np.array(channels, dtype=np.int64),
+                      start_message_indices=np.array(start_message_indices, dtype=np.int64),
+                      end_message_indices=np.array(end_message_indices, dtype=np.int64))
 
     if chord_track is not None:
-        chord_timeline = get_chord_timeline(chord_track)
-        # naive (this is inefficient)
-        for chord, chord_start, chord_end in chord_timeline:
-            for note in notes:
-                if note.start_time >= chord_start:
-                    # test: and note.end_time <= chord_end
-                    note.chord = Chord(*chord.to_midi_values())  # COPY
+        attach_chords(notes, get_cached_chord_timeline(chord_track))
 
     return notes
 
 
-def get_notes_in_time_range(track: MidiTrack, ticks_per_beat: int,
+def __iter_note_messages(track: Track, tempo_map: Optional[TempoMap] = None) \
+        -> Iterator[Tuple[int, int, float, bool, int, int]]:
+    """
+    Yield the note_on and note_off messages of a track, in order. SmfTracks are read
+    ``constants.NOTE_STREAM_CHUNK_SIZE`` messages at a time, so only one chunk of each column is converted at once.
+
+    Args:
+        track: The track to read
+        tempo_map: The TempoMap of the track, used to find the time (in seconds) of each message. If None, the time in
+            ticks is given instead
+
+    Returns:
+        A (message index, ticks, time, is note_on, note, channel) tuple for each note_on / note_off message
+    """
+    if isinstance(track, SmfTrack):
+        for chunk_start in range(0, len(track), constants.NOTE_STREAM_CHUNK_SIZE):
+            chunk = slice(chunk_start, chunk_start + constants.NOTE_STREAM_CHUNK_SIZE)
+            note_on_mask = track.note_on_mask[chunk]
+            indices = np.flatnonzero(note_on_mask | track.note_off_mask[chunk])
+            ticks = track.ticks[chunk][indices]
+            times = ticks if tempo_map is None else tempo_map.ticks_to_seconds(ticks)
+            yield from zip((indices + chunk_start).tolist(), ticks.tolist(), times.tolist(),
+                           note_on_mask[indices].tolist(), track.data1[chunk][indices].tolist(),
+                           track.channels[chunk][indices].tolist())
+    else:
+        curr_ticks = 0
+        for i, msg in enumerate(track):
+            curr_ticks += msg.time
+            if is_note_on(msg) or is_note_off(msg):
+                curr_time = curr_ticks if tempo_map is None else tempo_map.ticks_to_seconds(curr_ticks)
+                yield i, curr_ticks, curr_time, is_note_on(msg), msg.note, msg.channel
+
+
+def iter_notes(track: Track, tempo_map: Optional[TempoMap] = None, chord_track: Optional[Track] = None) \
+        -> Iterator[Note]:
+    """
+    Yield the notes of a MIDI track one at a time, in order of onset, without building the whole note timeline first.
+    Only the notes which are still playing (and the notes after them) are held in memory, so very long tracks can be
+    processed in bounded memory.
+
+    Notes are paired with note_off messages as in ``get_note_timeline``, except that a note ends at the *first*
+    note_off of its pitch (so a note can be yielded as soon as it ends). A note that never ends has an end time of -1.
+
+    Args:
+        track: A track from a MIDI file
+        tempo_map: The TempoMap of the track. If given, the start and end times of the notes are in seconds, otherwise
+            they are in ticks
+        chord_track: A track containing what chords were played in the midi file.
+
+    Returns:
+        An iterator over the notes of the track
+    """
+    chord_timeline = get_cached_chord_timeline(chord_track) if chord_track is not None else []
+    chord_starts = [chord_start for _, chord_start, _ in chord_timeline]
+    # every note that hasn't been yielded yet (in order of onset), and the note currently playing for each pitch
+    pending: Deque[Note] = deque()
+    playing: Dict[int, Note] = {}
+    for index, curr_ticks, curr_time, is_on, note, channel in __iter_note_messages(track, tempo_map):
+        if is_on:
+            chord_index = bisect.bisect_right(chord_starts, curr_ticks) - 1
+            new_note = Note(curr_time, -1, note, channel,
+                            chord_timeline[chord_index][0] if chord_index >= 0 else None, index)
+            pending.append(new_note)
+            playing[note] = new_note  # a previous note of the same pitch which hasn't ended never will
+        elif note in playing:
+            ended_note = playing.pop(note)
+            ended_note.end_time = curr_time
+            ended_note.end_message_index = index
+
+        while len(pending) > 0 and playing.get(pending[0].pitch) is not pending[0]:
+            yield pending.popleft()
+
+    yield from pending
+
+
+def iter_windows(track: Track, window_size: int, hop_size: Optional[int] = None, tempo_map: Optional[TempoMap] = None,
+                 chord_track: Optional[Track] = None) -> Iterator[NoteArray]:
+    """
+    Yield windows of ``window_size`` consecutive notes of a MIDI track (see ``iter_notes``), the start of each window
+    being ``hop_size`` notes after the start of the last. At most ``window_size`` notes are held in memory at once.
+    Every note is in at least one window: if the notes don't divide evenly into windows, the last window is shorter.
+
+    Args:
+        track: A track from a MIDI file
+        window_size: The number of notes in each window
+        hop_size: The number of notes between the start of each window. Defaults to ``window_size`` (i.e. the windows
+            don't overlap)
+        tempo_map: The TempoMap of the track. If given, the start and end times of the notes are in seconds, otherwise
+            they are in ticks
+        chord_track: A track containing what chords were played in the midi file.
+
+    Returns:
+        An iterator over the windows of notes, each as a NoteArray
+    """
+    if hop_size is None:
+        hop_size = window_size
+    if not 0 < hop_size <= window_size:
+        raise ValueError(f"hop_size must be between 1 and the window size ({window_size}), not {hop_size}")
+
+    window: Deque[Note] = deque(maxlen=window_size)
+    num_notes = 0
+    window_start = 0  # the index of the first note of the next window
+    for note in iter_notes(track, tempo_map, chord_track):
+        window.append(note)
+        num_notes += 1
+        if num_notes == window_start + window_size:
+            yield NoteArray.from_notes(list(window))
+            window_start += hop_size
+
+    # the notes after the end of the last full window (if there are any)
+    last_window_end = window_start - hop_size + window_size if window_start > 0 else 0
+    if num_notes > last_window_end:
+        yield NoteArray.from_notes(list(window)[window_start - (num_notes - len(window)):])
+
+
+def get_notes_in_time_range(track: Track, ticks_per_beat: int,
                             start: float = 0, end: float = float("inf"), allow_smaller: bool = True,
-                            use_midi_times: bool = False, chord_track: Optional[MidiTrack] = None) -> List[Note]:
+                            use_midi_times: bool = False, chord_track: Optional[Track] = None,
+                            tempo_map: Optional[TempoMap] = None) -> NoteArray:
     """
     Return all notes within the time (in seconds) range [start,end]
 
@@ -236,70 +544,113 @@ def get_notes_in_time_range(track: MidiTrack, ticks_per_beat: int,
         ticks_per_beat: the number of Midi message "ticks" per quarter note
         start: The beginning of the time range (default: 0)
         end:  The end of the time range (default: inf (to the end of the track))
-        allow_smaller: Whether to allow sets of notes that are smaller than the time range (for example, if the time range exceed the end of the song) (default: True). If False, returns the empty list [] if end goes over the end of the song
+        allow_smaller: Whether to allow sets of notes that are smaller than the time range (for example, if the time range exceed the end of the song) (default: True). If False, returns an empty NoteArray if end goes over the end of the song
         use_midi_times: Whether to save notes with their MIDI tick values instead of the time in seconds (default: False)
         chord_track: The track containing the corresponding chords of the melody track, if one exists
+        tempo_map: The TempoMap of the track. If None, it is built from the track. When getting notes from the same track several times, build it once (with ``get_track_tempo_map``) and pass it in each time.
     Returns:
-        A list of notes in the time range [start,end]
+        A NoteArray containing the notes in the time range [start,end]
 
     """
-    if not allow_smaller:
-        if end > get_end_offset(track, ticks_per_beat)[0]:
-            return []
+    if tempo_map is None:
+        tempo_map = get_track_tempo_map(track, ticks_per_beat)
 
-    notes = []
+    if not allow_smaller:
+        if end > get_end_offset(track, ticks_per_beat, tempo_map)[0]:
+            return NoteArray.empty()
+
+    start_times = []
+    onset_ticks = []
+    end_times = []
+    pitches = []
+    channels = []
     last_note_dict = {}
-    curr_time = 0
-    curr_ticks = 0
-    curr_tempo = bpm2tempo(120)
 
-    for msg in track:
-        curr_time += tick2second(msg.time, ticks_per_beat, curr_tempo)
-        curr_ticks += msg.time
-        if msg.type == "set_tempo":
-            curr_tempo = msg.tempo
-
-        if curr_time < start:
-            continue
-        elif curr_time > end:
-            break
-        elif is_note_on(msg):
-            if use_midi_times:
-                notes.append(Note(curr_ticks, -1, msg.note, msg.channel))
-            else:
-                notes.append(Note(curr_time, -1, msg.note, msg.channel))
-            last_note_dict[msg.note] = len(notes) - 1
-        elif is_note_off(msg):
-            if msg.note in last_note_dict.keys():
-                if use_midi_times:
-                    notes[last_note_dict[msg.note]].end_time = curr_ticks
-                else:
-                    notes[last_note_dict[msg.note]].end_time = curr_time  # set the last note's end time
-            else:
-                if use_midi_times:
-                    notes.append(Note(curr_ticks - msg.time, curr_ticks, msg.note, msg.channel))
-                else:
-                    notes.append(Note(float(start), curr_time, msg.note, msg.channel))
-
-    if len(notes) > 0:  # limit note end to end of time period
-        if notes[-1].end_time == -1:
-            if use_midi_times:
-                notes[-1].end_time = curr_ticks
+    # only the messages within the time range need to be looked at
+    first_index, last_index = tempo_map.message_range(start, end)
+    # the message just after the range (if there is one) is where the last note is cut off
+    stop_index = min(last_index, len(track) - 1)
+    message_seconds = tempo_map.message_seconds[first_index:stop_index + 1].tolist()
+    message_ticks = tempo_map.message_ticks[first_index:stop_index + 1].tolist()
+
+    if isinstance(track, SmfTrack):
+        message_note_ons = track.note_on_mask[first_index:last_index].tolist()
+        message_note_offs = track.note_off_mask[first_index:last_index].tolist()
+        message_notes = track.data1[first_index:last_index].tolist()
+        message_channels = track.channels[first_index:last_index].tolist()
+        message_deltas = track.delta_ticks[first_index:last_index].tolist()
+    else:
+        messages = [track[i] for i in range(first_index, last_index)]
+        message_note_ons = [is_note_on(msg) for msg in messages]
+        message_note_offs = [is_note_off(msg) for msg in messages]
+        message_notes = [msg.note if hasattr(msg, "note") else -1 for msg in messages]
+        message_channels = [msg.channel if hasattr(msg, "channel") else -1 for msg in messages]
+        message_deltas = [msg.time for msg in messages]
+
+    for i in range(last_index - first_index):
+        curr_time = message_seconds[i]
+        curr_ticks = message_ticks[i]
+        note = message_notes[i]
+        if message_note_ons[i]:
+            start_times.append(curr_ticks if use_midi_times else curr_time)
+            onset_ticks.append(curr_ticks)
+            end_times.append(-1)
+            pitches.append(note)
+            channels.append(message_channels[i])
+            last_note_dict[note] = len(pitches) - 1
+        elif message_note_offs[i]:
+            if note in last_note_dict.keys():
+                # set the last note's end time
+                end_times[last_note_dict[note]] = curr_ticks if use_midi_times else curr_time
             else:
-                notes[-1].end_time = curr_time
+                start_times.append(curr_ticks - message_deltas[i] if use_midi_times else float(start))
+                onset_ticks.append(curr_ticks - message_deltas[i])
+                end_times.append(curr_ticks if use_midi_times else curr_time)
+                pitches.append(note)
+                channels.append(message_channels[i])
+
+    if len(pitches) > 0:  # limit note end to end of time period
+        if end_times[-1] == -1:
+            end_times[-1] = message_ticks[-1] if use_midi_times else message_seconds[-1]
+
+    time_dtype = np.int64 if use_midi_times else np.float64
+    notes = NoteArray(np.array(start_times, dtype=time_dtype), np.array(end_times, dtype=time_dtype),
+                      np.array(pitches, dtype=np.int64), np.array(channels, dtype=np.int64))
 
     if chord_track is not None:
-        chord_timeline = get_chord_timeline(chord_track)
-        # naive (this is even more inefficient)
-        for chord, chord_start, chord_end in chord_timeline:
-            for note in notes:
-                if note.start_time >= chord_start:
-                    note.chord = Chord(*chord.to_midi_values())  # COPY
+        # chords are matched using the onset in ticks, even if the notes are stored in seconds
+        attach_chords(notes, get_cached_chord_timeline(chord_track), np.array(onset_ticks, dtype=np.int64))
 
     return notes
 
 
-def get_track_signatures(track: MidiTrack) -> Tuple[List[Tuple[int, TimeSignature]], List[Tuple[int, KeySignature]]]:
+def get_time_range_windows(notes: NoteArray, tempo_map: TempoMap, starts: np.ndarray,
+                            ends: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    For each time (in seconds) range [start,end], find the window of the note timeline of a track holding the notes
+    within that range, i.e. the notes ``get_notes_in_time_range`` would return for it. As well as the notes starting
+    within the range, a window begins with any notes still sounding at the start of the range (which
+    ``get_notes_in_time_range`` includes as their note_off falls in the range). Unlike ``get_notes_in_time_range``,
+    the last note of a window keeps its end time, rather than being cut off at the end of the range.
+
+    Args:
+        notes: The note timeline of the track (see ``get_note_timeline``), with the message index of each note
+        tempo_map: The TempoMap of the track
+        starts: The beginning of each time range
+        ends: The end of each time range
+
+    Returns:
+        A (first, stop) pair of arrays: the notes within each range are ``notes[first[i]:stop[i]]``
+    """
+    first_messages = np.searchsorted(tempo_map.message_seconds, starts, side="left")
+    last_messages = np.searchsorted(tempo_map.message_seconds, ends, side="right")
+    first = np.minimum(np.searchsorted(notes.start_message_indices, first_messages, side="left"),
+                       np.searchsorted(np.maximum.accumulate(notes.end_message_indices), first_messages, side="left"))
+    stop = np.searchsorted(notes.start_message_indices, last_messages, side="left")
+    return first, stop
+
+
+def get_track_signatures(track: Track) -> Tuple[List[Tuple[int, TimeSignature]], List[Tuple[int, KeySignature]]]:
     """
     Returns a list of key and time signatures in the MIDI track, and their positions within the track (in ticks)
 
@@ -311,6 +662,17 @@ def get_track_signatures(track: MidiTrack) -> Tuple[List[Tuple[int, TimeSignatur
     """
     time_signatures = []
     key_signatures = []
+    if isinstance(track, SmfTrack):
+        for i in np.flatnonzero(track.meta_types == smf_reader.TIME_SIGNATURE_META).tolist():
+            time_signatures.append((int(track.ticks[i]), TimeSignature(*track.get_time_signature(i))))
+        for i in np.flatnonzero(track.meta_types == smf_reader.KEY_SIGNATURE_META).tolist():
+            key = track.get_key_signature(i)
+            if key.endswith("m"):  # is minor key
+                key_signatures.append((int(track.ticks[i]), KeySignature(key[:-1], True)))
+            else:
+                key_signatures.append((int(track.ticks[i]), KeySignature(key, False)))
+        return time_signatures, key_signatures
+
     start_time = 0
     for message in track:
         if message.type == "time_signature":
@@ -326,7 +688,7 @@ def get_track_signatures(track: MidiTrack) -> Tuple[List[Tuple[int, TimeSignatur
     return time_signatures, key_signatures
 
 
-def get_track_tempo_changes(track: MidiTrack) -> List[Tuple[int, int]]:
+def get_track_tempo_changes(track: Track) -> List[Tuple[int, int]]:
     """
     Get a list of tempo changes within the given MidiTrack, and when they occurred (in ticks).
 
@@ -336,6 +698,10 @@ def get_track_tempo_changes(track: MidiTrack) -> List[Tuple[int, int]]:
     Returns:
         A list of (time, tempo) pairs showing when each tempo_change message occured.
     """
+    if isinstance(track, SmfTrack):
+        return [(int(track.ticks[i]), track.get_tempo(i))
+                for i in np.flatnonzero(track.meta_types == smf_reader.SET_TEMPO_META).tolist()]
+
     time = 0
     tempo_changes = []
     for message in track:
@@ -346,7 +712,7 @@ def get_track_tempo_changes(track: MidiTrack) -> List[Tuple[int, int]]:
     return tempo_changes
 
 
-def get_track_non_note_messages(track: MidiTrack) -> Deque[Tuple[int, Message]]:
+def get_track_non_note_messages(track: Track) -> Deque[Tuple[int, Message]]:
     """
     Returns a double ended queue containing the messages relevant for saving MIDI files  (other than the
     actual notes). This means any `MetaMessage`, as well as `control_change` and `program_change` messages. These
@@ -357,6 +723,10 @@ def get_track_non_note_messages(track: MidiTrack) -> Deque[Tuple[int, Message]]:
     Returns:
         A Deque containing messages relevant for saving this segment as a MIDI file.
     """
+    if isinstance(track, SmfTrack):
+        # these are only needed to write MIDI files, so mido messages are created for them
+        return deque((int(track.ticks[i]), track.to_message(i)) for i in get_track_non_note_indices(track).tolist())
+
     time = 0
     meta_messages = deque()
     for message in track:
@@ -367,6 +737,21 @@ def get_track_non_note_messages(track: MidiTrack) -> Deque[Tuple[int, Message]]:
     return meta_messages
 
 
+def get_track_non_note_indices(track: SmfTrack) -> np.ndarray:
+    """
+    Returns the indices of the messages in the track which ``get_track_non_note_messages`` returns.
+
+    Args:
+        track: the MIDI track to get the non note messages from
+
+    Returns:
+        A numpy array containing the index of each meta, control_change and program_change message in the track
+    """
+    return np.flatnonzero((track.statuses == smf_reader.META_STATUS) |
+                          (track.statuses == smf_reader.CONTROL_CHANGE_STATUS) |
+                          (track.statuses == smf_reader.PROGRAM_CHANGE_STATUS))
+
+
 def get_higher_pitch(pitch_class: str) -> str:
     """
     Get the pitch class 1 note above the pitch_class given. e.g. E->F , B->C , D->E
@@ -503,7 +888,7 @@ def transpose_keysig_down(msg) -> Optional[MetaMessage]:
         return None
 
 
-def is_monophonic(track: MidiTrack) -> bool:
+def is_monophonic(track: Track) -> bool:
     """
     Returns whether the MidiTrack ``track`` is monophonic (i.e. whether the track has at most one note playing at any
     given time)
@@ -514,6 +899,11 @@ def is_monophonic(track: MidiTrack) -> bool:
     Returns:
         True if the track is monophonic, False otherwise
     """
+    if isinstance(track, SmfTrack):
+        # look for two consecutive note_on (or note_off) messages
+        return not (np.any(track.note_on_mask[1:] & track.note_on_mask[:-1]) or
+                    np.any(track.note_off_mask[1:] & track.note_off_mask[:-1]))
+
     for (msg1, msg2) in zip(track[1:], track):
         if (is_note_on(msg1) and is_note_on(msg2)) or (is_note_off(msg1) and is_note_off(msg2)):
             return False
@@ -1,13 +1,15 @@
-import sys
 from math import floor
 from typing import Optional
 
 import project.algorithms.core.constants as constants
+from project.algorithms.core import scoring
 from project.algorithms.core.chord import Chord
 from project.algorithms.graph_based.signature import TimeSignature, KeySignature
 
 
 class Note:
+    __slots__ = ("start_time", "end_time", "pitch", "channel", "chord", "start_message_index", "end_message_index")
+
     def __init__(self, start: float, end: float, pitch: float, channel: int = 0, chord: Optional[Chord] = None,
                  start_message_index: Optional[int] = None, end_message_index: Optional[int] = None):
         """
@@ -72,8 +74,7 @@ class Note:
             beat_strength = constants.BEAT_STRENGTH_DICT[(time_signature.numerator, time_signature.denominator)][
                 beat_index]
         else:
-            sys.stderr.write(f"Time signature {time_signature.__repr__()} not in beat strength dict\n")
-            sys.stderr.flush()
+            scoring.count_unknown_time_signature(time_signature)
             if beat_index == 1:
                 beat_strength = 0.4
             else:
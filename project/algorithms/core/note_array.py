@@ -0,0 +1,319 @@
+import hashlib
+from typing import List, Optional, Union, Iterator, Sequence
+
+import numpy as np
+
+from project.algorithms.core.chord import Chord
+from project.algorithms.core.note import Note
+
+
+class NoteArray:
+    def __init__(self, start_times: np.ndarray, end_times: np.ndarray, pitches: np.ndarray,
+                 channels: Optional[np.ndarray] = None, chord_ids: Optional[np.ndarray] = None,
+                 chords: Optional[List[Chord]] = None, start_message_indices: Optional[np.ndarray] = None,
+                 end_message_indices: Optional[np.ndarray] = None):
+        """
+        A sequence of notes stored as a *struct of arrays*: each attribute of a ``Note`` is held in its own numpy
+        array (or column) instead of there being one Python object per note. Indexing a NoteArray with an integer
+        creates a ``Note`` for that single element on demand, while slicing or masking returns another NoteArray
+        (which, for slices, shares its memory with this one).
+
+        Chords are stored once in the ``chords`` table, with ``chord_ids`` giving the index of the chord belonging to
+        each note (-1 meaning the note has no underlying chord). Message indices of -1 mean the note is not taken
+        directly from a MidiTrack.
+
+        Args:
+            start_times: the start of each note; either as ticks, or a normalized value
+            end_times: the end of each note; either as ticks, or a normalized value
+            pitches: the pitch of each note (either a MIDI note number, or a normalized value)
+            channels: the MIDI channel of each note (default is channel 0 for every note)
+            chord_ids: the index within ``chords`` of the underlying chord of each note (default is no chords)
+            chords: the table of chords that ``chord_ids`` refer to
+            start_message_indices: the index in a MIDI track of the note_on event of each note (default is -1)
+            end_message_indices: the index in a MIDI track of the note_off event of each note (default is -1)
+        """
+        self.start_times = np.asarray(start_times)
+        self.end_times = np.asarray(end_times)
+        self.pitches = np.asarray(pitches)
+        length = len(self.pitches)
+        self.channels = np.zeros(length, dtype=np.int64) if channels is None else np.asarray(channels)
+        self.chord_ids = np.full(length, -1, dtype=np.int64) if chord_ids is None else np.asarray(chord_ids)
+        self.chords = [] if chords is None else chords
+        self.start_message_indices = np.full(length, -1, dtype=np.int64) if start_message_indices is None \
+            else np.asarray(start_message_indices)
+        self.end_message_indices = np.full(length, -1, dtype=np.int64) if end_message_indices is None \
+            else np.asarray(end_message_indices)
+
+    @staticmethod
+    def empty() -> "NoteArray":
+        """
+        Returns a NoteArray containing no notes
+
+        Returns:
+            A NoteArray of length 0
+        """
+        return NoteArray(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+
+    @staticmethod
+    def from_notes(notes: Sequence[Note]) -> "NoteArray":
+        """
+        Create a NoteArray from a list of ``Note`` objects. Chords that are shared between notes (i.e. the same
+        ``Chord`` instance) are only stored once in the chord table.
+
+        Args:
+            notes: The notes to store in the new NoteArray
+
+        Returns:
+            A NoteArray containing the same notes, in the same order
+        """
+        if isinstance(notes, NoteArray):
+            return notes
+        if len(notes) == 0:
+            return NoteArray.empty()
+
+        chords = []
+        chord_index = {}
+        chord_ids = []
+        for note in notes:
+            if note.chord is None:
+                chord_ids.append(-1)
+            else:
+                if id(note.chord) not in chord_index:
+                    chord_index[id(note.chord)] = len(chords)
+                    chords.append(note.chord)
+                chord_ids.append(chord_index[id(note.chord)])
+
+        return NoteArray(np.array([note.start_time for note in notes]),
+                         np.array([note.end_time for note in notes]),
+                         np.array([note.pitch for note in notes]),
+                         np.array([note.channel for note in notes], dtype=np.int64),
+                         np.array(chord_ids, dtype=np.int64), chords,
+                         np.array([-1 if note.start_message_index is None else note.start_message_index
+                                   for note in notes], dtype=np.int64),
+                         np.array([-1 if note.end_message_index is None else note.end_message_index
+                                   for note in notes], dtype=np.int64))
+
+    @staticmethod
+    def concatenate(note_arrays: Sequence["NoteArray"]) -> "NoteArray":
+        """
+        Join several NoteArrays into one, in order. The chords of every array are merged into a single chord table
+        (each chord, i.e. ``Chord`` instance, appearing in it once).
+
+        Args:
+            note_arrays: The NoteArrays to join
+
+        Returns:
+            A new NoteArray containing the notes of every array in ``note_arrays``
+        """
+        if len(note_arrays) == 0:
+            return NoteArray.empty()
+
+        chords = []
+        chord_index = {}
+        chord_ids = []
+        for notes in note_arrays:
+            # the position of each chord of this array in the merged table (the last element is for notes without one)
+            table_ids = []
+            for chord in notes.chords:
+                if id(chord) not in chord_index:
+                    chord_index[id(chord)] = len(chords)
+                    chords.append(chord)
+                table_ids.append(chord_index[id(chord)])
+            chord_ids.append(np.array(table_ids + [-1], dtype=np.int64)[notes.chord_ids])
+
+        return NoteArray(np.concatenate([notes.start_times for notes in note_arrays]),
+                         np.concatenate([notes.end_times for notes in note_arrays]),
+                         np.concatenate([notes.pitches for notes in note_arrays]),
+                         np.concatenate([notes.channels for notes in note_arrays]),
+                         np.concatenate(chord_ids), chords,
+                         np.concatenate([notes.start_message_indices for notes in note_arrays]),
+                         np.concatenate([notes.end_message_indices for notes in note_arrays]))
+
+    @property
+    def durations(self) -> np.ndarray:
+        """
+        Return the duration of every note
+
+        Returns:
+            A numpy array containing the duration of each note
+        """
+        return self.end_times - self.start_times
+
+    @property
+    def fingerprint(self) -> int:
+        """
+        Return a 64-bit hash of the duration and pitch of every note, so that equal sequences of notes (see
+        ``__eq__``) always have the same fingerprint. Unlike ``hash``, the fingerprint doesn't change between runs, so
+        it can be stored (e.g. in a graph) and compared with fingerprints computed later. Different sequences of notes
+        can have the same fingerprint (although this is very unlikely), so a matching fingerprint should be confirmed
+        by comparing the notes themselves.
+
+        Returns:
+            The fingerprint of the notes, as an integer in the range [0, 2^64)
+        """
+        # integer and float values which are equal must give the same bytes (adding 0 also turns -0.0 into 0.0)
+        values = np.concatenate((self.durations, self.pitches)).astype("<f8") + 0.0
+        return int.from_bytes(hashlib.blake2b(values.tobytes(), digest_size=8).digest(), "little")
+
+    @property
+    def chord_roots(self) -> np.ndarray:
+        """
+        Return the root tone of the underlying chord of every note
+
+        Returns:
+            A numpy array containing the root tone of each note's chord, or -1 for notes with no underlying chord
+        """
+        # the last element is for notes with no chord (whose chord id is -1)
+        return np.array([chord.root_tone for chord in self.chords] + [-1], dtype=np.int64)[self.chord_ids]
+
+    def chord_at(self, index: int) -> Optional[Chord]:
+        """
+        Return the underlying chord of the note at ``index``, if it has one
+
+        Args:
+            index: The index of the note
+
+        Returns:
+            None if the note has no underlying chord, otherwise the chord itself.
+        """
+        chord_id = self.chord_ids[index]
+        return None if chord_id < 0 else self.chords[chord_id]
+
+    def to_notes(self) -> List[Note]:
+        """
+        Create a ``Note`` object for every element of this NoteArray.
+
+        Returns:
+            A list of notes, in the same order as this NoteArray
+        """
+        return [self[i] for i in range(len(self))]
+
+    def normalize(self, mean_pitch: float, start_offset: float, sequence_length: float) -> "NoteArray":
+        """
+        Return a normalized version of these notes. See ``Note.normalize`` for more details.
+
+        Args:
+            mean_pitch: The mean pitch of the sequence of notes to be normalized
+            start_offset: The start offset of the sequence of notes to be normalized
+            sequence_length: The number of notes in the sequence to be normalized
+
+        Returns:
+            A new NoteArray normalized in all aspects with respect to the provided arguments
+        """
+        return NoteArray((self.start_times - start_offset) / sequence_length,
+                         (self.end_times - start_offset) / sequence_length,
+                         self.pitches - mean_pitch, self.channels, self.chord_ids, self.chords,
+                         self.start_message_indices, self.end_message_indices)
+
+    def transpose(self, pitch_change: int) -> "NoteArray":
+        """
+        Return a copy of these notes with each pitch (and chord) moved up or down by a uniform amount.
+
+        Args:
+            pitch_change: The amount to increase or decrease the pitch of every note by.
+
+        Returns:
+            A new, transposed NoteArray. This NoteArray is not modified
+        """
+        chords = [chord.transpose(pitch_change) for chord in self.chords]
+        return NoteArray(self.start_times.copy(), self.end_times.copy(), self.pitches + pitch_change,
+                         self.channels.copy(), self.chord_ids.copy(), chords,
+                         self.start_message_indices.copy(), self.end_message_indices.copy())
+
+    def insert(self, index: int, note: Note) -> "NoteArray":
+        """
+        Return a copy of this NoteArray with ``note`` inserted before ``index``
+
+        Args:
+            index: the index at which to place the new note
+            note: the note to insert
+
+        Returns:
+            A new NoteArray containing the inserted note. This NoteArray is not modified.
+        """
+        chords = list(self.chords)
+        if note.chord is None:
+            chord_id = -1
+        elif any(chord is note.chord for chord in chords):
+            chord_id = next(i for i, chord in enumerate(chords) if chord is note.chord)
+        else:
+            chord_id = len(chords)
+            chords.append(note.chord)
+
+        return NoteArray(np.insert(self.start_times, index, note.start_time),
+                         np.insert(self.end_times, index, note.end_time),
+                         np.insert(self.pitches, index, note.pitch),
+                         np.insert(self.channels, index, note.channel),
+                         np.insert(self.chord_ids, index, chord_id), chords,
+                         np.insert(self.start_message_indices, index,
+                                   -1 if note.start_message_index is None else note.start_message_index),
+                         np.insert(self.end_message_indices, index,
+                                   -1 if note.end_message_index is None else note.end_message_index))
+
+    def delete(self, index: int) -> "NoteArray":
+        """
+        Return a copy of this NoteArray with the note at ``index`` removed
+
+        Args:
+            index: The index of the note to remove
+
+        Returns:
+            A new NoteArray without the note at ``index``. This NoteArray is not modified.
+        """
+        keep = np.ones(len(self), dtype=bool)
+        keep[index] = False
+        return self[keep]
+
+    def __len__(self) -> int:
+        return len(self.pitches)
+
+    def __iter__(self) -> Iterator[Note]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, item: Union[int, slice, np.ndarray]) -> Union[Note, "NoteArray"]:
+        """
+        Return a single note (as a new ``Note`` object) if ``item`` is an integer, otherwise return the NoteArray
+        selected by the slice, boolean mask or index array ``item``
+
+        Args:
+            item: An integer index, a slice, a boolean mask or an array of indices
+
+        Returns:
+            A Note if item is an integer, otherwise a NoteArray.
+        """
+        if isinstance(item, (int, np.integer)):
+            start_message_index = int(self.start_message_indices[item])
+            end_message_index = int(self.end_message_indices[item])
+            return Note(self.start_times[item].item(), self.end_times[item].item(), self.pitches[item].item(),
+                        int(self.channels[item]), self.chord_at(item),
+                        None if start_message_index < 0 else start_message_index,
+                        None if end_message_index < 0 else end_message_index)
+        else:
+            return NoteArray(self.start_times[item], self.end_times[item], self.pitches[item], self.channels[item],
+                             self.chord_ids[item], self.chords, self.start_message_indices[item],
+                             self.end_message_indices[item])
+
+    def __eq__(self, other: Union["NoteArray", List[Note]]) -> bool:
+        """
+        Returns whether the two sequences of notes are equal. Like ``Note.__eq__`` this is solely based on the pitch
+        and duration of each note.
+
+        Args:
+            other: another NoteArray (or list of notes) to compare with
+
+        Returns:
+            True if both sequences have the same notes, False otherwise.
+        """
+        if isinstance(other, list):
+            other = NoteArray.from_notes(other)
+        elif not isinstance(other, NoteArray):
+            return NotImplemented
+        return len(self) == len(other) and bool(np.all(self.durations == other.durations)) and \
+            bool(np.all(self.pitches == other.pitches))
+
+    def __str__(self):
+        return str(self.to_notes())
+
+    def __repr__(self):
+        return self.__str__()
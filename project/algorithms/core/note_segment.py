@@ -1,37 +1,62 @@
 import pickle
 from collections import deque
-from typing import List, Optional, Tuple, Deque
+from typing import List, Optional, Tuple, Deque, Union
 
+import numpy as np
 from mido import MidiFile, MidiTrack, Message
 
-from project.algorithms.core import constants
+from project.algorithms.core import constants, scoring
+from project.algorithms.core.feature_cache import get_cached_signature_timeline, get_cached_non_note_messages
 from project.algorithms.core.midi_segment import MidiSegment
 from project.algorithms.core.note import Note
-from project.algorithms.graph_based.signature import TimeSignature, KeySignature
-from project.algorithms.core.midtools import get_track_signatures, get_track_non_note_messages, transpose_keysig_down, \
-    transpose_keysig_up
+from project.algorithms.core.note_array import NoteArray
+from project.algorithms.core.segment_view import SegmentView
+from project.algorithms.core.signature_timeline import SignatureTimeline
+from project.algorithms.core.smf_reader import SmfFile
+from project.algorithms.core.song_registry import Song
+from project.algorithms.core.midtools import transpose_keysig_down, transpose_keysig_up
 
 
 class NoteSegment(MidiSegment):
 
-    def __init__(self, file: MidiFile, melody_track_ind: int, notes: List[Note], chord_track_ind: Optional[int] = None):
+    def __init__(self, file: Union[MidiFile, SmfFile, Song], melody_track_ind: int,
+                 notes: Union[NoteArray, List[Note], SegmentView], chord_track_ind: Optional[int] = None, signatures: Optional[SignatureTimeline] = None):
         """
-        A NoteSegment is a derived class of MidiSegment. It represents part of a MIDI file as a list of musical notes.
+        A NoteSegment is a derived class of MidiSegment. It represents part of a MIDI file as a sequence of musical
+        notes, stored internally as a ``SegmentView`` of a ``NoteArray``.
 
         Args:
-            file: the MIDI file this segment is taken from
+            file: the MIDI file this segment is taken from (or its Song)
             melody_track_ind: the index of track the melody of the MIDI are contained in
-            notes: A list of notes derived from the MIDI file in some way (not necessarily straight from the file, could be a reduction)
+            notes: The notes derived from the MIDI file in some way (not necessarily straight from the file, could be a reduction). A list of notes is converted to a NoteArray. If this is a SegmentView, the segment refers to the notes of the view rather than copying them.
             chord_track_ind: the index of the track the chords of the MIDI file are contained in, if it exists
+            signatures: the time and key signatures of the melody track. If not given, the timeline shared by every
+                segment of the file is used (see ``get_cached_signature_timeline``)
         """
         super().__init__(file, melody_track_ind)
-        self.notes = notes
+        self.view = notes if isinstance(notes, SegmentView) else SegmentView.of(NoteArray.from_notes(notes))
         self.chord_track_ind = chord_track_ind
-        # precompute time and key signatures
-        self.time_signature_events, self.key_signature_events = get_track_signatures(file.tracks[melody_track_ind])
+        # time and key signatures (shared with the other segments of the file)
+        self.signatures = signatures if signatures is not None else \
+            get_cached_signature_timeline(self._file, melody_track_ind)
         self.duration_transform = 1
         self.transpose_amount = 0
 
+    @property
+    def notes(self) -> NoteArray:
+        """
+        Return the notes of this segment. If the segment was created from a SegmentView, these share their memory with
+        the notes of the whole track.
+
+        Returns:
+            A NoteArray containing the notes of this segment
+        """
+        return self.view.notes
+
+    @notes.setter
+    def notes(self, notes: NoteArray):
+        self.view = SegmentView.of(notes)
+
     @property
     def start_time(self) -> Optional[float]:
         """
@@ -41,7 +66,7 @@ class NoteSegment(MidiSegment):
             None if this segment contains no notes, otherwise the onset of the first note is returned
         """
         if len(self.notes) > 0:
-            return self.notes[0].start_time
+            return self.notes.start_times[0].item()
         else:
             return None
 
@@ -54,7 +79,7 @@ class NoteSegment(MidiSegment):
             None if this segment contains no notes, otherwise the offset of the last note is returned
         """
         if len(self.notes) > 0:
-            return self.notes[-1].end_time
+            return self.notes.end_times[-1].item()
         else:
             return None
 
@@ -82,7 +107,7 @@ class NoteSegment(MidiSegment):
         if self._chord_track is None:
             return deque()
         else:
-            return get_track_non_note_messages(self._chord_track)
+            return get_cached_non_note_messages(self._file, self.chord_track_ind)
 
     def copy_notes_to_track(self, track: MidiTrack):
         """
@@ -111,16 +136,17 @@ class NoteSegment(MidiSegment):
         # add the list of notes within the core as Midi messages
         current_meta_index = 0
         current_time = self.start_time
-        for (index, note) in enumerate(self.notes):
-            note.start_time = int(note.start_time * self.duration_transform)
-            note.end_time = int(note.end_time * self.duration_transform)
+        start_times, end_times = self.__get_transformed_times()
+        pitches = self.notes.pitches.tolist()
+        channels = self.notes.channels.tolist()
+        for index in range(len(self.notes)):
             # add meta messages at the appropriate time
             if len(non_note_message_queue) > 0 and non_note_message_queue[0][0] <= current_time:
                 while len(non_note_message_queue) > 0 and non_note_message_queue[0][0] <= current_time:
                     track.append(non_note_message_queue.popleft()[1])
 
-            time_since_last_note = note.start_time - self.notes[index - 1].end_time if index != 0 else 0
-            track.append(Message(type="note_on", note=note.pitch, velocity=127, channel=note.channel,
+            time_since_last_note = start_times[index] - end_times[index - 1] if index != 0 else 0
+            track.append(Message(type="note_on", note=pitches[index], velocity=127, channel=channels[index],
                                  time=time_since_last_note))
             current_time += time_since_last_note
 
@@ -128,9 +154,10 @@ class NoteSegment(MidiSegment):
                 while len(non_note_message_queue) > 0 and non_note_message_queue[0][0] <= current_time:
                     track.append(non_note_message_queue.popleft()[1])
 
-            track.append(Message(type="note_on", note=note.pitch, velocity=0, channel=note.channel,
-                                 time=note.duration))  # running status note off
-            current_time += note.duration
+            duration = end_times[index] - start_times[index]
+            track.append(Message(type="note_on", note=pitches[index], velocity=0, channel=channels[index],
+                                 time=duration))  # running status note off
+            current_time += duration
         # add remaining meta messages
         while len(non_note_message_queue) > 0:
             track.append(non_note_message_queue.popleft()[1])
@@ -165,20 +192,23 @@ class NoteSegment(MidiSegment):
 
             current_meta_index = 0
             current_time = self.start_time
-            for (index, note) in enumerate(self.notes):
+            start_times, end_times = self.__get_transformed_times()
+            channels = self.notes.channels.tolist()
+            for index in range(len(self.notes)):
                 # add meta messages at the appropriate time
                 if len(non_note_message_queue) > 0 and non_note_message_queue[0][0] <= current_time:
                     while len(non_note_message_queue) > 0 and non_note_message_queue[0][0] <= current_time:
                         track.append(non_note_message_queue.popleft()[1])
 
-                time_since_last_note = note.start_time - self.notes[index - 1].end_time if index != 0 else 0
+                time_since_last_note = start_times[index] - end_times[index - 1] if index != 0 else 0
 
-                midi_values = note.chord.to_midi_values() if note.chord is not None else []
+                chord = self.notes.chord_at(index)
+                midi_values = [int(value) for value in chord.to_midi_values()] if chord is not None else []
                 if len(midi_values) > 0:
-                    track.append(Message(type="note_on", note=midi_values[0], velocity=127, channel=note.channel,
+                    track.append(Message(type="note_on", note=midi_values[0], velocity=127, channel=channels[index],
                                          time=time_since_last_note))
                     for chord_pitch in midi_values[1:]:
-                        track.append(Message(type="note_on", note=chord_pitch, velocity=127, channel=note.channel,
+                        track.append(Message(type="note_on", note=chord_pitch, velocity=127, channel=channels[index],
                                              time=0))
 
                 current_time += time_since_last_note
@@ -187,53 +217,30 @@ class NoteSegment(MidiSegment):
                     while len(non_note_message_queue) > 0 and non_note_message_queue[0][0] <= current_time:
                         track.append(non_note_message_queue.popleft()[1])
 
+                duration = end_times[index] - start_times[index]
                 if len(midi_values) > 0:
-                    track.append(Message(type="note_on", note=midi_values[0], velocity=0, channel=note.channel,
-                                         time=note.duration))  # running status note off
+                    track.append(Message(type="note_on", note=midi_values[0], velocity=0, channel=channels[index],
+                                         time=duration))  # running status note off
                     for chord_pitch in midi_values[1:]:
-                        track.append(Message(type="note_on", note=chord_pitch, velocity=0, channel=note.channel,
+                        track.append(Message(type="note_on", note=chord_pitch, velocity=0, channel=channels[index],
                                              time=0))
 
-                current_time += note.duration
+                current_time += duration
             # add remaining meta messages
             while len(non_note_message_queue) > 0:
                 track.append(non_note_message_queue.popleft()[1])
 
-    def __get_time_signature_at(self, tick_time: int) -> Tuple[int, TimeSignature]:
-        """
-        Returns what the time signature is at the given time in ticks
-
-        Args:
-            tick_time: The time in ticks at which to query the time signature
-
-        Returns:
-            A (time, time_sig) pair consisting of the last time signature, and the time this time signature was changed.
-        """
-        last_time_sig_event = 0, TimeSignature.default()
-        for time_sig_time, time_sig_value in self.time_signature_events:
-            if time_sig_time <= tick_time:
-                last_time_sig_event = time_sig_time, time_sig_value
-            else:
-                break
-        return last_time_sig_event
-
-    def __get_key_signature_at(self, tick_time: int) -> KeySignature:
+    def __get_transformed_times(self) -> Tuple[List[int], List[int]]:
         """
-        Returns what the key signature is at the given time in ticks
-
-        Args:
-            tick_time: The time in ticks at which to query the key signature
+        Returns the start and end times (in ticks) of each note in this segment, scaled by the segment's
+        ``duration_transform``. These are the times used when writing the segment to a MidiTrack.
 
         Returns:
-            A (time, key_sig) pair consisting of the last key signature, and the time this key signature was changed.
+            A (start_times, end_times) pair of lists containing the scaled time of each note
         """
-        last_key_sig = KeySignature.default()
-        for key_sig_time, key_sig_value in self.key_signature_events:
-            if key_sig_time <= tick_time:
-                last_key_sig = key_sig_value
-            else:
-                break
-        return last_key_sig
+        start_times = [int(time) for time in self.notes.start_times * self.duration_transform]
+        end_times = [int(time) for time in self.notes.end_times * self.duration_transform]
+        return start_times, end_times
 
     def get_number_of_notes(self):
         """
@@ -254,7 +261,7 @@ class NoteSegment(MidiSegment):
         if len(self.notes) == 0:
             return 0
         else:
-            return sum([note.pitch for note in self.notes]) / len(self.notes)
+            return float(np.mean(self.notes.pitches))
 
     def find_shortest_note_length(self) -> Optional[int]:
         """
@@ -263,20 +270,24 @@ class NoteSegment(MidiSegment):
         Returns:
             None if there are no notes present, else the note with the shortest length/duration
         """
-        return min([note.duration for note in self.notes], default=None)
+        if len(self.notes) == 0:
+            return None
+        else:
+            return self.notes.durations.min().item()
 
-    def get_notes_in_time_range(self, range_start: int, range_length: int) -> List[Note]:
+    def get_notes_in_time_range(self, range_start: int, range_length: int) -> NoteArray:
         """
-        Gets a list of notes whose onset times fall within the range [range_start,range_start + range_length)
+        Gets the notes whose onset times fall within the range [range_start,range_start + range_length)
 
         Args:
             range_start: The start of the range
             range_length: The end of the range
 
         Returns:
-            A list of notes who's onset time's occur within the range [range_start,range_start + range_length)
+            A NoteArray of the notes who's onset time's occur within the range [range_start,range_start + range_length)
         """
-        return [note for note in self.notes if (range_start <= note.start_time < range_start + range_length)]
+        start_times = self.notes.start_times
+        return self.notes[(range_start <= start_times) & (start_times < range_start + range_length)]
 
     def save_as_midi(self, filepath):
         """
@@ -323,7 +334,7 @@ class NoteSegment(MidiSegment):
             A new reduced segment based on the above rules. If there are only 0 or 1 notes in this note segment, returns a new, identical segment.
         """
         if self.get_number_of_notes() < 2:
-            return 1, NoteSegment(self._file, self.melody_track_ind, self.notes)
+            return 1, NoteSegment(self.song, self.melody_track_ind, self.notes, signatures=self.signatures)
 
         reduced_notes = []
 
@@ -337,9 +348,31 @@ class NoteSegment(MidiSegment):
 
         weight = 0
 
+        # rather than searching every note for the ones in each window, binary search the onsets (which requires the
+        # notes in order of onset, keeping notes with the same onset in their original order)
+        notes = self.notes.to_notes()
+        # score every note up front (with the time and key signature at its onset)
+        note_scores = list(zip(*(scores.tolist() for scores in scoring.score_notes(
+            self.notes.start_times, self.notes.pitches, self.notes.chord_roots, self.ticks_per_beat,
+            self.signatures))))
+        start_times = self.notes.start_times
+        if np.any(start_times[1:] < start_times[:-1]):
+            onset_order = np.argsort(start_times, kind="stable")
+            start_times = start_times[onset_order]
+        else:
+            onset_order = None
+
         start_position = self.start_time
-        while start_position < self.end_time:
-            window_notes = self.get_notes_in_time_range(int(start_position), window_size)
+        end_time = self.end_time
+        while start_position < end_time:
+            # the notes whose onset times fall within the range [start_position, start_position + window_size)
+            range_start = int(start_position)
+            first, last = np.searchsorted(start_times, [range_start, range_start + window_size], side="left").tolist()
+            if onset_order is None:
+                window_indices = range(first, last)
+            else:
+                window_indices = np.sort(onset_order[first:last]).tolist()
+            window_notes = [notes[index] for index in window_indices]
 
             if len(window_notes) == 0:
                 start_position += window_size
@@ -361,16 +394,7 @@ class NoteSegment(MidiSegment):
                 start_position += new_note.duration
 
             else:  # choose the most relevant note
-                note_weights = []
-
-                for note in window_notes:
-                    time_sig_time, time_sig_value = self.__get_time_signature_at(int(note.start_time))
-                    key_sig_value = self.__get_key_signature_at(int(note.start_time))
-
-                    beat_strength = note.get_metric_strength(self.ticks_per_beat, time_sig_value, time_sig_time)
-                    consonance_score = note.get_consonance_score()
-                    functional_score = note.get_functional_score(key_sig_value)
-                    note_weights.append((beat_strength, consonance_score, functional_score))
+                note_weights = [note_scores[index] for index in window_indices]
 
                 # determine which note was more relevant (and find it's index)
                 strongest_index = 0
@@ -421,7 +445,7 @@ class NoteSegment(MidiSegment):
                 # in the paper this is called the *semantic* distance measure
                 weight += ((strongest_total - prev_strongest_total) / 3)
 
-        return weight, NoteSegment(self._file, self.melody_track_ind, reduced_notes)
+        return weight, NoteSegment(self.song, self.melody_track_ind, reduced_notes, signatures=self.signatures)
 
     def transpose(self, transpose_pitch: int):
         """
@@ -431,10 +455,7 @@ class NoteSegment(MidiSegment):
             transpose_pitch: The amount to move each note up or down pitchwise
         """
         self.transpose_amount += transpose_pitch
-        for note in self.notes:
-            note.pitch += transpose_pitch
-            if note.chord is not None:
-                note.chord.transpose(transpose_pitch)
+        self.notes = self.notes.transpose(transpose_pitch)
 
     def change_duration_transform(self, factor: float = 1):
         """
@@ -458,12 +479,12 @@ class NoteSegment(MidiSegment):
         """
         # change note start & end times after this new note to take it into account
         if index < len(self.notes):
-            for note in self.notes[index:]:
-                note.start_time += tick_length
-                note.end_time += tick_length
-            self.notes.insert(index, Note(int(self.notes[index].start_time - tick_length),
-                                          int(self.notes[index].end_time - tick_length),
-                                          pitch, self.notes[index].channel, self.notes[index].chord))
+            next_note = self.notes[index]
+            # insert returns a copy, so the notes after the new one can be moved in place
+            self.notes = self.notes.insert(index, Note(int(next_note.start_time), int(next_note.end_time),
+                                                       pitch, next_note.channel, next_note.chord))
+            self.notes.start_times[index + 1:] += tick_length
+            self.notes.end_times[index + 1:] += tick_length
 
     def remove_note(self, index: int):
         """
@@ -473,7 +494,7 @@ class NoteSegment(MidiSegment):
             index: The index of the note to remove
         """
         if index in range(len(self.notes)):
-            del self.notes[index]
+            self.notes = self.notes.delete(index)
 
     def __str__(self):
         return str(self.__dict__)
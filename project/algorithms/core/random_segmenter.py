@@ -1,13 +1,14 @@
 from typing import List, Optional
 
-from mido import MidiFile, MidiTrack, bpm2tempo, tick2second
+from mido import MidiFile, MidiTrack
 
 import numpy as np
 
+from project.algorithms.core.feature_cache import get_cached_tempo_map, get_cached_note_timeline
 from project.algorithms.core.midi_segment import MidiSegment
-from project.algorithms.core.midtools import is_note_on, get_notes_in_time_range, get_note_timeline
-from project.algorithms.core.note import Note
+from project.algorithms.core.midtools import get_end_offset, get_time_range_windows
 from project.algorithms.core.note_segment import NoteSegment
+from project.algorithms.core.segment_view import SegmentView
 from project.algorithms.core.segmenter import Segmenter
 
 
@@ -33,40 +34,47 @@ class RandomSegmenter(Segmenter):
         """
         Segment the given MidiFile, producing a random length segment from each note onset. If the
         segment reaches the end of the track before the end of the randomized length, no segment is
-        extracted
+        extracted. Like ``TimeSegmenter``, each segment is a ``SegmentView`` of the note timeline of the track.
 
         Args:
             mid: The MidiFile to segment
             track_index:  track_index: The index of the track to segment with respect to
             **kwargs: Not used in this derived class
 
+        Keyword Args:
+            chord_track: a track of the MIDI file only containing chords, if such a track exists
+            tempo_map: the TempoMap of the track, if it has already been built
+
         Returns:
             A list of NoteSegments of variable length.
         """
         track: MidiTrack = mid.tracks[track_index]
         if "chord_track" in kwargs and kwargs["chord_track"] is not None:
             chord_track_ind = kwargs["chord_track"]
-            chord_track = mid.tracks[chord_track_ind]
         else:
             chord_track_ind = None
-            chord_track = None
+        if "tempo_map" in kwargs and kwargs["tempo_map"] is not None:
+            tempo_map = kwargs["tempo_map"]
+        else:
+            tempo_map = get_cached_tempo_map(mid, track_index)
         time_segments = []
-        delta_t = 0
-        tempo = bpm2tempo(120)
         if self.seed is not None:
             rand: np.random.Generator = np.random.default_rng(int(self.seed))
         else:
             rand: np.random.Generator = np.random.default_rng()
 
+        # a length is drawn for every message of the track, and each segment uses the length of its note_on message
         lengths: np.ndarray = (rand.random(len(track)) * (self.max_length - self.min_length)) + self.min_length
-        for i, msg in enumerate(track):
-            delta_t += tick2second(msg.time, mid.ticks_per_beat, tempo)
-            if is_note_on(msg):
-                notes = get_notes_in_time_range(track, mid.ticks_per_beat, delta_t, delta_t + lengths[i],
-                                                allow_smaller=False, use_midi_times=True, chord_track=chord_track)
-                if len(notes) > 0:
-                    time_segments.append(NoteSegment(mid, track_index, notes, chord_track_ind=chord_track_ind))
-            elif msg.type == "set_tempo":
-                tempo = msg.tempo
+        timeline = get_cached_note_timeline(mid, track_index, chord_track_ind)
+        onsets = tempo_map.message_seconds[timeline.start_message_indices]
+        ends = onsets + lengths[timeline.start_message_indices]
+        first, stop = get_time_range_windows(timeline, tempo_map, onsets, ends)
+        # segments which would go past the end of the track aren't extracted
+        end_offset = get_end_offset(track, mid.ticks_per_beat, tempo_map)[0]
+
+        for i in range(len(timeline)):
+            if ends[i] <= end_offset and stop[i] > first[i]:
+                time_segments.append(NoteSegment(mid, track_index, SegmentView(timeline, int(first[i]), int(stop[i])),
+                                                 chord_track_ind=chord_track_ind))
 
         return time_segments
@@ -0,0 +1,193 @@
+from typing import List, Optional, Union
+
+import numpy as np
+from mido import MidiFile
+
+from project.algorithms.core.batch_reduction import BatchReduction
+from project.algorithms.core.chord import Chord
+from project.algorithms.core.note_array import NoteArray
+from project.algorithms.core.note_segment import NoteSegment
+from project.algorithms.core.smf_reader import SmfFile
+from project.algorithms.core.song_registry import Song
+
+
+class ReductionHierarchy:
+
+    def __init__(self, start_times: np.ndarray, end_times: np.ndarray, pitches: np.ndarray, channels: np.ndarray,
+                 chord_ids: np.ndarray, chords: List[Chord], offsets: np.ndarray, weights: np.ndarray):
+        """
+        A segment and all of its reductions (see ``NoteSegment.reduce_segment``), stored compactly: the notes of every
+        level are held in one set of arrays, with level ``i`` being the notes ``offsets[i]:offsets[i + 1]``. Level 0
+        is the original segment, and each level after it is the reduction of the level before. Unlike a NoteSegment,
+        a hierarchy doesn't refer to the MIDI file it's from, and its integer arrays use the smallest type that holds
+        their values, so it's small to store (e.g. in a graph); a level is only turned back into notes or a NoteSegment
+        when it's needed (see ``get_notes`` and ``get_segment``). The fingerprint of each level (see
+        ``NoteArray.fingerprint``) is computed up front and stored with it, so levels can be compared with other notes
+        without turning them back into notes.
+
+        Use ``ReductionHierarchy.from_batch_reduction`` to create the hierarchies of a set of segments.
+
+        Args:
+            start_times: The start time (in ticks) of each note of every level
+            end_times: The end time (in ticks) of each note of every level
+            pitches: The pitch of each note of every level
+            channels: The MIDI channel of each note of every level
+            chord_ids: The index within ``chords`` of the underlying chord of each note (-1 for no chord)
+            chords: The table of chords that ``chord_ids`` refer to (which may be shared with other hierarchies)
+            offsets: The index of the first note of each level, followed by the total number of notes
+            weights: The weight of the reduction from the previous level to each level (0 for level 0)
+        """
+        self.start_times = start_times
+        self.end_times = end_times
+        self.pitches = pitches
+        self.channels = channels
+        self.chord_ids = chord_ids
+        self.chords = chords
+        self.offsets = offsets
+        self.weights = weights
+        self.fingerprints = np.array([self.get_notes(level).fingerprint for level in range(self.num_levels)],
+                                     dtype=np.uint64)
+
+    @staticmethod
+    def from_batch_reduction(reduction: BatchReduction) -> List["ReductionHierarchy"]:
+        """
+        Split a BatchReduction into the hierarchy of each of its segments. The hierarchies share the chord table of
+        the reduction.
+
+        Args:
+            reduction: The reductions of a set of segments
+
+        Returns:
+            A list containing the ReductionHierarchy of each segment, in the same order as the segments
+        """
+        num_segments = int(reduction.segment_indices.max()) + 1 if len(reduction) > 0 else 0
+        # the rows of each segment, in order of segment then level
+        row_order = np.argsort(reduction.segment_indices, kind="stable")
+        segment_rows = np.split(row_order, np.cumsum(np.bincount(reduction.segment_indices,
+                                                                 minlength=num_segments))[:-1])
+        notes = reduction.notes
+        hierarchies = []
+        for rows in segment_rows:
+            counts = reduction.offsets[rows + 1] - reduction.offsets[rows]
+            note_indices = np.repeat(reduction.offsets[rows] - (np.cumsum(counts) - counts), counts) + \
+                np.arange(counts.sum())
+            compact = ReductionHierarchy.__compact
+            hierarchies.append(ReductionHierarchy(compact(notes.start_times[note_indices]),
+                                                  compact(notes.end_times[note_indices]),
+                                                  compact(notes.pitches[note_indices]),
+                                                  compact(notes.channels[note_indices]),
+                                                  compact(notes.chord_ids[note_indices]), notes.chords,
+                                                  compact(np.cumsum(np.concatenate(([0], counts)), dtype=np.int64)),
+                                                  reduction.weights[rows]))
+        return hierarchies
+
+    @staticmethod
+    def __compact(values: np.ndarray) -> np.ndarray:
+        """
+        Store an array of integers using the smallest type that can hold all of its values. Other arrays are returned
+        unchanged.
+
+        Args:
+            values: The array to store
+
+        Returns:
+            An array with the same values, using as little memory as possible
+        """
+        if not np.issubdtype(values.dtype, np.integer) or len(values) == 0:
+            return values
+        return values.astype(np.result_type(np.min_scalar_type(values.min()), np.min_scalar_type(values.max())))
+
+    @staticmethod
+    def __expand(values: np.ndarray) -> np.ndarray:
+        """
+        Return a (compact) array of integers as 64-bit integers, so that arithmetic on them can't overflow. Other
+        arrays are returned unchanged.
+
+        Args:
+            values: The stored array
+
+        Returns:
+            The same values, as 64-bit integers if they're integers
+        """
+        return values.astype(np.int64) if np.issubdtype(values.dtype, np.integer) else values
+
+    @property
+    def num_levels(self) -> int:
+        """
+        Returns the number of levels in this hierarchy (including level 0, the original segment)
+
+        Returns:
+            The number of levels
+        """
+        return len(self.offsets) - 1
+
+    def get_weight(self, level: int) -> float:
+        """
+        Returns the weight of the reduction from level ``level - 1`` to ``level``, as given by ``reduce_segment``
+
+        Args:
+            level: The level of the reduction (at least 1)
+
+        Returns:
+            The weight of the reduction
+        """
+        return float(self.weights[level])
+
+    def get_number_of_notes(self, level: int) -> int:
+        """
+        Returns the number of notes in a level of this hierarchy
+
+        Args:
+            level: The level (0 for the original segment)
+
+        Returns:
+            The number of notes in the level
+        """
+        return int(self.offsets[level + 1]) - int(self.offsets[level])
+
+    def get_fingerprint(self, level: int) -> int:
+        """
+        Returns the fingerprint of the notes of a level of this hierarchy (see ``NoteArray.fingerprint``)
+
+        Args:
+            level: The level (0 for the original segment)
+
+        Returns:
+            The fingerprint of the level
+        """
+        return int(self.fingerprints[level])
+
+    def get_notes(self, level: int) -> NoteArray:
+        """
+        Returns the notes of a level of this hierarchy
+
+        Args:
+            level: The level (0 for the original segment)
+
+        Returns:
+            A NoteArray containing the notes of the level
+        """
+        first, last = int(self.offsets[level]), int(self.offsets[level + 1])
+        expand = ReductionHierarchy.__expand
+        return NoteArray(expand(self.start_times[first:last]), expand(self.end_times[first:last]),
+                         expand(self.pitches[first:last]), expand(self.channels[first:last]),
+                         expand(self.chord_ids[first:last]), self.chords)
+
+    def get_segment(self, level: int, file: Union[MidiFile, SmfFile, Song], melody_track_ind: int,
+                    chord_track_ind: Optional[int] = None) -> NoteSegment:
+        """
+        Create a NoteSegment of a level of this hierarchy, e.g. to save it as a MIDI file
+
+        Args:
+            level: The level (0 for the original segment)
+            file: The MIDI file the segment is from (or its Song)
+            melody_track_ind: The index of the track the segment is from
+            chord_track_ind: The index of the track the chords of the MIDI file are contained in, if it exists
+
+        Returns:
+            A NoteSegment containing the notes of the level
+        """
+        return NoteSegment(file, melody_track_ind, self.get_notes(level), chord_track_ind)
+
+    def __len__(self) -> int:
+        return self.num_levels
@@ -0,0 +1,159 @@
+"""
+The scores used to decide which notes are kept when a segment is reduced (see ``NoteSegment.reduce_segment``). The
+dictionaries in ``constants`` are turned into dense tables once, so a whole array of notes can be scored with a few
+array lookups instead of several dictionary lookups per note.
+"""
+from collections import Counter
+from typing import Dict, Tuple
+
+import numpy as np
+
+import project.algorithms.core.constants as constants
+from project.algorithms.core.signature_timeline import SignatureTimeline
+from project.algorithms.graph_based.signature import TimeSignature
+
+# the number of beats in the longest bar in constants.BEAT_STRENGTH_DICT
+MAX_BEATS = max(len(strengths) for strengths in constants.BEAT_STRENGTH_DICT.values())
+
+# the beat strengths of each time signature in constants.BEAT_STRENGTH_DICT (one row per time signature), followed by
+# the strengths used for any other time signature
+BEAT_STRENGTH_TABLE = np.array([strengths + [0] * (MAX_BEATS - len(strengths))
+                                for strengths in constants.BEAT_STRENGTH_DICT.values()] +
+                               [[0.1, 0.4] + [0.1] * (MAX_BEATS - 2)])
+# the row of BEAT_STRENGTH_TABLE of each time signature
+BEAT_STRENGTH_ROWS: Dict[Tuple[int, int], int] = {signature: row for row, signature in
+                                                  enumerate(constants.BEAT_STRENGTH_DICT.keys())}
+UNKNOWN_TIME_SIGNATURE_ROW = len(BEAT_STRENGTH_ROWS)
+
+# the consonance score of each pitch class (rows) against each chord root (columns)
+CONSONANCE_TABLE = np.array([[constants.CONSONANCE_SCORE_DICT[abs(root - pitch_class)]
+                              for root in range(constants.OCTAVE_SEMITONE_COUNT)]
+                             for pitch_class in range(constants.OCTAVE_SEMITONE_COUNT)])
+# the functional score of each chord root (rows) against each key (columns)
+FUNCTIONAL_TABLE = np.array([[constants.FUNCTIONAL_SCORE_DICT[abs(key - root)]
+                              for key in range(constants.OCTAVE_SEMITONE_COUNT)]
+                             for root in range(constants.OCTAVE_SEMITONE_COUNT)])
+# the score of a note with no underlying chord
+NO_CHORD_SCORE = 0.5
+
+# how many notes have been scored in each time signature that isn't in constants.BEAT_STRENGTH_DICT
+_unknown_time_signatures: Counter = Counter()
+
+
+def count_unknown_time_signature(time_signature: TimeSignature, count: int = 1):
+    """
+    Record that notes have been scored in a time signature that has no beat strengths (so a default was used)
+
+    Args:
+        time_signature: The time signature
+        count: The number of notes
+    """
+    _unknown_time_signatures[time_signature] += count
+
+
+def get_unknown_time_signature_counts() -> Dict[TimeSignature, int]:
+    """
+    Returns how many notes have been scored in each time signature with no beat strengths, since the counts were last
+    reset (see ``reset_unknown_time_signature_counts``)
+
+    Returns:
+        A dictionary from each unknown time signature to the number of notes scored in it
+    """
+    return dict(_unknown_time_signatures)
+
+
+def reset_unknown_time_signature_counts():
+    """
+    Forget the number of notes scored in each unknown time signature
+    """
+    _unknown_time_signatures.clear()
+
+
+def get_metric_strengths(start_times: np.ndarray, ticks_per_beat: int, signatures: SignatureTimeline) -> np.ndarray:
+    """
+    Returns the metrical strength of each note, as ``Note.get_metric_strength`` would.
+
+    Args:
+        start_times: The start time (in ticks) of each note
+        ticks_per_beat: The ticks_per_beat of the MIDI file the notes are contained within
+        signatures: The time signatures of the track the notes are from
+
+    Returns:
+        An array containing the metrical strength of each note
+    """
+    if len(start_times) == 0:
+        return np.empty(0)
+
+    # look up each time signature of the track once
+    time_signatures = signatures.time_signatures
+    signature_indices = signatures.time_signature_indices(np.asarray(start_times))
+    numerators = np.array([signature.numerator for signature in time_signatures])[signature_indices]
+    denominators = np.array([signature.denominator for signature in time_signatures])[signature_indices]
+    rows = np.array([BEAT_STRENGTH_ROWS.get((signature.numerator, signature.denominator), UNKNOWN_TIME_SIGNATURE_ROW)
+                     for signature in time_signatures])[signature_indices]
+
+    ticks_since_time_signature = np.asarray(start_times) - signatures.time_signature_ticks[signature_indices]
+    bar_lengths = ticks_per_beat * (numerators * (4 / denominators))
+    beat_indices = np.round((ticks_since_time_signature % bar_lengths) / ticks_per_beat).astype(np.int64) % numerators
+
+    unknown = rows == UNKNOWN_TIME_SIGNATURE_ROW
+    if np.any(unknown):
+        for signature_index, count in zip(*np.unique(signature_indices[unknown], return_counts=True)):
+            count_unknown_time_signature(time_signatures[signature_index], int(count))
+        # only the first two beats of the default strengths differ
+        beat_indices[unknown] = np.minimum(beat_indices[unknown], MAX_BEATS - 1)
+
+    return BEAT_STRENGTH_TABLE[rows, beat_indices]
+
+
+def get_consonance_scores(pitches: np.ndarray, chord_roots: np.ndarray) -> np.ndarray:
+    """
+    Returns the consonance score of each note, as ``Note.get_consonance_score`` would.
+
+    Args:
+        pitches: The pitch of each note
+        chord_roots: The root tone of the underlying chord of each note, or -1 if the note has no chord
+
+    Returns:
+        An array containing the consonance score of each note
+    """
+    pitch_classes = np.asarray(pitches).astype(np.int64) % constants.OCTAVE_SEMITONE_COUNT
+    root_classes = np.asarray(chord_roots) % constants.OCTAVE_SEMITONE_COUNT
+    return np.where(np.asarray(chord_roots) < 0, NO_CHORD_SCORE, CONSONANCE_TABLE[pitch_classes, root_classes])
+
+
+def get_functional_scores(chord_roots: np.ndarray, key_notes: np.ndarray) -> np.ndarray:
+    """
+    Returns the functional score of each note, as ``Note.get_functional_score`` would.
+
+    Args:
+        chord_roots: The root tone of the underlying chord of each note, or -1 if the note has no chord
+        key_notes: The pitch class of the key signature in effect at the start of each note
+
+    Returns:
+        An array containing the functional score of each note
+    """
+    root_classes = np.asarray(chord_roots) % constants.OCTAVE_SEMITONE_COUNT
+    return np.where(np.asarray(chord_roots) < 0, NO_CHORD_SCORE, FUNCTIONAL_TABLE[root_classes, np.asarray(key_notes)])
+
+
+def score_notes(start_times: np.ndarray, pitches: np.ndarray, chord_roots: np.ndarray, ticks_per_beat: int,
+                signatures: SignatureTimeline) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Returns the metrical, consonance and functional scores of a whole array of notes at once.
+
+    Args:
+        start_times: The start time (in ticks) of each note
+        pitches: The pitch of each note
+        chord_roots: The root tone of the underlying chord of each note, or -1 if the note has no chord (see
+            ``NoteArray.chord_roots``)
+        ticks_per_beat: The ticks_per_beat of the MIDI file the notes are contained within
+        signatures: The time and key signatures of the track the notes are from
+
+    Returns:
+        A (metrical strengths, consonance scores, functional scores) tuple of arrays, with one score per note
+    """
+    key_notes = signatures.key_notes[signatures.key_signature_indices(np.asarray(start_times))]
+    return (get_metric_strengths(start_times, ticks_per_beat, signatures),
+            get_consonance_scores(pitches, chord_roots),
+            get_functional_scores(chord_roots, key_notes))
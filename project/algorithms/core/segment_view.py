@@ -0,0 +1,61 @@
+from typing import Optional
+
+from project.algorithms.core.note_array import NoteArray
+
+
+class SegmentView:
+
+    def __init__(self, timeline: NoteArray, start: int, stop: int):
+        """
+        A segment of a track as a window ``[start, stop)`` over the track's note timeline, rather than a copy of the
+        notes within it. Every view of a track shares the same timeline, so creating many (possibly overlapping)
+        segments of a track doesn't copy any notes, and pickling them together only stores the timeline once.
+
+        Args:
+            timeline: The notes of the whole track (e.g. from ``get_cached_note_timeline``)
+            start: The index of the first note of the segment within the timeline
+            stop: The index just after the last note of the segment within the timeline
+        """
+        self.timeline = timeline
+        self.start = start
+        self.stop = stop
+        self.__notes: Optional[NoteArray] = None
+
+    @staticmethod
+    def of(notes: NoteArray) -> "SegmentView":
+        """
+        Returns a view of all of ``notes``
+
+        Args:
+            notes: The notes to view
+
+        Returns:
+            A SegmentView whose timeline is ``notes``
+        """
+        return SegmentView(notes, 0, len(notes))
+
+    @property
+    def notes(self) -> NoteArray:
+        """
+        Returns the notes of this segment, which share their memory with the timeline
+
+        Returns:
+            A NoteArray of the notes within this view
+        """
+        if self.__notes is None:
+            self.__notes = self.timeline[self.start:self.stop]
+        return self.__notes
+
+    def __getstate__(self):
+        # the notes are only a slice of the timeline, so they aren't stored
+        return self.timeline, self.start, self.stop
+
+    def __setstate__(self, state):
+        self.timeline, self.start, self.stop = state
+        self.__notes = None
+
+    def __repr__(self):
+        return f"SegmentView({self.start}:{self.stop}, {self.notes})"
+
+    def __len__(self) -> int:
+        return self.stop - self.start
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import List
+from typing import List, Iterator, Sequence
 
 from mido import MidiFile
 
@@ -29,3 +29,35 @@ class Segmenter(ABC):
         """
         pass
 
+
+    def iter_segments(self, mid: MidiFile, track_index: int, **kwargs) -> Iterator[MidiSegment]:
+        """
+        Yields the ``MidiSegments`` of the given MidiFile ``mid`` one at a time. By default, this creates every segment
+        with ``create_segments`` first; Segmenters which can segment a track as its notes are read (e.g. with
+        ``midtools.iter_notes``) override this, so very long files can be segmented without holding every note in
+        memory.
+
+        Args:
+            mid: The MIDI file to segment
+            track_index: The index of the track to segment with respect to
+            **kwargs: Any extra arguments that may be needed
+
+        Returns:
+            An iterator over the segments created by running some segmentation algorithm
+        """
+        yield from self.create_segments(mid, track_index, **kwargs)
+
+    def create_batch_segments(self, mids: Sequence[MidiFile], track_index: int, **kwargs) -> List[List[MidiSegment]]:
+        """
+        Creates the ``MidiSegments`` of each of the given MIDI files (e.g. every song of a corpus). By default, this
+        calls ``create_segments`` for each file in turn; Segmenters which can segment many files at once override it.
+
+        Args:
+            mids: The MIDI files to segment
+            track_index: The index of the track to segment with respect to (in every file)
+            **kwargs: Any extra arguments that may be needed
+
+        Returns:
+            A list containing the list of segments of each file, in the same order as the files
+        """
+        return [self.create_segments(mid, track_index, **kwargs) for mid in mids]
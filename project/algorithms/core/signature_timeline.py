@@ -0,0 +1,82 @@
+from typing import List, Tuple, Union
+
+import numpy as np
+
+from project.algorithms.graph_based.signature import TimeSignature, KeySignature
+
+
+class SignatureTimeline:
+
+    def __init__(self, time_signatures: List[Tuple[int, TimeSignature]],
+                 key_signatures: List[Tuple[int, KeySignature]]):
+        """
+        The time and key signatures of a track, and when each of them starts. Like ``TempoMap``, the changes are
+        stored as sorted arrays of ticks, so the signature in effect at any time is a binary search away (and the
+        signatures of a whole array of times can be found at once). A timeline is built once for each track and
+        shared between every segment (and reduction) of it, so it must not be modified.
+
+        Until the first change of each, the default time and key signatures (4/4, C major) are in effect from tick 0.
+
+        Args:
+            time_signatures: A list of (time, time signature) pairs, in order (see ``get_track_signatures``)
+            key_signatures: A list of (time, key signature) pairs, in order (see ``get_track_signatures``)
+        """
+        self.time_signature_ticks = np.array([0] + [time for time, _ in time_signatures], dtype=np.int64)
+        self.time_signatures = [TimeSignature.default()] + [signature for _, signature in time_signatures]
+        self.key_signature_ticks = np.array([0] + [time for time, _ in key_signatures], dtype=np.int64)
+        self.key_signatures = [KeySignature.default()] + [signature for _, signature in key_signatures]
+        # the pitch class of each key signature
+        self.key_notes = np.array([signature.note for signature in self.key_signatures], dtype=np.int64)
+
+    def time_signature_indices(self, ticks: Union[int, np.ndarray]) -> Union[int, np.ndarray]:
+        """
+        Returns the index (within ``time_signatures``) of the time signature in effect at each of the given times
+
+        Args:
+            ticks: A single time, or an array of times, in ticks
+
+        Returns:
+            The index of the last time signature to start at or before each time. An int is returned if ``ticks`` is a
+            single value, otherwise a numpy array
+        """
+        indices = np.maximum(np.searchsorted(self.time_signature_ticks, ticks, side="right") - 1, 0)
+        return int(indices) if indices.ndim == 0 else indices
+
+    def key_signature_indices(self, ticks: Union[int, np.ndarray]) -> Union[int, np.ndarray]:
+        """
+        Returns the index (within ``key_signatures``) of the key signature in effect at each of the given times
+
+        Args:
+            ticks: A single time, or an array of times, in ticks
+
+        Returns:
+            The index of the last key signature to start at or before each time. An int is returned if ``ticks`` is a
+            single value, otherwise a numpy array
+        """
+        indices = np.maximum(np.searchsorted(self.key_signature_ticks, ticks, side="right") - 1, 0)
+        return int(indices) if indices.ndim == 0 else indices
+
+    def time_signature_at(self, tick: int) -> Tuple[int, TimeSignature]:
+        """
+        Returns what the time signature is at the given time in ticks
+
+        Args:
+            tick: The time in ticks at which to query the time signature
+
+        Returns:
+            A (time, time_sig) pair consisting of the last time signature, and the time this time signature was changed.
+        """
+        index = self.time_signature_indices(tick)
+        return int(self.time_signature_ticks[index]), self.time_signatures[index]
+
+    def key_signature_at(self, tick: int) -> KeySignature:
+        """
+        Returns what the key signature is at the given time in ticks
+
+        Args:
+            tick: The time in ticks at which to query the key signature
+
+        Returns:
+            The last key signature to start at or before the given time
+        """
+        return self.key_signatures[self.key_signature_indices(tick)]
@@ -0,0 +1,347 @@
+"""
+A reader for Standard MIDI Files (SMF) which decodes each track straight into numpy arrays, rather than creating a
+mido ``Message`` object for every event. mido is still used to *write* MIDI files.
+"""
+import hashlib
+import struct
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+from mido import Message, MetaMessage
+from mido.midifiles.meta import build_meta_message
+
+META_STATUS = 0xFF
+NOTE_OFF_STATUS = 0x80
+NOTE_ON_STATUS = 0x90
+CONTROL_CHANGE_STATUS = 0xB0
+PROGRAM_CHANGE_STATUS = 0xC0
+
+TRACK_NAME_META = 0x03
+END_OF_TRACK_META = 0x2F
+SET_TEMPO_META = 0x51
+TIME_SIGNATURE_META = 0x58
+KEY_SIGNATURE_META = 0x59
+
+# key signature names (using mido's formatting), indexed by the number of sharps (negative for flats) + 7
+MAJOR_KEY_NAMES = ["Cb", "Gb", "Db", "Ab", "Eb", "Bb", "F", "C", "G", "D", "A", "E", "B", "F#", "C#"]
+MINOR_KEY_NAMES = ["Ab", "Eb", "Bb", "F", "C", "G", "D", "A", "E", "B", "F#", "C#", "G#", "D#", "A#"]
+
+# the type of each message (as named by mido), by its status (without the channel)
+MESSAGE_TYPE_NAMES = {0x80: "note_off", 0x90: "note_on", 0xA0: "polytouch", 0xB0: "control_change",
+                      0xC0: "program_change", 0xD0: "aftertouch", 0xE0: "pitchwheel", 0xF0: "sysex", 0xF7: "sysex",
+                      0xF1: "quarter_frame", 0xF2: "songpos", 0xF3: "song_select", 0xF6: "tune_request", 0xF8: "clock",
+                      0xFA: "start", 0xFB: "continue", 0xFC: "stop", 0xFE: "active_sensing"}
+# the type of each meta message (as named by mido), by its meta type
+META_TYPE_NAMES = {0x00: "sequence_number", 0x01: "text", 0x02: "copyright", 0x03: "track_name",
+                   0x04: "instrument_name", 0x05: "lyrics", 0x06: "marker", 0x07: "cue_marker", 0x09: "device_name",
+                   0x20: "channel_prefix", 0x21: "midi_port", 0x2F: "end_of_track", 0x51: "set_tempo",
+                   0x54: "smpte_offset", 0x58: "time_signature", 0x59: "key_signature", 0x7F: "sequencer_specific"}
+
+# the number of data bytes following each status byte (channel messages are indexed by their upper nibble)
+_CHANNEL_DATA_LENGTHS = {0x80: 2, 0x90: 2, 0xA0: 2, 0xB0: 2, 0xC0: 1, 0xD0: 1, 0xE0: 2}
+_SYSTEM_DATA_LENGTHS = {0xF1: 1, 0xF2: 2, 0xF3: 1, 0xF6: 0, 0xF8: 0, 0xFA: 0, 0xFB: 0, 0xFC: 0, 0xFE: 0}
+
+
+class SmfTrack:
+
+    def __init__(self, delta_ticks: np.ndarray, statuses: np.ndarray, channels: np.ndarray, data1: np.ndarray,
+                 data2: np.ndarray, meta_types: np.ndarray, payload: Union[bytes, np.ndarray],
+                 payload_offsets: np.ndarray, payload_lengths: np.ndarray, ticks: Optional[np.ndarray] = None):
+        """
+        A single track (MTrk chunk) of a Standard MIDI File, stored as a *struct of arrays*: one numpy array per
+        field of the events in the track. This holds the same events that a mido ``MidiTrack`` would, so index ``i``
+        of each array describes the i-th message of the equivalent MidiTrack. Use ``SmfTrack.from_bytes`` to decode
+        a track chunk.
+
+        Fields which aren't relevant to an event are set to -1 (e.g. the channel of a meta message). For channel
+        messages ``statuses`` holds the status without the channel (e.g. 0x90 for every note_on), for meta messages
+        it is 0xFF and for sysex messages 0xF0 or 0xF7. The data of meta and sysex messages is kept in ``payload``,
+        with ``payload_offsets`` and ``payload_lengths`` locating the data of each event.
+
+        Args:
+            delta_ticks: the time (in ticks) since the previous event, of each event
+            statuses: the status of each event (without the channel)
+            channels: the channel of each event
+            data1: the first data byte of each event (e.g. the note of a note_on)
+            data2: the second data byte of each event (e.g. the velocity of a note_on)
+            meta_types: the type of each meta event (e.g. 0x51 for set_tempo)
+            payload: the buffer containing the data of the meta and sysex events
+            payload_offsets: the start of the data of each event within ``payload``
+            payload_lengths: the length of the data of each event
+            ticks: the absolute time (in ticks) of each event. If None, it is computed from ``delta_ticks``
+        """
+        self.payload = payload
+        self.delta_ticks = delta_ticks
+        self.ticks = np.cumsum(delta_ticks) if ticks is None else ticks
+        self.statuses = statuses
+        self.channels = channels
+        self.data1 = data1
+        self.data2 = data2
+        self.meta_types = meta_types
+        self.payload_offsets = payload_offsets
+        self.payload_lengths = payload_lengths
+        # a note_on with a velocity of 0 is a note_off
+        self.note_on_mask = (self.statuses == NOTE_ON_STATUS) & (self.data2 > 0)
+        self.note_off_mask = (self.statuses == NOTE_OFF_STATUS) | ((self.statuses == NOTE_ON_STATUS) &
+                                                                   (self.data2 == 0))
+
+    @staticmethod
+    def from_bytes(data: bytes) -> "SmfTrack":
+        """
+        Decode the events of a track chunk of a Standard MIDI File, without creating an object for each event.
+
+        Args:
+            data: The contents of the MTrk chunk (not including the chunk header)
+
+        Returns:
+            The decoded track
+        """
+        delta_ticks = []
+        statuses = []
+        channels = []
+        data1 = []
+        data2 = []
+        meta_types = []
+        payload_offsets = []
+        payload_lengths = []
+
+        position = 0
+        last_status = None
+        while position < len(data):
+            delta, position = SmfTrack.__read_variable_int(data, position)
+            status = data[position]
+            if status < 0x80:
+                # running status: this byte is the first data byte of a message with the previous status
+                if last_status is None:
+                    raise OSError("running status without last_status")
+                status = last_status
+            else:
+                position += 1
+                if status != META_STATUS:
+                    # meta messages don't set running status
+                    last_status = status
+
+            delta_ticks.append(delta)
+            if status == META_STATUS:
+                meta_types.append(data[position])
+                length, position = SmfTrack.__read_variable_int(data, position + 1)
+                statuses.append(META_STATUS)
+                channels.append(-1)
+                data1.append(-1)
+                data2.append(-1)
+                payload_offsets.append(position)
+                payload_lengths.append(length)
+                position += length
+            elif status == 0xF0 or status == 0xF7:
+                length, position = SmfTrack.__read_variable_int(data, position)
+                statuses.append(status)
+                channels.append(-1)
+                data1.append(-1)
+                data2.append(-1)
+                meta_types.append(-1)
+                payload_offsets.append(position)
+                payload_lengths.append(length)
+                position += length
+            else:
+                if status < 0xF0:
+                    num_data_bytes = _CHANNEL_DATA_LENGTHS[status & 0xF0]
+                    statuses.append(status & 0xF0)
+                    channels.append(status & 0x0F)
+                elif status in _SYSTEM_DATA_LENGTHS:
+                    num_data_bytes = _SYSTEM_DATA_LENGTHS[status]
+                    statuses.append(status)
+                    channels.append(-1)
+                else:
+                    raise OSError(f"undefined status byte 0x{status:02x}")
+                data1.append(data[position] if num_data_bytes > 0 else -1)
+                data2.append(data[position + 1] if num_data_bytes > 1 else -1)
+                meta_types.append(-1)
+                payload_offsets.append(-1)
+                payload_lengths.append(0)
+                position += num_data_bytes
+
+        return SmfTrack(np.array(delta_ticks, dtype=np.int64), np.array(statuses, dtype=np.int16),
+                        np.array(channels, dtype=np.int8), np.array(data1, dtype=np.int16),
+                        np.array(data2, dtype=np.int16), np.array(meta_types, dtype=np.int16), data,
+                        np.array(payload_offsets, dtype=np.int64), np.array(payload_lengths, dtype=np.int64))
+
+    @staticmethod
+    def __read_variable_int(data: bytes, position: int) -> Tuple[int, int]:
+        """
+        Read a variable length quantity (as used for delta times and lengths in MIDI files) from ``data``.
+
+        Args:
+            data: The bytes to read from
+            position: The index of the first byte of the quantity
+
+        Returns:
+            A (value, position) pair, where position is the index of the first byte after the quantity
+        """
+        value = 0
+        while True:
+            byte = data[position]
+            position += 1
+            value = (value << 7) | (byte & 0x7F)
+            if byte < 0x80:
+                return value, position
+
+    @property
+    def name(self) -> str:
+        """
+        Returns the name of the track (the text of its first track_name message), or "" if it has none. This is the
+        same as ``MidiTrack.name``.
+
+        Returns:
+            The name of the track
+        """
+        name_indices = np.flatnonzero(self.meta_types == TRACK_NAME_META)
+        if len(name_indices) == 0:
+            return ""
+        return self.get_payload(int(name_indices[0])).decode("latin1")
+
+    def get_payload(self, index: int) -> bytes:
+        """
+        Return the data of the meta or sysex message at ``index``
+
+        Args:
+            index: The index of the message in the track
+
+        Returns:
+            The data bytes of the message. For any other type of message this is empty
+        """
+        offset = int(self.payload_offsets[index])
+        return bytes(self.payload[offset:offset + int(self.payload_lengths[index])])
+
+    def get_tempo(self, index: int) -> int:
+        """
+        Decode the set_tempo message at ``index``
+
+        Args:
+            index: The index of the message in the track
+
+        Returns:
+            The tempo set by the message (in microseconds per beat)
+        """
+        payload = self.get_payload(index)
+        return (payload[0] << 16) | (payload[1] << 8) | payload[2]
+
+    def get_time_signature(self, index: int) -> Tuple[int, int]:
+        """
+        Decode the time_signature message at ``index``
+
+        Args:
+            index: The index of the message in the track
+
+        Returns:
+            A (numerator, denominator) pair
+        """
+        payload = self.get_payload(index)
+        return payload[0], 2 ** payload[1]
+
+    def get_key_signature(self, index: int) -> str:
+        """
+        Decode the key_signature message at ``index``
+
+        Args:
+            index: The index of the message in the track
+
+        Returns:
+            The key of the message as formatted by mido e.g. "C", "F#" or "Ebm"
+        """
+        payload = self.get_payload(index)
+        sharps = struct.unpack("b", payload[0:1])[0]
+        if payload[1] == 1:
+            return MINOR_KEY_NAMES[sharps + 7] + "m"
+        else:
+            return MAJOR_KEY_NAMES[sharps + 7]
+
+    def to_message(self, index: int) -> Union[Message, MetaMessage]:
+        """
+        Create the mido message for the event at ``index`` (with the same delta time), so it can be written to a
+        MidiFile. This is only needed when saving MIDI files.
+
+        Args:
+            index: The index of the message in the track
+
+        Returns:
+            A mido message identical to the one mido would have read from the file.
+        """
+        status = int(self.statuses[index])
+        delta = int(self.delta_ticks[index])
+        if status == META_STATUS:
+            return build_meta_message(int(self.meta_types[index]), list(self.get_payload(index)), delta)
+        elif status == 0xF0 or status == 0xF7:
+            data = list(self.get_payload(index))
+            # mido strips the start and end bytes of sysex data
+            if data and data[0] == 0xF0:
+                data = data[1:]
+            if data and data[-1] == 0xF7:
+                data = data[:-1]
+            return Message("sysex", data=data, time=delta)
+        else:
+            message_bytes = [status if self.channels[index] < 0 else status | int(self.channels[index])]
+            message_bytes.extend(int(byte) for byte in (self.data1[index], self.data2[index]) if byte >= 0)
+            return Message.from_bytes(message_bytes, time=delta)
+
+    def __len__(self) -> int:
+        return len(self.statuses)
+
+
+class SmfFile:
+
+    def __init__(self, filename: Optional[str] = None, type: int = 1, ticks_per_beat: int = 480,
+                 tracks: Optional[List[SmfTrack]] = None, content_hash: Optional[str] = None,
+                 corpus_path: Optional[str] = None, corpus_index: Optional[int] = None):
+        """
+        A Standard MIDI File read with ``SmfTrack`` tracks instead of mido MidiTracks. Only the attributes of a mido
+        ``MidiFile`` used by this project are provided (so ``MidiSegment.get_file_metadata`` works with either).
+
+        Args:
+            filename: The path to the MIDI file. The file is read unless ``tracks`` is given.
+            type: The type (format) of the MIDI file, if it isn't read from ``filename``
+            ticks_per_beat: The ticks per beat of the MIDI file, if it isn't read from ``filename``
+            tracks: The tracks of the MIDI file, if they have already been read (e.g. from a packed corpus)
+            content_hash: The hash of the contents of the MIDI file, if it isn't read from ``filename``. This
+                identifies the file in the feature cache.
+            corpus_path: The path of the corpus the file was read from, if it was read from one (see ``Corpus``)
+            corpus_index: The index of the file within that corpus
+        """
+        self.filename = filename
+        self.type = type
+        self.ticks_per_beat = ticks_per_beat
+        self.charset = "latin1"
+        self.debug = False
+        self.clip = False
+        self.tracks: List[SmfTrack] = []
+        self.content_hash = content_hash
+        self.corpus_path = corpus_path
+        self.corpus_index = corpus_index
+
+        if tracks is not None:
+            self.tracks = tracks
+        elif filename is not None:
+            with open(filename, "rb") as file:
+                self.__load(file.read())
+
+    def __load(self, data: bytes):
+        """
+        Read the header chunk, then every track chunk, of a Standard MIDI File
+
+        Args:
+            data: The contents of the MIDI file
+        """
+        self.content_hash = hashlib.sha1(data).hexdigest()
+        if data[0:4] != b"MThd":
+            raise OSError("MThd not found. Probably not a MIDI file")
+        header_size = struct.unpack(">L", data[4:8])[0]
+        self.type, num_tracks, self.ticks_per_beat = struct.unpack(">hhh", data[8:14])
+
+        position = 8 + header_size
+        while len(self.tracks) < num_tracks and position + 8 <= len(data):
+            chunk_name, chunk_size = struct.unpack(">4sL", data[position:position + 8])
+            position += 8
+            # unknown chunks should be skipped
+            if chunk_name == b"MTrk":
+                self.tracks.append(SmfTrack.from_bytes(data[position:position + chunk_size]))
+            position += chunk_size
+
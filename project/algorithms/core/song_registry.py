@@ -0,0 +1,189 @@
+"""
+A process-wide registry of the MIDI files (songs) that segments are taken from. Segments refer to their song with a
+small ``Song`` object rather than the parsed file itself, so pickling a segment (or a whole index of them) doesn't
+pickle the file along with it. The file is only read again (*rehydrated*) when it's actually needed, e.g. to save a
+segment as a MIDI file: from the packed corpus it came from if there is one (which doesn't parse anything), otherwise
+from its absolute path. Data that's needed from a song at query time (such as the melody track used by the pitch
+vector algorithm) can instead be stored with the index and registered with ``register_song_track``, so the song never
+needs to be read again.
+"""
+import os
+import sys
+import weakref
+from collections import OrderedDict
+from typing import Optional, Union, Dict, Tuple, Any
+
+from mido import MidiFile, MidiTrack
+
+from project.algorithms.core import constants
+from project.algorithms.core.corpus import Corpus
+from project.algorithms.core.interning import Interned
+from project.algorithms.core.smf_reader import SmfFile, SmfTrack
+
+
+class Song(metaclass=Interned):
+    __slots__ = ("filename", "content_hash", "ticks_per_beat", "corpus_path", "corpus_index", "intern_id",
+                 "__weakref__")
+
+    def __init__(self, filename: Optional[str], content_hash: Optional[str], ticks_per_beat: int,
+                 corpus_path: Optional[str] = None, corpus_index: Optional[int] = None):
+        """
+        Identifies a MIDI file, without holding its contents. Songs are interned (see ``Interned``), so each song has
+        a single Song object (and a small integer id, ``intern_id``) within a process, even after being unpickled.
+        Songs of files without a filename (e.g. a query received by the server) can't be told apart, so they aren't
+        interned: each is identified by its object, and its intern_id is None. Use ``register_song`` to get the Song
+        of a file, and ``get_song_file`` to get the file back.
+
+        Args:
+            filename: The path of the MIDI file (absolute, unless the file came from a corpus)
+            content_hash: The hash of the contents of the MIDI file, if known (see ``SmfFile``)
+            ticks_per_beat: The ticks per beat of the MIDI file (so it's available without reading the file)
+            corpus_path: The absolute path of the corpus the file was read from, if it was read from one
+            corpus_index: The index of the file within that corpus
+        """
+        self.filename = filename
+        self.content_hash = content_hash
+        self.ticks_per_beat = int(ticks_per_beat)
+        self.corpus_path = corpus_path
+        self.corpus_index = corpus_index
+
+    def intern_key(self) -> Optional[Tuple[str, Optional[str], int, Optional[str], Optional[int]]]:
+        """
+        Returns the value identifying this song when it is interned (see ``Interned``)
+
+        Returns:
+            Every field of the song, or None if the song has no filename (so it isn't interned)
+        """
+        if self.filename is None:
+            return None
+        return self.filename, self.content_hash, self.ticks_per_beat, self.corpus_path, self.corpus_index
+
+    def __reduce__(self):
+        return Song, (self.filename, self.content_hash, self.ticks_per_beat, self.corpus_path, self.corpus_index)
+
+    def __repr__(self):
+        return f"Song({self.filename})"
+
+
+# the file of each song which is still in use elsewhere, by the song's intern_id
+_song_files: "weakref.WeakValueDictionary[int, Union[MidiFile, SmfFile]]" = weakref.WeakValueDictionary()
+# the songs most recently rehydrated by get_song_file, kept so they aren't read again straight away
+_recent_song_files: Dict[int, Union[MidiFile, SmfFile]] = OrderedDict()
+# the files of songs that can't be read again (as they have no filename), kept for as long as their song is in use
+_unreadable_song_files: "weakref.WeakKeyDictionary[Song, Union[MidiFile, SmfFile]]" = weakref.WeakKeyDictionary()
+# the song of each file without a filename which is still in use (referenced weakly, so it doesn't keep the song alive)
+_unreadable_songs: "weakref.WeakKeyDictionary[Union[MidiFile, SmfFile], weakref.ref]" = weakref.WeakKeyDictionary()
+# the corpora songs have been read again from, by path
+_corpora: Dict[str, Corpus] = {}
+# the tracks (and any data computed from them, e.g. their tempo map) registered by register_song_track, by their song
+# and their index
+_song_tracks: "weakref.WeakKeyDictionary[Song, Dict[int, Tuple[Union[MidiTrack, SmfTrack], Any]]]" = \
+    weakref.WeakKeyDictionary()
+
+
+def register_song(mid: Union[MidiFile, SmfFile, Song]) -> Song:
+    """
+    Returns the Song of a MIDI file, registering the file as the contents of that song (so it isn't read again while
+    the file is still in use).
+
+    Args:
+        mid: The MIDI file. If this is already a Song, it is returned as is
+
+    Returns:
+        The Song identifying the file
+    """
+    if isinstance(mid, Song):
+        return mid
+
+    if mid.filename is None:
+        song_ref = _unreadable_songs.get(mid)
+        song = song_ref() if song_ref is not None else None
+        if song is None:
+            song = Song(None, getattr(mid, "content_hash", None), mid.ticks_per_beat)
+            _unreadable_songs[mid] = weakref.ref(song)
+            _unreadable_song_files[song] = mid
+        return song
+
+    corpus_path = getattr(mid, "corpus_path", None)
+    filename = mid.filename
+    if corpus_path is None:
+        # the file is read again from its path, which mustn't depend on the working directory
+        filename = os.path.abspath(filename)
+    song = Song(filename, getattr(mid, "content_hash", None), mid.ticks_per_beat, corpus_path,
+                getattr(mid, "corpus_index", None))
+    _song_files[song.intern_id] = mid
+    return song
+
+
+def get_song_file(song: Union[Song, MidiFile, SmfFile]) -> Union[MidiFile, SmfFile]:
+    """
+    Returns the MIDI file of a song, reading it again if it is no longer in memory: from the corpus it came from if
+    there is one, otherwise from its path (with ``SmfFile``). If the file has changed since the song was registered
+    (i.e. it has a different content hash), a warning is written to stderr. A song without a filename can't be read
+    again, so a ValueError is raised if its file is no longer in memory (e.g. the song was unpickled).
+
+    Args:
+        song: The song. If this is a MIDI file rather than a Song, it is returned as is
+
+    Returns:
+        The MIDI file of the song
+    """
+    if not isinstance(song, Song):
+        return song
+    if song.filename is None:
+        if song not in _unreadable_song_files:
+            raise ValueError(f"{song} has no filename, so its file can't be read again")
+        return _unreadable_song_files[song]
+
+    mid = _song_files.get(song.intern_id)
+    if mid is None:
+        mid = _recent_song_files.get(song.intern_id)
+    if mid is None:
+        if song.corpus_path is not None:
+            if song.corpus_path not in _corpora:
+                _corpora[song.corpus_path] = Corpus(song.corpus_path)
+            mid = _corpora[song.corpus_path][song.corpus_index]
+        else:
+            mid = SmfFile(song.filename)
+        if song.content_hash is not None and mid.content_hash != song.content_hash:
+            sys.stderr.write(f"Warning for Midi File @ {song.filename}: the file has changed since it was segmented, "
+                             f"so its segments may no longer match it.\n")
+            sys.stderr.flush()
+        _song_files[song.intern_id] = mid
+
+    _recent_song_files[song.intern_id] = mid
+    _recent_song_files.move_to_end(song.intern_id)
+    while len(_recent_song_files) > constants.RECENT_SONG_FILES:
+        _recent_song_files.popitem(last=False)
+    return mid
+
+
+def register_song_track(song: Song, track_index: int, track: Union[MidiTrack, SmfTrack], data: Any = None):
+    """
+    Register a track of a song (e.g. one stored in an index along with the song), so that ``get_song_track`` returns
+    it without reading the song again.
+
+    Args:
+        song: The song the track is from
+        track_index: The index of the track within the song
+        track: The track itself
+        data: Any data computed from the track to keep with it (e.g. its tempo map)
+    """
+    _song_tracks.setdefault(song, {})[track_index] = (track, data)
+
+
+def get_song_track(song: Union[Song, MidiFile, SmfFile], track_index: int) -> Tuple[Union[MidiTrack, SmfTrack], Any]:
+    """
+    Returns a track of a song, and the data registered with it. If the track hasn't been registered (see
+    ``register_song_track``), it is taken from the MIDI file of the song (see ``get_song_file``).
+
+    Args:
+        song: The song
+        track_index: The index of the track within the song
+
+    Returns:
+        A (track, data) pair, where data is None if the track wasn't registered with any
+    """
+    if isinstance(song, Song) and track_index in _song_tracks.get(song, {}):
+        return _song_tracks[song][track_index]
+    return get_song_file(song).tracks[track_index], None
@@ -0,0 +1,98 @@
+from typing import List, Tuple, Union
+
+import numpy as np
+from mido import bpm2tempo
+
+
+class TempoMap:
+
+    def __init__(self, ticks_per_beat: int, tempo_changes: List[Tuple[int, int]],
+                 message_ticks: Union[np.ndarray, List[int]] = ()):
+        """
+        A precomputed mapping between MIDI ticks and seconds for a single track. The tempo changes of the track are
+        stored as *breakpoints*: the tick at which each tempo starts, and the time (in seconds) that tick corresponds
+        to. Converting a tick to seconds is then a binary search for the last breakpoint before it rather than a walk
+        through the whole track.
+
+        If the (cumulative) tick of every message in the track is given, the time in seconds of each message is also
+        precomputed, so the messages within a time range can be found with a binary search.
+
+        Args:
+            ticks_per_beat: The ticks per beat of the MIDI file the track is from
+            tempo_changes: A list of (time, tempo) pairs (as returned by ``get_track_tempo_changes``)
+            message_ticks: The absolute time (in ticks) of each message of the track, if available.
+        """
+        self.ticks_per_beat = ticks_per_beat
+        # MIDI files start at 120bpm until told otherwise
+        self.breakpoint_ticks = np.array([0] + [time for time, _ in tempo_changes], dtype=np.int64)
+        self.tempos = np.array([bpm2tempo(120)] + [tempo for _, tempo in tempo_changes], dtype=np.int64)
+        # seconds per tick of each tempo (the same scale as mido.tick2second)
+        self.scales = self.tempos * 1e-6 / ticks_per_beat
+        self.breakpoint_seconds = np.concatenate(([0.0],
+                                                  np.cumsum(np.diff(self.breakpoint_ticks) * self.scales[:-1])))
+        self.message_ticks = np.asarray(message_ticks, dtype=np.int64)
+        self.message_seconds = self.ticks_to_seconds(self.message_ticks)
+
+    def ticks_to_seconds(self, ticks: Union[int, np.ndarray]) -> Union[float, np.ndarray]:
+        """
+        Convert absolute times in ticks (from the start of the track) to absolute times in seconds.
+
+        Args:
+            ticks: A single time, or an array of times, in ticks
+
+        Returns:
+            The time(s) in seconds. A float is returned if ``ticks`` is a single value, otherwise a numpy array
+        """
+        ticks_arr = np.asarray(ticks)
+        # the tempo in effect is the last one set at or before each tick
+        breakpoint_ind = np.searchsorted(self.breakpoint_ticks, ticks_arr, side="right") - 1
+        breakpoint_ind = np.maximum(breakpoint_ind, 0)
+        seconds = self.breakpoint_seconds[breakpoint_ind] + \
+            (ticks_arr - self.breakpoint_ticks[breakpoint_ind]) * self.scales[breakpoint_ind]
+        return float(seconds) if seconds.ndim == 0 else seconds
+
+    def seconds_to_ticks(self, seconds: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+        """
+        Convert absolute times in seconds (from the start of the track) to absolute times in ticks. The result is not
+        rounded, so may not be a whole number of ticks.
+
+        Args:
+            seconds: A single time, or an array of times, in seconds
+
+        Returns:
+            The time(s) in ticks. A float is returned if ``seconds`` is a single value, otherwise a numpy array
+        """
+        seconds_arr = np.asarray(seconds, dtype=float)
+        breakpoint_ind = np.searchsorted(self.breakpoint_seconds, seconds_arr, side="right") - 1
+        breakpoint_ind = np.maximum(breakpoint_ind, 0)
+        ticks = self.breakpoint_ticks[breakpoint_ind] + \
+            (seconds_arr - self.breakpoint_seconds[breakpoint_ind]) / self.scales[breakpoint_ind]
+        return float(ticks) if ticks.ndim == 0 else ticks
+
+    def tempo_at(self, tick: int) -> int:
+        """
+        Returns the tempo (in microseconds per beat) in effect at the given time in ticks.
+
+        Args:
+            tick: The time in ticks at which to query the tempo
+
+        Returns:
+            The tempo at the given time, in microseconds per beat
+        """
+        return int(self.tempos[max(np.searchsorted(self.breakpoint_ticks, tick, side="right") - 1, 0)])
+
+    def message_range(self, start: float = 0, end: float = float("inf")) -> Tuple[int, int]:
+        """
+        Return the range of indices of the messages that occur within the time (in seconds) range [start,end].
+        Requires the TempoMap to have been built with the tick of each message (e.g. via ``midtools.get_track_tempo_map``).
+
+        Args:
+            start: The beginning of the time range (default: 0)
+            end: The end of the time range (default: inf (to the end of the track))
+
+        Returns:
+            A (first, last) pair such that track[first:last] are the messages within the time range
+        """
+        first = int(np.searchsorted(self.message_seconds, start, side="left"))
+        last = int(np.searchsorted(self.message_seconds, end, side="right"))
+        return first, last
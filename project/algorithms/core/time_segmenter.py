@@ -1,11 +1,12 @@
 from typing import List
 
-from mido import MidiFile, MidiTrack, bpm2tempo, tick2second
+from mido import MidiFile, MidiTrack
 
+from project.algorithms.core.feature_cache import get_cached_tempo_map, get_cached_note_timeline
 from project.algorithms.core.midi_segment import MidiSegment
-from project.algorithms.core.midtools import is_note_on, get_notes_in_time_range, get_note_timeline
-from project.algorithms.core.note import Note
+from project.algorithms.core.midtools import get_end_offset, get_time_range_windows
 from project.algorithms.core.note_segment import NoteSegment
+from project.algorithms.core.segment_view import SegmentView
 from project.algorithms.core.segmenter import Segmenter
 
 
@@ -25,29 +26,34 @@ class TimeSegmenter(Segmenter):
         """
         Segment the given MidiFile, producing a ``TimeSegmenter.time`` second segment from each note onset. If the
         segment reaches the end of the track before ``TimeSegmenter.time`` seconds has been recorded, no segment is
-        extracted
+        extracted. Each segment is a ``SegmentView`` of the note timeline of the track, so the (overlapping) segments
+        share their notes rather than each holding a copy.
 
         Args:
             mid: The MidiFile to segment
             track_index:  track_index: The index of the track to segment with respect to
             **kwargs: Not used in this derived class
 
+        Keyword Args:
+            tempo_map: the TempoMap of the track, if it has already been built
+
         Returns:
             A list of NoteSegments of fixed length
         """
         track: MidiTrack = mid.tracks[track_index]
+        if "tempo_map" in kwargs and kwargs["tempo_map"] is not None:
+            tempo_map = kwargs["tempo_map"]
+        else:
+            tempo_map = get_cached_tempo_map(mid, track_index)
+        timeline = get_cached_note_timeline(mid, track_index)
+        onsets = tempo_map.message_seconds[timeline.start_message_indices]
+        first, stop = get_time_range_windows(timeline, tempo_map, onsets, onsets + self.time)
+        # segments which would go past the end of the track aren't extracted
+        end_offset = get_end_offset(track, mid.ticks_per_beat, tempo_map)[0]
         time_segments = []
-        delta_t = 0
-        tempo = bpm2tempo(120)
-
-        for i, msg in enumerate(track):
-            delta_t += tick2second(msg.time, mid.ticks_per_beat, tempo)
-            if is_note_on(msg):
-                notes = get_notes_in_time_range(track, mid.ticks_per_beat, delta_t, delta_t + self.time,
-                                                allow_smaller=False, use_midi_times=True)
-                if len(notes) > 0:
-                    time_segments.append(NoteSegment(mid, track_index, notes))
-            elif msg.type == "set_tempo":
-                tempo = msg.tempo
+
+        for i in range(len(timeline)):
+            if onsets[i] + self.time <= end_offset and stop[i] > first[i]:
+                time_segments.append(NoteSegment(mid, track_index, SegmentView(timeline, int(first[i]), int(stop[i]))))
 
         return time_segments
@@ -0,0 +1,254 @@
+from collections import Counter
+from typing import Dict, List, Tuple, Union, Optional
+
+import numpy as np
+from mido import MidiTrack
+
+from project.algorithms.core import constants, smf_reader
+from project.algorithms.core.smf_reader import SmfTrack
+from project.algorithms.core.tempo_map import TempoMap
+from project.algorithms.graph_based.signature import TimeSignature, KeySignature
+
+
+class TrackProfile:
+
+    def __init__(self, is_monophonic: bool, note_tally: np.ndarray, type_tally: Dict[str, int],
+                 start_offset: Tuple[float, int], end_offset: Tuple[float, int],
+                 tempo_changes: List[Tuple[int, int]], time_signatures: List[Tuple[int, TimeSignature]],
+                 key_signatures: List[Tuple[int, KeySignature]]):
+        """
+        A summary of a MIDI track, gathered in a single pass over the track (see ``TrackProfile.from_track``) instead
+        of one pass for each of ``is_monophonic``, ``get_note_tally``, ``get_start_offset`` etc. This is enough to
+        decide whether a track can be segmented, and to give statistics about a dataset, without looking at the track
+        again.
+
+        Args:
+            is_monophonic: Whether the track has at most one note playing at any given time (see ``is_monophonic``)
+            note_tally: The number of note_on messages of each MIDI note (an array of length 128)
+            type_tally: The number of messages of each type (e.g. "note_on", "set_tempo")
+            start_offset: The time (in seconds) and index of the first note_on message (see ``get_start_offset``)
+            end_offset: The time (in seconds) and index of the last note_off message (see ``get_end_offset``)
+            tempo_changes: A list of (time, tempo) pairs (see ``get_track_tempo_changes``)
+            time_signatures: A list of (time, time signature) pairs (see ``get_track_signatures``)
+            key_signatures: A list of (time, key signature) pairs (see ``get_track_signatures``)
+        """
+        self.is_monophonic = is_monophonic
+        self.note_tally = note_tally
+        self.type_tally = type_tally
+        self.start_offset = start_offset
+        self.end_offset = end_offset
+        self.tempo_changes = tempo_changes
+        self.time_signatures = time_signatures
+        self.key_signatures = key_signatures
+
+    @staticmethod
+    def from_track(track: Union[MidiTrack, SmfTrack], ticks_per_beat: int) -> "TrackProfile":
+        """
+        Profile a track. For an ``SmfTrack`` this is done with array operations, for a MidiTrack every message is
+        looked at exactly once.
+
+        Args:
+            track: The track to profile
+            ticks_per_beat: The ticks per beat of the MIDI file the track is from
+
+        Returns:
+            The profile of the track
+        """
+        if isinstance(track, SmfTrack):
+            return TrackProfile.__from_smf_track(track, ticks_per_beat)
+
+        is_monophonic = True
+        note_tally = np.zeros(constants.MAX_MIDI_VALUE + 1, dtype=np.int64)
+        type_tally = Counter()
+        first_note_on = None
+        last_note_off = None
+        tempo_changes = []
+        time_signatures = []
+        key_signatures = []
+        message_ticks = np.empty(len(track), dtype=np.int64)
+        curr_ticks = 0
+        previous_on = False
+        previous_off = False
+        for i, message in enumerate(track):
+            curr_ticks += message.time
+            message_ticks[i] = curr_ticks
+            type_tally[message.type] += 1
+            is_on = message.type == "note_on" and message.velocity > 0
+            is_off = message.type == "note_off" or (message.type == "note_on" and message.velocity == 0)
+            if (is_on and previous_on) or (is_off and previous_off):
+                is_monophonic = False
+            previous_on = is_on
+            previous_off = is_off
+
+            if message.type == "note_on":
+                note_tally[message.note] += 1
+            if is_on and first_note_on is None:
+                first_note_on = i
+            elif is_off:
+                last_note_off = i
+            elif message.type == "set_tempo":
+                tempo_changes.append((curr_ticks, message.tempo))
+            elif message.type == "time_signature":
+                time_signatures.append((curr_ticks, TimeSignature(message.numerator, message.denominator)))
+            elif message.type == "key_signature":
+                key_signatures.append((curr_ticks, TrackProfile.__parse_key(message.key)))
+
+        tempo_map = TempoMap(ticks_per_beat, tempo_changes, message_ticks)
+        return TrackProfile(is_monophonic, note_tally, dict(type_tally),
+                            TrackProfile.__start_offset(tempo_map, first_note_on),
+                            TrackProfile.__end_offset(tempo_map, last_note_off),
+                            tempo_changes, time_signatures, key_signatures)
+
+    @staticmethod
+    def __from_smf_track(track: SmfTrack, ticks_per_beat: int) -> "TrackProfile":
+        """
+        Profile an SmfTrack using array operations on its columns.
+
+        Args:
+            track: The track to profile
+            ticks_per_beat: The ticks per beat of the MIDI file the track is from
+
+        Returns:
+            The profile of the track
+        """
+        is_monophonic = not (np.any(track.note_on_mask[1:] & track.note_on_mask[:-1]) or
+                             np.any(track.note_off_mask[1:] & track.note_off_mask[:-1]))
+        note_tally = np.bincount(track.data1[track.statuses == smf_reader.NOTE_ON_STATUS],
+                                 minlength=constants.MAX_MIDI_VALUE + 1).astype(np.int64)
+
+        # count each (status, meta type) pair, then name them
+        type_tally = {}
+        codes, counts = np.unique(track.statuses.astype(np.int64) * 256 + track.meta_types + 1, return_counts=True)
+        for code, count in zip(codes.tolist(), counts.tolist()):
+            status, meta_type = code // 256, code % 256 - 1
+            if status == smf_reader.META_STATUS:
+                name = smf_reader.META_TYPE_NAMES.get(meta_type, "unknown_meta")
+            else:
+                name = smf_reader.MESSAGE_TYPE_NAMES[status]
+            type_tally[name] = type_tally.get(name, 0) + count
+
+        tempo_changes = [(int(track.ticks[i]), track.get_tempo(i))
+                         for i in np.flatnonzero(track.meta_types == smf_reader.SET_TEMPO_META).tolist()]
+        time_signatures = [(int(track.ticks[i]), TimeSignature(*track.get_time_signature(i)))
+                           for i in np.flatnonzero(track.meta_types == smf_reader.TIME_SIGNATURE_META).tolist()]
+        key_signatures = [(int(track.ticks[i]), TrackProfile.__parse_key(track.get_key_signature(i)))
+                          for i in np.flatnonzero(track.meta_types == smf_reader.KEY_SIGNATURE_META).tolist()]
+
+        note_on_indices = np.flatnonzero(track.note_on_mask)
+        note_off_indices = np.flatnonzero(track.note_off_mask)
+        tempo_map = TempoMap(ticks_per_beat, tempo_changes, track.ticks)
+        return TrackProfile(is_monophonic, note_tally, type_tally,
+                            TrackProfile.__start_offset(tempo_map,
+                                                        int(note_on_indices[0]) if len(note_on_indices) > 0 else None),
+                            TrackProfile.__end_offset(tempo_map,
+                                                      int(note_off_indices[-1]) if len(note_off_indices) > 0 else None),
+                            tempo_changes, time_signatures, key_signatures)
+
+    @staticmethod
+    def __parse_key(key: str) -> KeySignature:
+        """
+        Create a KeySignature from a key as formatted by mido (e.g. "F#" or "Ebm")
+
+        Args:
+            key: The key to parse
+
+        Returns:
+            The key signature
+        """
+        if key.endswith("m"):  # is minor key
+            return KeySignature(key[:-1], True)
+        else:
+            return KeySignature(key, False)
+
+    @staticmethod
+    def __start_offset(tempo_map: TempoMap, first_note_on: Optional[int]) -> Tuple[float, int]:
+        """
+        Returns the start offset of a track, as ``get_start_offset`` would
+
+        Args:
+            tempo_map: The TempoMap of the track
+            first_note_on: The index of the first note_on message of the track, or None if there are no notes
+
+        Returns:
+            the time (in seconds) and the index of the *start* of the first note in the track
+        """
+        if first_note_on is not None:
+            return float(tempo_map.message_seconds[first_note_on]), first_note_on
+        # no notes: the offset is the end of the track
+        return (float(tempo_map.message_seconds[-1]) if len(tempo_map.message_seconds) > 0 else 0), 0
+
+    @staticmethod
+    def __end_offset(tempo_map: TempoMap, last_note_off: Optional[int]) -> Tuple[float, int]:
+        """
+        Returns the end offset of a track, as ``get_end_offset`` would
+
+        Args:
+            tempo_map: The TempoMap of the track
+            last_note_off: The index of the last note_off message of the track, or None if there are no notes
+
+        Returns:
+            the time (in seconds) and the index of the *end* of the last note in the track
+        """
+        if last_note_off is not None:
+            return float(tempo_map.message_seconds[last_note_off]), last_note_off
+        return 0, 0
+
+    @property
+    def num_notes(self) -> int:
+        """
+        Returns the number of note_on messages in the track
+
+        Returns:
+            The number of note_on messages in the track
+        """
+        return int(self.note_tally.sum())
+
+    def to_features(self) -> Dict[str, np.ndarray]:
+        """
+        Convert this profile to a set of named arrays, so it can be stored in the feature cache.
+
+        Returns:
+            The profile as a dictionary of numpy arrays. ``TrackProfile.from_features`` does the opposite.
+        """
+        return {
+            "is_monophonic": np.array(self.is_monophonic),
+            "note_tally": self.note_tally,
+            "type_names": np.array(list(self.type_tally.keys()), dtype=str),
+            "type_counts": np.array(list(self.type_tally.values()), dtype=np.int64),
+            "start_offset": np.array(self.start_offset, dtype=float),
+            "end_offset": np.array(self.end_offset, dtype=float),
+            "tempo_change_ticks": np.array([time for time, _ in self.tempo_changes], dtype=np.int64),
+            "tempos": np.array([tempo for _, tempo in self.tempo_changes], dtype=np.int64),
+            "time_signature_ticks": np.array([time for time, _ in self.time_signatures], dtype=np.int64),
+            "numerators": np.array([signature.numerator for _, signature in self.time_signatures], dtype=np.int64),
+            "denominators": np.array([signature.denominator for _, signature in self.time_signatures],
+                                     dtype=np.int64),
+            "key_signature_ticks": np.array([time for time, _ in self.key_signatures], dtype=np.int64),
+            "key_notes": np.array([signature.note for _, signature in self.key_signatures], dtype=np.int64),
+            "key_minors": np.array([signature.minor for _, signature in self.key_signatures], dtype=bool)
+        }
+
+    @staticmethod
+    def from_features(features: Dict[str, np.ndarray]) -> "TrackProfile":
+        """
+        Create a profile from the named arrays returned by ``TrackProfile.to_features``
+
+        Args:
+            features: The profile as a dictionary of numpy arrays
+
+        Returns:
+            The profile
+        """
+        start_time, start_index = features["start_offset"].tolist()
+        end_time, end_index = features["end_offset"].tolist()
+        return TrackProfile(
+            bool(features["is_monophonic"]), features["note_tally"],
+            dict(zip(features["type_names"].tolist(), features["type_counts"].tolist())),
+            (start_time, int(start_index)), (end_time, int(end_index)),
+            list(zip(features["tempo_change_ticks"].tolist(), features["tempos"].tolist())),
+            [(time, TimeSignature(numerator, denominator)) for time, numerator, denominator in
+             zip(features["time_signature_ticks"].tolist(), features["numerators"].tolist(),
+                 features["denominators"].tolist())],
+            [(time, KeySignature(constants.TWELVE_NOTE_SCALE_SHARP[note], minor)) for time, note, minor in
+             zip(features["key_signature_ticks"].tolist(), features["key_notes"].tolist(),
+                 features["key_minors"].tolist())])
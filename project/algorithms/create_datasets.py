@@ -28,7 +28,7 @@ def create_dataset_pv(folder: str, veclength: int) -> Dict[Tuple[float, int], En
                                          distance=EuclideanDistance())
             # i.e observations = dimensions
         for i, vector in enumerate(pv_collection.vectors):
-            vector_map[pv_spec].store_vector(vector.pitch_vector, (pv_collection.mid_file, vector.start_offset,
+            vector_map[pv_spec].store_vector(vector.pitch_vector, (pv_collection.song, vector.start_offset,
                                                                    vector.pitch_modifier, pv_collection.melody_track))
 
     print(f"Done: number of vectors in database is: {num_vectors}")
@@ -10,14 +10,21 @@ from project.algorithms.core.note import Note
 from project.algorithms.core.note_segment import NoteSegment
 from project.algorithms.core.random_segmenter import RandomSegmenter
 from project.algorithms.core.time_segmenter import TimeSegmenter
+from project.algorithms.graph_based.lbdm_clustering_segmenter import LbdmClusteringSegmenter
 from project.algorithms.graph_based.lbdm_segmenter import LbdmSegmenter
+from project.algorithms.graph_based.online_lbdm_segmenter import OnlineLbdmSegmenter
 
 from project.algorithms.query_creation.indexed_query_creator import IndexedQueryCreator
 
 
 def create_indexed_queries(algorithm: str, num_queries: int, dataset_location: str,
-                           melody_track: int, rng: Optional[int], **kwargs) -> List[NoteSegment]:
-    if algorithm == "graph":
+                           melody_track: int, rng: Optional[int], segmenter: str = "lbdm",
+                           **kwargs) -> List[NoteSegment]:
+    if algorithm == "graph" and segmenter == "lbdm_clustering":
+        creator = IndexedQueryCreator(LbdmClusteringSegmenter(), rng)
+    elif algorithm == "graph" and segmenter == "online_lbdm":
+        creator = IndexedQueryCreator(OnlineLbdmSegmenter(), rng)
+    elif algorithm == "graph":
         creator = IndexedQueryCreator(LbdmSegmenter(), rng)
     elif algorithm == "pitch_vector":
         creator = IndexedQueryCreator(TimeSegmenter(kwargs["segmenter_args"]["time"]), rng)
@@ -0,0 +1,196 @@
+import pathlib
+import pickle
+from typing import List, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from project.algorithms.graph_based.midi_graph import MidiGraph, IDENTIFYING
+
+INDEX_FILENAME = "fingerprint_index.pickle"
+
+
+class FingerprintIndex:
+
+    def __init__(self, graphs: Iterable[MidiGraph]):
+        """
+        An inverted index of a set of graphs (e.g. a dataset created by ``segment.py``), from the fingerprint of the
+        notes of each node (see ``NoteArray.fingerprint``) to the nodes with that fingerprint. This means the nodes
+        (and songs) which may match a query or one of its reductions can be found without visiting every graph.
+
+        Songs are identified by the stem of their filename, as in the rankings of ``query_graph``. For each song, the
+        index also keeps what's needed to score it when none of its nodes match the query (see
+        ``get_unmatched_path_lengths``): the number of original segments, and the total and smallest length of their
+        chains of reductions. The digest of each graph (see ``MidiGraph.get_digest``) is kept too, so a graph which
+        has changed since it was indexed isn't treated as indexed.
+
+        Args:
+            graphs: The graphs to index (which are only read while the index is created, so they can be loaded one at
+                a time)
+        """
+        self.song_names: List[str] = []
+        self.song_ids: Dict[str, int] = {}
+        num_nodes = []
+        digests = []
+        num_segments = []
+        chain_length_sums = []
+        chain_length_minima = []
+        fingerprints = []
+        songs = []
+        nodes = []
+
+        for graph in graphs:
+            name = pathlib.Path(graph.song.filename).stem
+            self.song_ids[name] = len(self.song_names)
+            self.song_names.append(name)
+            num_nodes.append(graph.num_nodes)
+            digests.append(graph.get_digest())
+            original_nodes = graph.get_nodes_of_kind(IDENTIFYING)
+            num_segments.append(len(original_nodes))
+            chains = graph.get_chains()
+            if chains is None or len(original_nodes) == 0:
+                # songs whose graphs aren't forests of chains are always scored in full
+                chain_length_sums.append(np.nan)
+                chain_length_minima.append(np.nan)
+            else:
+                roots, depths = chains
+                chain_lengths = np.zeros(graph.num_nodes)
+                np.maximum.at(chain_lengths, roots, depths)
+                chain_length_sums.append(float(np.sum(chain_lengths[original_nodes])))
+                chain_length_minima.append(float(np.min(chain_lengths[original_nodes])))
+            fingerprints.append(graph.node_fingerprints)
+            songs.append(np.full(graph.num_nodes, self.song_ids[name], dtype=np.int32))
+            nodes.append(np.arange(graph.num_nodes, dtype=np.int32))
+
+        self.num_nodes = np.array(num_nodes, dtype=np.int64)
+        self.digests = np.array(digests, dtype=np.uint64)
+        self.num_segments = np.array(num_segments, dtype=np.int64)
+        self.chain_length_sums = np.array(chain_length_sums, dtype=np.float64)
+        self.chain_length_minima = np.array(chain_length_minima, dtype=np.float64)
+
+        # the nodes of every song, in order of fingerprint
+        fingerprints = np.concatenate(fingerprints) if len(fingerprints) > 0 else np.empty(0, dtype=np.uint64)
+        order = np.argsort(fingerprints, kind="stable")
+        self.fingerprints = fingerprints[order]
+        self.songs = np.concatenate(songs)[order] if len(songs) > 0 else np.empty(0, dtype=np.int32)
+        self.nodes = np.concatenate(nodes)[order] if len(nodes) > 0 else np.empty(0, dtype=np.int32)
+
+    @staticmethod
+    def from_folder(folder: str) -> "FingerprintIndex":
+        """
+        Create the index of the graphs in a dataset folder (i.e. ``mid/generated/graph/<folder>``), loading one graph
+        at a time
+
+        Args:
+            folder: The name of the dataset folder
+
+        Returns:
+            The index of every graph in the folder
+        """
+        def load_graphs():
+            for gpickle in sorted(pathlib.Path(f"mid/generated/graph/{folder}").glob("**/*.gpickle")):
+                with open(gpickle, "rb") as fh:
+                    yield pickle.load(fh)
+
+        return FingerprintIndex(load_graphs())
+
+    @staticmethod
+    def load(folder: str) -> Optional["FingerprintIndex"]:
+        """
+        Load the index saved in a dataset folder (see ``save``), if there is one
+
+        Args:
+            folder: The name of the dataset folder
+
+        Returns:
+            The index of the folder, or None if it hasn't been saved (or was saved by an older version, without the
+            digests of the graphs)
+        """
+        path = pathlib.Path(f"mid/generated/graph/{folder}/{INDEX_FILENAME}")
+        if not path.exists():
+            return None
+        with open(path, "rb") as fh:
+            index = pickle.load(fh)
+        return index if hasattr(index, "digests") else None
+
+    def save(self, folder: str):
+        """
+        Save the index in a dataset folder (i.e. ``mid/generated/graph/<folder>``)
+
+        Args:
+            folder: The name of the dataset folder
+        """
+        pathlib.Path(f"mid/generated/graph/{folder}").mkdir(parents=True, exist_ok=True)
+        with open(f"mid/generated/graph/{folder}/{INDEX_FILENAME}", "wb") as fh:
+            pickle.dump(self, fh, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def is_indexed(self, graph: MidiGraph) -> bool:
+        """
+        Returns whether a graph is in the index, i.e. whether the same graph of the song (with the same digest, see
+        ``MidiGraph.get_digest``) was indexed. If not, e.g. because the song was segmented again after the index was
+        created, the index can't be used for it.
+
+        Args:
+            graph: The graph
+
+        Returns:
+            True if the graph is in the index, False otherwise
+        """
+        song_id = self.song_ids.get(pathlib.Path(graph.song.filename).stem)
+        return song_id is not None and self.num_nodes[song_id] == graph.num_nodes and \
+            int(self.digests[song_id]) == graph.get_digest()
+
+    def lookup(self, fingerprints: Iterable[int]) -> Dict[str, np.ndarray]:
+        """
+        Find the nodes with any of the given fingerprints. As fingerprints can collide, the notes of each node should
+        still be checked.
+
+        Args:
+            fingerprints: The fingerprints to look up (e.g. of the query and each of its reductions)
+
+        Returns:
+            A dictionary from the name of each song with at least one of the fingerprints, to the ids of its nodes
+            with one of them (in order)
+        """
+        fingerprints = np.array(list(fingerprints), dtype=np.uint64)
+        starts = np.searchsorted(self.fingerprints, fingerprints, side="left")
+        counts = np.searchsorted(self.fingerprints, fingerprints, side="right") - starts
+        positions = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(starts, counts)
+
+        songs = self.songs[positions]
+        nodes = self.nodes[positions]
+        order = np.lexsort((nodes, songs))
+        songs, nodes = songs[order], nodes[order]
+        song_starts = np.flatnonzero(np.concatenate(([True], songs[1:] != songs[:-1]))) if len(songs) > 0 \
+            else np.empty(0, dtype=np.int64)
+        return {self.song_names[songs[first]]: np.unique(song_nodes)
+                for first, song_nodes in zip(song_starts.tolist(), np.split(nodes, song_starts[1:]))}
+
+    def get_unmatched_path_lengths(self, graph: MidiGraph, query_length: float,
+                                   penalty: float) -> Optional[Tuple[float, float]]:
+        """
+        Returns the average and minimum length of the shortest paths from a query to the original segments of a song,
+        when none of its nodes match the query or any of its reductions. In that case the only edges between the query
+        and the graph join the last reduction of the query to the last reduction of each segment (with weight
+        ``penalty``), so the path to each segment runs along the whole chain of the query, across that edge and then
+        along the whole chain of the segment.
+
+        Args:
+            graph: The graph of the song
+            query_length: The total weight of the reductions of the query
+            penalty: The weight of the edges between the last reduction of the query and the graph
+
+        Returns:
+            An (average, minimum) pair of path lengths, or None if they can't be found from the index (i.e. the graph
+            isn't in the index, or isn't a forest of chains)
+        """
+        if not self.is_indexed(graph):
+            return None
+        song_id = self.song_ids[pathlib.Path(graph.song.filename).stem]
+        if np.isnan(self.chain_length_sums[song_id]):
+            return None
+        average = (query_length + penalty) + float(self.chain_length_sums[song_id]) / int(self.num_segments[song_id])
+        minimum = (query_length + penalty) + float(self.chain_length_minima[song_id])
+        return average, minimum
+
+    def __len__(self) -> int:
+        return len(self.song_names)
@@ -1,7 +1,8 @@
-from typing import Callable, Tuple, List
+from typing import Callable, Tuple, List, Union, Optional
 import numpy as np
 
 from project.algorithms.core.note import Note
+from project.algorithms.core.note_array import NoteArray
 
 
 def __default_change(x1: int, x2: int) -> float:
@@ -12,52 +13,86 @@ def __default_change(x1: int, x2: int) -> float:
 
 
 def __normalize(arr: np.array) -> np.array:
-    if len(arr) == 0:
+    # normalises each row of arr by its maximum
+    if arr.shape[-1] == 0:
         return arr
     else:
-        return arr / np.max(arr)
+        return arr / np.max(arr, axis=-1, keepdims=True)
 
 
-def lbdm(notes: List[Note], pitch_weight: float = 0.25, ioi_weight: float = 0.5, rest_weight: float = 0.25,
-         max_pitch_difference: int = 12, max_time_difference: int = 4096,
-         degree_of_change: Callable[[int, int], float] = __default_change) \
-        -> Tuple[np.ndarray, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+def __get_neighbours(pitches: np.ndarray, intervals: np.ndarray, firsts: np.ndarray,
+                     lasts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
     """
-    Creates a list of boundaries for the target MIDI track using the Local Boundary Detection Model.
-    It looks at the intervals between notes in terms of pitch, inter-onsets (between the starts of notes pressing down)
-    and rests (diff between offset to onset) to find the places where these differ significantly from the intervals
-    before it. The boundaries are weighted : by default, the inter-onset intervals are weighted to be twice as important
-    as the other intervals. These boundaries are normalised to between 0 and 1 inclusive.
+    Returns the previous and next interval of each interval. As in the original implementation, the first interval
+    (of each sequence) takes its *pitch* interval as its previous interval, and the last interval takes its pitch
+    interval as its next interval.
 
-    Notes:
-        This method currently only takes into account note_on and note_off messages within the MidiTrack. Other messages
-        that may have an effect on timing and pitch (e.g. sustain pedal, pitchwheel, tempo) are not currently taken into
-        account.
     Args:
+        pitches: The pitch intervals
+        intervals: The intervals to find the neighbours of (which may be the pitch intervals themselves)
+        firsts: The index of the first interval of each sequence of intervals
+        lasts: The index of the last interval of each sequence of intervals
 
-        notes: The MIDI track to produce boundaries for
-        pitch_weight: The relative importance of pitches in determining where boundaries are placed
-        ioi_weight: The relative importance of inter-onset intervals in determining where boundaries are placed
-        rest_weight: The relative importance of rests in determining where boundaries are placed
-        max_pitch_difference: The maximum value that a pitch interval can be. Higher value intervals will be truncated
-        max_time_difference: The maximum value that a interonset/rest interval can be. Higher value intervals will be truncated.
-        degree_of_change: A function to calculate the relative difference between two intervals
     Returns:
-        A boundary strength profile describing the places in which the music changes. In addition, the values for each
-        profile (pitch, ioi, rest) are also returned.
+        A (previous, next) pair of arrays
+    """
+    previous = np.roll(intervals, 1)
+    previous[firsts] = pitches[firsts]
+    following = np.roll(intervals, -1)
+    following[lasts] = pitches[lasts]
+    return previous, following
+
 
+def __get_sequences(pitches: np.ndarray, interonsets: np.ndarray, rests: np.ndarray, firsts: np.ndarray,
+                    lasts: np.ndarray) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
     """
-    if len(notes) < 2:
-        return np.array([]), (np.array([]), np.array([]), np.array([]))
+    Computes the (unnormalised) sequence profile of each kind of interval at once, using the default change function.
+    This gives exactly the same values as applying ``__default_change`` to each pair of intervals. The intervals may
+    be several sequences (e.g. of different songs) joined together, which are kept separate.
+
+    Args:
+        pitches: The pitch intervals
+        interonsets: The inter-onset intervals
+        rests: The rest intervals
+        firsts: The index of the first interval of each sequence
+        lasts: The index of the last interval of each sequence
 
-    # get consecutive pairs of notes i.e [(note0,note1), (note1,note2)] etc. for comparison
-    note_pairs = list(zip(notes, notes[1:]))
+    Returns:
+        The (pitch, ioi, rest) sequence profiles, or None if the default change function would divide by zero for
+        some pair of intervals (i.e. a pair of non-zero intervals which sum to 0)
+    """
+    sequences = []
+    for intervals in (pitches, interonsets, rests):
+        previous, following = __get_neighbours(pitches, intervals, firsts, lasts)
+        # the change function is given the intervals as integers
+        values = intervals.astype(np.int64)
+        previous = previous.astype(np.int64)
+        following = following.astype(np.int64)
+        for first, second in ((previous, values), (values, following)):
+            if np.any((first + second == 0) & ((first != 0) | (second != 0))):
+                return None
+        with np.errstate(divide="ignore", invalid="ignore"):
+            change = np.where((previous == 0) & (values == 0), 0, np.abs(previous - values) / (previous + values)) + \
+                np.where((values == 0) & (following == 0), 0, np.abs(values - following) / (values + following))
+        sequences.append((intervals * change) + 1)
+    return sequences[0], sequences[1], sequences[2]
+
+
+def __get_sequences_slow(pitches: List[int], interonsets: List[int], rests: List[int],
+                         degree_of_change: Callable[[int, int], float]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Computes the (unnormalised) sequence profile of each kind of interval, calling ``degree_of_change`` for each pair of
+    neighbouring intervals.
 
-    # get interval values, truncate to max value if needed
-    pitches = [min(abs(note_pair[1].pitch - note_pair[0].pitch), max_pitch_difference) for note_pair in note_pairs]
-    interonsets = [min(note_pair[1].start_time - note_pair[0].start_time, max_time_difference) for note_pair in note_pairs]
-    rests = [min(note_pair[1].start_time - note_pair[0].end_time, max_time_difference) for note_pair in note_pairs]
+    Args:
+        pitches: The pitch intervals
+        interonsets: The inter-onset intervals
+        rests: The rest intervals
+        degree_of_change: A function to calculate the relative difference between two intervals
 
+    Returns:
+        The (pitch, ioi, rest) sequence profiles
+    """
     sequence_pitches = []
     sequence_iois = []
     sequence_rests = []
@@ -93,10 +128,120 @@ def lbdm(notes: List[Note], pitch_weight: float = 0.25, ioi_weight: float = 0.5,
                                (degree_of_change(int(prev_rest), int(rests[i]))
                                 + (degree_of_change(int(rests[i]), int(next_rest))))) + 1)
 
+    return np.array(sequence_pitches), np.array(sequence_iois), np.array(sequence_rests)
+
+
+def lbdm(notes: Union[NoteArray, List[Note]], pitch_weight: float = 0.25, ioi_weight: float = 0.5, rest_weight: float = 0.25,
+         max_pitch_difference: int = 12, max_time_difference: int = 4096,
+         degree_of_change: Callable[[int, int], float] = __default_change) \
+        -> Tuple[np.ndarray, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Creates a list of boundaries for the target MIDI track using the Local Boundary Detection Model.
+    It looks at the intervals between notes in terms of pitch, inter-onsets (between the starts of notes pressing down)
+    and rests (diff between offset to onset) to find the places where these differ significantly from the intervals
+    before it. The boundaries are weighted : by default, the inter-onset intervals are weighted to be twice as important
+    as the other intervals. These boundaries are normalised to between 0 and 1 inclusive.
+
+    Notes:
+        This method currently only takes into account note_on and note_off messages within the MidiTrack. Other messages
+        that may have an effect on timing and pitch (e.g. sustain pedal, pitchwheel, tempo) are not currently taken into
+        account.
+    Args:
+
+        notes: The notes (either a NoteArray or a list of notes) to produce boundaries for
+        pitch_weight: The relative importance of pitches in determining where boundaries are placed
+        ioi_weight: The relative importance of inter-onset intervals in determining where boundaries are placed
+        rest_weight: The relative importance of rests in determining where boundaries are placed
+        max_pitch_difference: The maximum value that a pitch interval can be. Higher value intervals will be truncated
+        max_time_difference: The maximum value that a interonset/rest interval can be. Higher value intervals will be truncated.
+        degree_of_change: A function to calculate the relative difference between two intervals. The default function
+            is applied to every pair of intervals at once (with numpy); any other function is called for each pair.
+    Returns:
+        A boundary strength profile describing the places in which the music changes. In addition, the values for each
+        profile (pitch, ioi, rest) are also returned.
+
+    """
+    if len(notes) < 2:
+        return np.array([]), (np.array([]), np.array([]), np.array([]))
+
+    notes = NoteArray.from_notes(notes)
+
+    # get interval values between consecutive pairs of notes, truncate to max value if needed
+    pitches = np.minimum(np.abs(np.diff(notes.pitches)), max_pitch_difference)
+    interonsets = np.minimum(np.diff(notes.start_times), max_time_difference)
+    rests = np.minimum(notes.start_times[1:] - notes.end_times[:-1], max_time_difference)
+
+    if degree_of_change is __default_change:
+        sequences = __get_sequences(pitches, interonsets, rests, np.array([0]), np.array([len(pitches) - 1]))
+    else:
+        sequences = None
+    if sequences is None:
+        # a custom change function (or intervals the default one can't handle) is applied to each pair in turn
+        sequences = __get_sequences_slow(pitches.tolist(), interonsets.tolist(), rests.tolist(), degree_of_change)
+
     # normalise to range [0,1]
-    sequence_pitches = __normalize(np.array(sequence_pitches))
-    sequence_iois = __normalize(np.array(sequence_iois))
-    sequence_rests = __normalize(np.array(sequence_rests))
+    sequence_pitches, sequence_iois, sequence_rests = __normalize(np.stack(sequences))
 
     sequence_profile = (sequence_pitches * pitch_weight) + (sequence_iois * ioi_weight) + (sequence_rests * rest_weight)
     return sequence_profile, (sequence_pitches, sequence_iois, sequence_rests)
+
+
+def lbdm_batch(notes: NoteArray, offsets: np.ndarray, pitch_weight: float = 0.25, ioi_weight: float = 0.5,
+               rest_weight: float = 0.25, max_pitch_difference: int = 12,
+               max_time_difference: Union[int, np.ndarray] = 4096) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Computes the boundary strength profile of many songs at once, giving the same profile for each song as ``lbdm``
+    (with the default degree of change function). The notes of every song are joined together in one NoteArray
+    (e.g. with ``NoteArray.concatenate``), and the profile of each song is computed and normalised separately, without
+    looping over the songs.
+
+    Args:
+        notes: The notes of every song
+        offsets: The index in ``notes`` of the first note of each song, followed by the total number of notes
+        pitch_weight: The relative importance of pitches in determining where boundaries are placed
+        ioi_weight: The relative importance of inter-onset intervals in determining where boundaries are placed
+        rest_weight: The relative importance of rests in determining where boundaries are placed
+        max_pitch_difference: The maximum value that a pitch interval can be. Higher value intervals will be truncated
+        max_time_difference: The maximum value that a interonset/rest interval can be, either for every song or as an
+            array with a value for each song (e.g. 4 times the ticks per beat of each song).
+
+    Returns:
+        A (profiles, profile_offsets) pair: the profile of song ``i`` is ``profiles[profile_offsets[i]:
+        profile_offsets[i + 1]]``, which has one value for each pair of consecutive notes of the song (so it's empty
+        if the song has fewer than 2 notes)
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    interval_counts = np.maximum(np.diff(offsets) - 1, 0)
+    profile_offsets = np.cumsum(np.concatenate(([0], interval_counts)), dtype=np.int64)
+    if profile_offsets[-1] == 0:
+        return np.array([]), profile_offsets
+
+    # get interval values between consecutive pairs of notes, leaving out the pairs which span two songs
+    is_interval = np.ones(len(notes) - 1, dtype=bool)
+    song_starts = offsets[1:-1]
+    is_interval[song_starts[(song_starts > 0) & (song_starts < len(notes))] - 1] = False
+    max_time_differences = np.repeat(np.broadcast_to(max_time_difference, interval_counts.shape), interval_counts)
+    pitches = np.minimum(np.abs(np.diff(notes.pitches))[is_interval], max_pitch_difference)
+    interonsets = np.minimum(np.diff(notes.start_times)[is_interval], max_time_differences)
+    rests = np.minimum((notes.start_times[1:] - notes.end_times[:-1])[is_interval], max_time_differences)
+
+    has_intervals = interval_counts > 0
+    firsts = profile_offsets[:-1][has_intervals]
+    lasts = profile_offsets[1:][has_intervals] - 1
+    sequences = __get_sequences(pitches, interonsets, rests, firsts, lasts)
+    if sequences is None:
+        # the default change function can't handle the intervals of some song: compute each song separately
+        max_time_differences = np.broadcast_to(max_time_difference, interval_counts.shape)
+        profiles = [lbdm(notes[offsets[i]:offsets[i + 1]], pitch_weight=pitch_weight, ioi_weight=ioi_weight,
+                         rest_weight=rest_weight, max_pitch_difference=max_pitch_difference,
+                         max_time_difference=max_time_differences[i])[0] for i in range(len(interval_counts))]
+        return np.concatenate(profiles), profile_offsets
+
+    # normalise the profile of each song to range [0,1]
+    sequences = np.stack(sequences)
+    maxima = np.maximum.reduceat(sequences, firsts, axis=1)
+    sequence_pitches, sequence_iois, sequence_rests = sequences / np.repeat(maxima, interval_counts[has_intervals],
+                                                                            axis=1)
+
+    profiles = (sequence_pitches * pitch_weight) + (sequence_iois * ioi_weight) + (sequence_rests * rest_weight)
+    return profiles, profile_offsets
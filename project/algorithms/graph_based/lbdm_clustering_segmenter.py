@@ -1,57 +1,153 @@
-from typing import List
+from typing import List, Callable, Optional
 
 import numpy as np
-from matplotlib import pyplot as plt
-from mido import MidiTrack, MidiFile
+from mido import MidiFile
 
-from project.algorithms.graph_based import lbdm
 from project.algorithms.core.segmenter import Segmenter
 from project.algorithms.core.note_segment import NoteSegment
-from project.algorithms.core.midtools import get_note_timeline
-from sklearn.cluster import KMeans, AgglomerativeClustering
+from project.algorithms.core.segment_view import SegmentView
+from project.algorithms.core.feature_cache import get_cached_note_timeline, get_cached_lbdm_profile
+
+
+def two_means_threshold(profile: np.ndarray) -> float:
+    """
+    Split the values of a boundary profile into 2 clusters as 1-D k-means would (minimising the sum of squared
+    distances of each value from the centre of its cluster), returning the centre of the upper cluster. As the values
+    are 1-D, the best clustering always splits the sorted values in two, so every split is tried at once using prefix
+    sums of the sorted values, which finds the best clustering exactly in O(n log n) time (unlike k-means, which can
+    get stuck at a worse one).
+
+    Args:
+        profile: The boundary profile
+
+    Returns:
+        The centre of the cluster of larger values. If the values can't be split (there are fewer than 2 distinct
+        values), the largest value is returned.
+    """
+    values = np.sort(np.asarray(profile, dtype=np.float64))
+    if len(values) == 0:
+        return float("inf")
+    # only split between distinct values
+    splits = np.flatnonzero(values[1:] > values[:-1]) + 1
+    if len(splits) == 0:
+        return float(values[-1])
+
+    sums = np.concatenate(([0], np.cumsum(values)))
+    squares = np.concatenate(([0], np.cumsum(values * values)))
+    lower_counts = splits
+    upper_counts = len(values) - splits
+    lower_sums = sums[splits]
+    upper_sums = sums[-1] - lower_sums
+    errors = (squares[splits] - lower_sums * lower_sums / lower_counts) + \
+        (squares[-1] - squares[splits] - upper_sums * upper_sums / upper_counts)
+    best = int(np.argmin(errors))
+    return float(upper_sums[best] / upper_counts[best])
+
+
+def k_means_threshold(profile: np.ndarray) -> float:
+    """
+    Cluster the values of a boundary profile with sklearn's ``KMeans`` (with centres starting at 0 and 1), returning
+    the centre of the upper cluster. This is the original method of ``LbdmClusteringSegmenter``; sklearn is only
+    needed if it's used.
+
+    Args:
+        profile: The boundary profile
+
+    Returns:
+        The centre of the cluster of larger values
+    """
+    from sklearn.cluster import KMeans
+
+    k_means = KMeans(init=np.array([[0], [1]]), n_clusters=2, n_init=1).fit(np.asarray(profile).reshape(-1, 1))
+    return float(max(k_means.cluster_centers_))
+
+
+def plot_threshold(profile: np.ndarray, threshold: float):
+    """
+    Plot a boundary profile with the threshold chosen for it (and the fixed threshold of ``LbdmSegmenter``), for
+    debugging. This blocks until the plot is closed. Pass this as the ``debug_hook`` of an LbdmClusteringSegmenter to
+    plot the profile of each file it segments.
+
+    Args:
+        profile: The boundary profile
+        threshold: The threshold chosen for the profile
+    """
+    from matplotlib import pyplot as plt
+
+    plt.plot(profile, label="Boundary profile", color="purple")
+    plt.ylim(0, 1.1)
+    plt.scatter(range(len(profile)), profile, color="purple")
+    plt.axhline(threshold, color="r", label="K-means suggested boundary")
+    plt.axhline(0.5, color="g", label="Normal boundary")
+
+    plt.legend()
+    plt.show()
 
 
 class LbdmClusteringSegmenter(Segmenter):
 
     def __init__(self, pitch_weight: float = 0.25, ioi_weight: float = 0.5,
-                 rest_weight: float = 0.25):
+                 rest_weight: float = 0.25, method: str = "exact",
+                 debug_hook: Optional[Callable[[np.ndarray, float], None]] = None):
         """
-        An incomplete implementation of LBDM using k-means to determine the threshold
+        A Segmenter which, like ``LbdmSegmenter``, splits music at the boundaries of its LBDM profile, but chooses the
+        threshold for each file by splitting the values of its profile into 2 clusters (boundaries and non-boundaries),
+        using the centre of the upper cluster as the threshold.
+
+        Args:
+            pitch_weight: The relative weight of the changes in pitch
+            ioi_weight: The relative weight of the changes in onset
+            rest_weight: The relative weight of the changes in rest (offset->onset)
+            method: How the profile is clustered: "exact" finds the best 2 clusters directly (see
+                ``two_means_threshold``), and "kmeans" uses sklearn's KMeans (see ``k_means_threshold``)
+            debug_hook: If given, this is called with the profile and threshold of each file that is segmented, e.g.
+                ``plot_threshold`` to plot them
         """
 
         super().__init__()
+        if method not in ("exact", "kmeans"):
+            raise ValueError(f"method must be either \"exact\" or \"kmeans\", not {method}")
         self.pitch_weight = pitch_weight
         self.ioi_weight = ioi_weight
         self.rest_weight = rest_weight
+        self.method = method
+        self.debug_hook = debug_hook
 
     def create_segments(self, mid: MidiFile, track_index: int, **kwargs) -> List[NoteSegment]:
+        """
+        Create Segments using the LBDM algorithm, with a threshold chosen by clustering the profile of the track.
+
+        Args:
+            mid: The MIDI file to segment
+            track_index: the track to segment with respect to
+
+        Keyword Args:
+            chord_track: a track of the MIDI file only containing chords, if such a track exists
+
+        Returns:
+            A list of NoteSegments, the size and position of which being determined by the LBDM algorithm
+        """
 
         # determine which track to core
-        track: MidiTrack = mid.tracks[track_index]
-        chord_track = None
+        chord_track_ind = None
         if "chord_track" in kwargs.keys() and kwargs["chord_track"] is not None:
             chord_track_ind = kwargs["chord_track"]
-            chord_track = mid.tracks[chord_track_ind]
 
         # get list of notes within the track
-        timeline = get_note_timeline(track, chord_track)
+        timeline = get_cached_note_timeline(mid, track_index, chord_track_ind)
         # get the lbdm "sequence profile" describing where segmentation should take place
-        profile, _ = lbdm.lbdm(timeline, pitch_weight=self.pitch_weight, ioi_weight=self.ioi_weight,
-                               rest_weight=self.rest_weight, max_time_difference=mid.ticks_per_beat * 4)
-
-        # 1-D K-means clustering with "centers" at 0 and 1
-        k_means = KMeans(init=np.array([[0], [1]]), n_clusters=2, n_init=1).fit(profile.reshape(-1, 1))
+        profile = get_cached_lbdm_profile(mid, track_index, pitch_weight=self.pitch_weight, ioi_weight=self.ioi_weight,
+                                          rest_weight=self.rest_weight, max_time_difference=mid.ticks_per_beat * 4)
 
-        plt.plot(profile, label="Boundary profile", color="purple")
-        plt.ylim(0, 1.1)
-        plt.scatter(range(len(profile)), profile, color="purple")
-        plt.axhline(max(k_means.cluster_centers_), color="r", label="K-means suggested boundary")
-        plt.axhline(0.5, color="g", label="Normal boundary")
+        # 1-D clustering with 2 clusters
+        if self.method == "kmeans":
+            threshold = k_means_threshold(profile)
+        else:
+            threshold = two_means_threshold(profile)
 
-        plt.legend()
-        plt.show()
+        if self.debug_hook is not None:
+            self.debug_hook(profile, threshold)
 
-        threshold = max(k_means.cluster_centers_)
         segments = []
         last_segmentation_index = -1
         for profile_index, boundary_strength in np.ndenumerate(profile):
@@ -59,10 +155,11 @@ class LbdmClusteringSegmenter(Segmenter):
             if timeline[profile_index[0]].end_time < mid.ticks_per_beat * 4:
                 pass
             elif boundary_strength > threshold:
-                segments.append(NoteSegment(mid, track_index, timeline[last_segmentation_index + 1:profile_index[0] + 1]))
+                segments.append(NoteSegment(mid, track_index,
+                                            SegmentView(timeline, last_segmentation_index + 1, profile_index[0] + 1),
+                                            chord_track_ind=chord_track_ind))
                 last_segmentation_index = profile_index[0]
 
-        segments.append(NoteSegment(mid, track_index, timeline[last_segmentation_index + 1:]))
+        segments.append(NoteSegment(mid, track_index, SegmentView(timeline, last_segmentation_index + 1, len(timeline)),
+                                    chord_track_ind=chord_track_ind))
         return segments
-
-
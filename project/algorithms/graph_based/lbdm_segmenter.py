@@ -1,18 +1,21 @@
-from typing import List
+from typing import List, Optional, Iterator, Sequence
 
 import numpy as np
-from mido import MidiTrack, MidiFile
+from mido import MidiFile
 
-from project.algorithms.graph_based import lbdm
+from project.algorithms.core.note_array import NoteArray
 from project.algorithms.core.segmenter import Segmenter
 from project.algorithms.core.note_segment import NoteSegment
-from project.algorithms.core.midtools import get_note_timeline
+from project.algorithms.core.segment_view import SegmentView
+from project.algorithms.core.feature_cache import get_cached_note_timeline, get_cached_lbdm_profile
+from project.algorithms.core.midtools import iter_windows
+from project.algorithms.graph_based import lbdm
 
 
 class LbdmSegmenter(Segmenter):
 
     def __init__(self, threshold: float = 0.5, pitch_weight: float = 0.25, ioi_weight: float = 0.5,
-                 rest_weight: float = 0.25):
+                 rest_weight: float = 0.25, window_size: Optional[int] = None):
         """
         A Segmenter which creates segments of music based on the LBDM algorithm (Cambouropoulos, 2001). See lbdm.py
         for how the segmentation works. In short the output of the LBDM algorithm is a boundary profile. This Segmenter
@@ -24,12 +27,19 @@ class LbdmSegmenter(Segmenter):
             pitch_weight: The relative weight of the changes in pitch
             ioi_weight: The relative weight of the changes in onset
             rest_weight: The relative wieght of the changes in rest (offset->onset)
+            window_size: If given, the LBDM profile is computed over windows of this many notes (at least 4) at a time
+                rather than over the whole track, so that very long tracks can be segmented in bounded memory. Each
+                window is normalised separately, so the segments may differ from those of the whole track.
         """
         super().__init__()
+        # consecutive windows overlap by 3 notes (see iter_segments), so a window needs at least one more note
+        if window_size is not None and window_size < 4:
+            raise ValueError(f"window_size must be at least 4, not {window_size}")
         self.threshold = threshold
         self.pitch_weight = pitch_weight
         self.ioi_weight = ioi_weight
         self.rest_weight = rest_weight
+        self.window_size = window_size
 
     def create_segments(self, mid: MidiFile, track_index: int, **kwargs) -> List[NoteSegment]:
         """
@@ -44,19 +54,19 @@ class LbdmSegmenter(Segmenter):
         Returns:
             A list of NoteSegments, the size and position of which being determined by the LBDM algorithm
         """
+        if self.window_size is not None:
+            return list(self.iter_segments(mid, track_index, **kwargs))
+
         # determine which track to segment
-        track: MidiTrack = mid.tracks[track_index]
         chord_track_ind = None
-        chord_track = None
         if "chord_track" in kwargs.keys() and kwargs["chord_track"] is not None:
             chord_track_ind = kwargs["chord_track"]
-            chord_track = mid.tracks[chord_track_ind]
 
-        # get list of notes within the track
-        timeline = get_note_timeline(track, chord_track)
+        # get list of notes within the track (both this and the profile are read from the feature cache, if enabled)
+        timeline = get_cached_note_timeline(mid, track_index, chord_track_ind)
         # get the lbdm "sequence profile" describing where segmentation should take place
-        profile, _ = lbdm.lbdm(timeline, pitch_weight=self.pitch_weight, ioi_weight=self.ioi_weight,
-                               rest_weight=self.rest_weight, max_time_difference=mid.ticks_per_beat * 4)
+        profile = get_cached_lbdm_profile(mid, track_index, pitch_weight=self.pitch_weight, ioi_weight=self.ioi_weight,
+                                          rest_weight=self.rest_weight, max_time_difference=mid.ticks_per_beat * 4)
         # profile contains values [0,1], though not necessarily always going up to 1.
         # some determination of the correct threshold given the lbdm profile. for simplicity here
         # we use a fixed threshold
@@ -67,11 +77,119 @@ class LbdmSegmenter(Segmenter):
             if timeline[profile_index[0]].end_time < mid.ticks_per_beat * 4:
                 pass
             elif boundary_strength > self.threshold:
-                segments.append(NoteSegment(mid, track_index, timeline[last_segmentation_index + 1:profile_index[0] + 1]
-                                            , chord_track_ind=chord_track_ind))
+                segments.append(NoteSegment(mid, track_index,
+                                            SegmentView(timeline, last_segmentation_index + 1, profile_index[0] + 1),
+                                            chord_track_ind=chord_track_ind))
                 last_segmentation_index = profile_index[0]
 
         # get last few notes
-        segments.append(NoteSegment(mid, track_index, timeline[last_segmentation_index + 1:],
+        segments.append(NoteSegment(mid, track_index, SegmentView(timeline, last_segmentation_index + 1, len(timeline)),
                                     chord_track_ind=chord_track_ind))
         return segments
+
+    def create_batch_segments(self, mids: Sequence[MidiFile], track_index: int, **kwargs) -> List[List[NoteSegment]]:
+        """
+        Create the segments of many MIDI files (e.g. every song of a corpus) at once. The notes of every file are
+        joined together and the LBDM profile of every file is computed in one go (see ``lbdm.lbdm_batch``), as are the
+        boundaries; only creating the segments themselves is done file by file. This gives the same segments as calling
+        ``create_segments`` on each file. If this segmenter has a ``window_size``, each file is segmented in turn.
+
+        Args:
+            mids: The MIDI files to segment
+            track_index: the track to segment with respect to (in every file)
+
+        Keyword Args:
+            chord_track: a track of each MIDI file only containing chords, if such a track exists
+
+        Returns:
+            A list containing the list of NoteSegments of each file, in the same order as the files
+        """
+        if self.window_size is not None:
+            return super().create_batch_segments(mids, track_index, **kwargs)
+
+        chord_track_ind = None
+        if "chord_track" in kwargs.keys() and kwargs["chord_track"] is not None:
+            chord_track_ind = kwargs["chord_track"]
+
+        timelines = [get_cached_note_timeline(mid, track_index, chord_track_ind) for mid in mids]
+        if len(timelines) == 0:
+            return []
+        notes = NoteArray.concatenate(timelines)
+        offsets = np.cumsum([0] + [len(timeline) for timeline in timelines], dtype=np.int64)
+        ticks_per_beat = np.array([mid.ticks_per_beat for mid in mids], dtype=np.int64)
+        profiles, profile_offsets = lbdm.lbdm_batch(notes, offsets, pitch_weight=self.pitch_weight,
+                                                    ioi_weight=self.ioi_weight, rest_weight=self.rest_weight,
+                                                    max_time_difference=ticks_per_beat * 4)
+
+        # the file of each profile value, and the note (within the file) before the boundary it describes
+        files = np.repeat(np.arange(len(timelines)), np.diff(profile_offsets))
+        profile_notes = np.arange(len(profiles)) - profile_offsets[files]
+        # ignore boundaries within the first few notes of a piece
+        is_boundary = (notes.end_times[offsets[files] + profile_notes] >= ticks_per_beat[files] * 4) & \
+                      (profiles > self.threshold)
+        boundary_files = files[is_boundary]
+        file_boundaries = np.split(profile_notes[is_boundary] + 1,
+                                   np.cumsum(np.bincount(boundary_files, minlength=len(timelines)))[:-1])
+
+        segments = []
+        for mid, timeline, boundaries in zip(mids, timelines, file_boundaries):
+            starts = [0] + boundaries.tolist()
+            stops = boundaries.tolist() + [len(timeline)]
+            segments.append([NoteSegment(mid, track_index, SegmentView(timeline, start, stop),
+                                         chord_track_ind=chord_track_ind) for start, stop in zip(starts, stops)])
+        return segments
+
+    def iter_segments(self, mid: MidiFile, track_index: int, **kwargs) -> Iterator[NoteSegment]:
+        """
+        Yield the segments created by the LBDM algorithm one at a time. If this segmenter has a ``window_size``, the
+        notes of the track are read one window at a time (with ``midtools.iter_windows``), so only the current window
+        and the notes of the current segment are held in memory. Otherwise, this is the same as ``create_segments``.
+
+        Args:
+            mid: The MIDI file to segment
+            track_index: the track to segment with respect to
+
+        Keyword Args:
+            chord_track: a track of the MIDI file only containing chords, if such a track exists
+
+        Returns:
+            An iterator over NoteSegments, the size and position of which being determined by the LBDM algorithm
+        """
+        if self.window_size is None:
+            yield from self.create_segments(mid, track_index, **kwargs)
+            return
+
+        chord_track_ind = None
+        if "chord_track" in kwargs.keys() and kwargs["chord_track"] is not None:
+            chord_track_ind = kwargs["chord_track"]
+        chord_track = mid.tracks[chord_track_ind] if chord_track_ind is not None else None
+
+        # consecutive windows overlap by 3 notes, so that the boundary strength of each interval is computed in a
+        # window that also contains the intervals either side of it
+        hop_size = self.window_size - 3
+        windows = iter_windows(mid.tracks[track_index], self.window_size, hop_size, chord_track=chord_track)
+        segment_notes = []
+        window_start = 0
+        window = next(windows, None)
+        while window is not None:
+            next_window = next(windows, None)
+            profile, _ = lbdm.lbdm(window, pitch_weight=self.pitch_weight, ioi_weight=self.ioi_weight,
+                                   rest_weight=self.rest_weight, max_time_difference=mid.ticks_per_beat * 4)
+            # only use the intervals at the edges of the window if they're also the edges of the track
+            first_interval = 0 if window_start == 0 else 1
+            last_interval = len(profile) if next_window is None else len(profile) - 1
+            for i in range(first_interval, last_interval):
+                segment_notes.append(window[i])
+                # ignore boundary if it's within the first few notes of a piece
+                if window.end_times[i] < mid.ticks_per_beat * 4:
+                    pass
+                elif profile[i] > self.threshold:
+                    yield NoteSegment(mid, track_index, segment_notes, chord_track_ind=chord_track_ind)
+                    segment_notes = []
+            if next_window is None:
+                segment_notes.append(window[len(window) - 1])
+            window = next_window
+            window_start += hop_size
+
+        # get last few notes
+        yield NoteSegment(mid, track_index, segment_notes, chord_track_ind=chord_track_ind)
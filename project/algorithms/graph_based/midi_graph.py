@@ -1,57 +1,130 @@
+import hashlib
 import pathlib
 
 import networkx
+import numpy as np
 
-from typing import Optional
+from typing import Optional, Union, List, Dict, Tuple
 from mido import MidiFile
 
 
+from project.algorithms.core.note_array import NoteArray
 from project.algorithms.core.note_segment import NoteSegment
+from project.algorithms.core.reduction_hierarchy import ReductionHierarchy
+from project.algorithms.core.smf_reader import SmfFile
+from project.algorithms.core.song_registry import Song, register_song, get_song_file
+
+# the kinds of node in a MidiGraph, as bit flags (a node can be both identifying and terminal)
+IDENTIFYING = 1
+REDUCTION = 2
+TERMINAL = 4
 
 
 class MidiGraph:
-    def __init__(self, mid_file: MidiFile, melody_track: int, chord_track: Optional[int] = None,
+    def __init__(self, mid_file: Union[MidiFile, SmfFile, Song], melody_track: int, chord_track: Optional[int] = None,
                  graph: Optional[networkx.Graph] = None):
         """
-        A graph of MIDI segments. Each node is primarily represented via a string, with the segments
-        themselves being added as extra data. Internally, this class uses a NetworkX graph.
+        A graph of MIDI segments. Each node is a segment (or one of its reductions), named by a string but stored by
+        an integer id (in the order the nodes were added): its ``ReductionHierarchy`` and level within it, and its
+        kind (see ``IDENTIFYING``, ``REDUCTION`` and ``TERMINAL``), and the fingerprint of its notes (see
+        ``NoteArray.fingerprint``), are stored as arrays indexed by the id. The
+        (undirected) edges are stored in compressed sparse row (CSR) form: the neighbours of node ``i`` are
+        ``indices[indptr[i]:indptr[i + 1]]``, with the weight of each edge in ``weights``. The CSR arrays are built
+        from the edges added with ``add_edge`` when they're first needed, after which no more nodes or edges should
+        be added.
+
+        A NetworkX graph of the nodes and edges can be created with ``to_networkx`` (e.g. to draw it).
 
         Args:
-            mid_file: The MIDI file this graph represents
+            mid_file: The MIDI file this graph represents (only its Song is kept)
             melody_track: The MIDI track index used to create the segments in the graph
             chord_track: The MIDI track index containing the chords of the MIDI, if it exists
-            graph: If not None, use an existing NetworkX graph as the internal graph
+            graph: If not None, the nodes (which must have ``hierarchy`` and ``level`` data) and edges (with their
+                weight as ``label``) of this NetworkX graph are added to the new graph
         """
-        if graph is not None:
-            self.__graph = graph
-        else:
-            self.__graph = networkx.Graph()
-        self.mid_file = mid_file
+        self.song = register_song(mid_file)
         self.melody_track = melody_track
         self.chord_track = chord_track
 
-    def add_node(self, node_name: str, segment: NoteSegment):
+        self.node_names: List[str] = []
+        self.hierarchies: List[ReductionHierarchy] = []
+        self.node_hierarchies = np.empty(0, dtype=np.int32)
+        self.node_levels = np.empty(0, dtype=np.int16)
+        self.node_kinds = np.empty(0, dtype=np.uint8)
+        self.node_fingerprints = np.empty(0, dtype=np.uint64)
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.empty(0, dtype=np.int32)
+        self.weights = np.empty(0, dtype=np.float32)
+
+        self.__node_ids: Dict[str, int] = {}
+        self.__hierarchy_ids: Dict[int, int] = {}
+        # nodes and edges added since the arrays were last built
+        self.__new_nodes: List[Tuple[int, int, int, int]] = []
+        self.__new_edges: List[Tuple[int, int, float]] = []
+        # the (roots, depths) of the chains of the graph (see get_chains), found when they're first needed (or an
+        # empty tuple if the graph isn't a forest of chains)
+        self.__chains: Optional[Tuple] = None
+        # the digest of the graph (see get_digest), found when it's first needed
+        self.__digest: Optional[int] = None
+
+        if graph is not None:
+            for node, node_data in graph.nodes(data=True):
+                self.add_node(node, node_data["hierarchy"], node_data["level"])
+            for n1, n2, edge_data in graph.edges(data=True):
+                self.add_edge(n1, n2, float(edge_data["label"]))
+
+    @property
+    def mid_file(self) -> Union[MidiFile, SmfFile]:
+        """
+        Returns the MIDI file this graph represents, reading it again if it's no longer in memory
+
+        Returns:
+            The MIDI file this graph represents
+        """
+        return get_song_file(self.song)
+
+    @property
+    def num_nodes(self) -> int:
+        """
+        Returns the number of nodes in the graph
+
+        Returns:
+            The number of nodes
+        """
+        return len(self.node_names)
+
+    def add_node(self, node_name: str, hierarchy: ReductionHierarchy, level: int):
         """
         Add a node to the graph. A node consists of a string (essentially a key) and the corresponding segment.
-        
+
         Args:
             node_name: A string which will become the node name
-            segment: The segment associated with node_name
+            hierarchy: The reductions of the segment associated with node_name
+            level: The level of ``hierarchy`` (i.e. the reduction) associated with node_name
 
         """
-        self.__graph.add_node(pathlib.Path(node_name).stem, shape="box",
-                              segment=segment)
+        if id(hierarchy) not in self.__hierarchy_ids:
+            self.__hierarchy_ids[id(hierarchy)] = len(self.hierarchies)
+            self.hierarchies.append(hierarchy)
+
+        kind = IDENTIFYING if level == 0 else REDUCTION
+        if level == hierarchy.num_levels - 1:
+            kind |= TERMINAL
+
+        name = pathlib.Path(node_name).stem
+        self.__node_ids[name] = len(self.node_names)
+        self.node_names.append(name)
+        self.__new_nodes.append((self.__hierarchy_ids[id(hierarchy)], level, kind, hierarchy.get_fingerprint(level)))
 
-    def add_identifying_node(self, node_name: str, segment: NoteSegment):
+    def add_identifying_node(self, node_name: str, hierarchy: ReductionHierarchy):
         """
         Add an *identifying* node to the graph: this means an original segment that wasn't reduced.
 
         Args:
             node_name: The name of the identifying node
-            segment: The segment associated with node_name
+            hierarchy: The reductions of the segment associated with node_name (the node being level 0)
         """
-        self.__graph.add_node(pathlib.Path(node_name).stem, label="original_" + pathlib.Path(node_name).stem,
-                              style="filled", fillcolor="gray", fontcolor="white", shape="box", segment=segment)
+        self.add_node(node_name, hierarchy, 0)
 
     def add_edge(self, n1: str, n2: str, weight: float = 1):
         """
@@ -63,7 +136,151 @@ class MidiGraph:
             weight: The weight of the edge between n1 and n2. The default weight is 1.
 
         """
-        self.__graph.add_edge(pathlib.Path(n1).stem, pathlib.Path(n2).stem, label=weight)
+        self.__new_edges.append((self.__node_ids[pathlib.Path(n1).stem], self.__node_ids[pathlib.Path(n2).stem],
+                                 weight))
+
+    def get_node_id(self, node: Union[str, int]) -> int:
+        """
+        Returns the integer id of a node
+
+        Args:
+            node: The name (or id) of the node
+
+        Returns:
+            The id of the node
+        """
+        return node if isinstance(node, (int, np.integer)) else self.__node_ids[node]
+
+    def get_neighbours(self, node: Union[str, int]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the neighbours of a node, and the weight of the edge to each of them
+
+        Args:
+            node: The name (or id) of the node
+
+        Returns:
+            A (neighbours, weights) pair of arrays: the id of each neighbour, and the weight of the edge to it
+        """
+        self.__build()
+        node_id = self.get_node_id(node)
+        first, last = self.indptr[node_id], self.indptr[node_id + 1]
+        return self.indices[first:last], self.weights[first:last]
+
+    def get_nodes_of_kind(self, kind: int) -> np.ndarray:
+        """
+        Returns the nodes of a kind, e.g. ``IDENTIFYING`` for the nodes of the original segments
+
+        Args:
+            kind: The kind of node
+
+        Returns:
+            The ids of the nodes of that kind, in order
+        """
+        self.__build()
+        return np.flatnonzero(self.node_kinds & kind)
+
+    def get_notes(self, node: Union[str, int]) -> NoteArray:
+        """
+        Returns the notes of the segment associated with a node
+
+        Args:
+            node: The name (or id) of the node
+
+        Returns:
+            The notes of the segment (or reduction) associated with the node
+        """
+        self.__build()
+        node_id = self.get_node_id(node)
+        return self.hierarchies[self.node_hierarchies[node_id]].get_notes(int(self.node_levels[node_id]))
+
+    def get_number_of_notes(self, node: Union[str, int]) -> int:
+        """
+        Returns the number of notes in the segment associated with a node
+
+        Args:
+            node: The name (or id) of the node
+
+        Returns:
+            The number of notes in the segment (or reduction) associated with the node
+        """
+        self.__build()
+        node_id = self.get_node_id(node)
+        return self.hierarchies[self.node_hierarchies[node_id]].get_number_of_notes(int(self.node_levels[node_id]))
+
+    def get_segment(self, node: Union[str, int]) -> NoteSegment:
+        """
+        Create a NoteSegment of the segment associated with a node, e.g. to save it as a MIDI file
+
+        Args:
+            node: The name (or id) of the node
+
+        Returns:
+            A NoteSegment of the segment (or reduction) associated with the node
+        """
+        self.__build()
+        node_id = self.get_node_id(node)
+        level = int(self.node_levels[node_id])
+        # only the original segments have chords (as with the segments created by reduce_segment)
+        chord_track = self.chord_track if level == 0 else None
+        return self.hierarchies[self.node_hierarchies[node_id]].get_segment(level, self.song, self.melody_track,
+                                                                            chord_track)
+
+    def get_chains(self) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Returns the chains of the graph, if it's a forest of chains: i.e. if every edge joins consecutive levels of the
+        same hierarchy, and every node above level 0 is joined to the level below it (as in the graphs created by
+        ``segment_graph``). Each chain then starts at an identifying node, and the distance between two nodes of a
+        chain is the difference between their depths.
+
+        Returns:
+            A (roots, depths) pair of arrays: the id of the node at the start of the chain of each node, and the
+            length of the path from it to each node. If the graph isn't a forest of chains, None is returned.
+        """
+        self.__build()
+        if self.__chains is None:
+            self.__chains = self.__find_chains()
+        # an empty tuple means the graph isn't a forest of chains
+        return self.__chains if len(self.__chains) > 0 else None
+
+    def get_digest(self) -> int:
+        """
+        Returns a hash of the nodes (their kinds and fingerprints) and the edges of the graph, which changes whenever
+        the graph does, e.g. so that an index of the graph can tell whether it's out of date.
+
+        Returns:
+            The hash of the graph, as an unsigned 64-bit integer
+        """
+        self.__build()
+        if self.__digest is None:
+            digest = hashlib.blake2b(digest_size=8)
+            for array in (self.node_kinds, self.node_fingerprints, self.indptr, self.indices, self.weights):
+                digest.update(np.ascontiguousarray(array).tobytes())
+            self.__digest = int.from_bytes(digest.digest(), "little")
+        return self.__digest
+
+    def to_networkx(self) -> networkx.Graph:
+        """
+        Create a NetworkX graph of this graph, with the same node names, and the weight of each edge as its ``label``.
+        Each node has its ``hierarchy`` and ``level`` as data, along with attributes for drawing it.
+
+        Returns:
+            A new NetworkX graph of this graph
+        """
+        self.__build()
+        graph = networkx.Graph()
+        for node_id, name in enumerate(self.node_names):
+            hierarchy = self.hierarchies[self.node_hierarchies[node_id]]
+            level = int(self.node_levels[node_id])
+            if self.node_kinds[node_id] & IDENTIFYING:
+                graph.add_node(name, label="original_" + name, style="filled", fillcolor="gray", fontcolor="white",
+                               shape="box", hierarchy=hierarchy, level=level)
+            else:
+                graph.add_node(name, shape="box", hierarchy=hierarchy, level=level)
+        sources = np.repeat(np.arange(self.num_nodes), np.diff(self.indptr))
+        for source, target, weight in zip(sources.tolist(), self.indices.tolist(), self.weights.tolist()):
+            if source < target:
+                graph.add_edge(self.node_names[source], self.node_names[target], label=weight)
+        return graph
 
     def draw(self, path: str):
         """
@@ -72,19 +289,105 @@ class MidiGraph:
         Args:
             path: The path to save the drawing of the graph
         """
-        agraph = networkx.drawing.nx_agraph.to_agraph(self.__graph)
+        agraph = networkx.drawing.nx_agraph.to_agraph(self.to_networkx())
         agraph.layout("dot")
         agraph.draw(path)
 
     def get_copy_of_graph(self) -> networkx.Graph:
         """
-        Return a copy of the internal graph
+        Return a copy of the internal graph, as a NetworkX graph (see ``to_networkx``)
 
         Returns:
             A copy of the internal graph
 
         """
-        return self.__graph.copy()
+        return self.to_networkx()
+
+    def __build(self):
+        """
+        Add the nodes and edges added since the arrays of this graph were last built to the arrays
+        """
+        if len(self.__new_nodes) > 0:
+            hierarchies, levels, kinds, fingerprints = zip(*self.__new_nodes)
+            self.node_hierarchies = np.concatenate((self.node_hierarchies, np.array(hierarchies, dtype=np.int32)))
+            self.node_levels = np.concatenate((self.node_levels, np.array(levels, dtype=np.int16)))
+            self.node_kinds = np.concatenate((self.node_kinds, np.array(kinds, dtype=np.uint8)))
+            self.node_fingerprints = np.concatenate((self.node_fingerprints, np.array(fingerprints, dtype=np.uint64)))
+            self.__new_nodes = []
+
+        if len(self.__new_edges) > 0 or len(self.indptr) != self.num_nodes + 1:
+            # the existing edges, followed by the new ones in both directions (a later edge between the same nodes
+            # replaces an earlier one)
+            sources = np.repeat(np.arange(len(self.indptr) - 1), np.diff(self.indptr))
+            new_edges = np.array([(n1, n2) for n1, n2, _ in self.__new_edges], dtype=np.int64).reshape(-1, 2)
+            new_weights = np.array([weight for _, _, weight in self.__new_edges], dtype=np.float32)
+            sources = np.concatenate((sources, new_edges[:, 0], new_edges[:, 1]))
+            targets = np.concatenate((self.indices, new_edges[:, 1], new_edges[:, 0]))
+            weights = np.concatenate((self.weights, new_weights, new_weights))
+
+            # keep the last edge between each pair of nodes, in order of source then target
+            order = np.lexsort((-np.arange(len(sources)), targets, sources))
+            sources, targets, weights = sources[order], targets[order], weights[order]
+            first = np.ones(len(sources), dtype=bool)
+            first[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+            sources, targets, weights = sources[first], targets[first], weights[first]
+
+            self.indptr = np.concatenate(([0], np.cumsum(np.bincount(sources, minlength=self.num_nodes))))\
+                .astype(np.int64)
+            self.indices = targets.astype(np.int32)
+            self.weights = weights
+            self.__new_edges = []
+            self.__chains = None
+            self.__digest = None
+
+    def __find_chains(self) -> Tuple:
+        """
+        Find the chains of the graph (see ``get_chains``)
+
+        Returns:
+            The (roots, depths) pair of arrays, or an empty tuple if the graph isn't a forest of chains
+        """
+        sources = np.repeat(np.arange(self.num_nodes), np.diff(self.indptr))
+        targets = self.indices
+        levels = self.node_levels.astype(np.int64)
+        if np.any(self.node_hierarchies[sources] != self.node_hierarchies[targets]) or \
+                np.any(np.abs(levels[sources] - levels[targets]) != 1):
+            return ()
+        # each level of a hierarchy has one node, which (above level 0) is joined to the node below it
+        keys = self.node_hierarchies.astype(np.int64) * (int(levels.max(initial=0)) + 1) + levels
+        if len(np.unique(keys)) != self.num_nodes:
+            return ()
+        down = levels[targets] < levels[sources]
+        if np.any(np.bincount(sources[down], minlength=self.num_nodes) != (levels > 0)):
+            return ()
 
+        parents = np.arange(self.num_nodes)
+        parents[sources[down]] = targets[down]
+        parent_weights = np.zeros(self.num_nodes)
+        parent_weights[sources[down]] = self.weights[down]
+        roots = np.arange(self.num_nodes)
+        depths = np.zeros(self.num_nodes)
+        # walk up the chains one level at a time
+        for level in range(1, int(levels.max(initial=0)) + 1):
+            nodes = np.flatnonzero(levels == level)
+            roots[nodes] = roots[parents[nodes]]
+            depths[nodes] = depths[parents[nodes]] + parent_weights[nodes]
+        return roots, depths
 
+    def __getstate__(self):
+        self.__build()
+        state = self.__dict__.copy()
+        # the node ids can be found again from the names, the hierarchies don't need to be looked up any more, and
+        # the chains and digest can be found again
+        del state["_MidiGraph__node_ids"]
+        del state["_MidiGraph__hierarchy_ids"]
+        del state["_MidiGraph__chains"]
+        del state["_MidiGraph__digest"]
+        return state
 
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__node_ids = {name: node_id for node_id, name in enumerate(self.node_names)}
+        self.__hierarchy_ids = {id(hierarchy): index for index, hierarchy in enumerate(self.hierarchies)}
+        self.__chains = None
+        self.__digest = None
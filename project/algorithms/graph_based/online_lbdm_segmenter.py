@@ -0,0 +1,272 @@
+from typing import List, Optional, Iterator, Tuple
+
+from mido import MidiFile
+
+from project.algorithms.core.midtools import iter_notes
+from project.algorithms.core.note import Note
+from project.algorithms.core.note_array import NoteArray
+from project.algorithms.core.note_segment import NoteSegment
+from project.algorithms.core.segmenter import Segmenter
+
+
+class LbdmStream:
+
+    def __init__(self, threshold: float, pitch_weight: float, ioi_weight: float, rest_weight: float,
+                 ticks_per_beat: int, max_pitch_difference: int = 12, warm_up: int = 32):
+        """
+        Segments a stream of notes with the LBDM algorithm as the notes arrive (see ``OnlineLbdmSegmenter``). The
+        boundary strength of each interval only depends on the interval before and after it, so only the intervals of
+        the current segment are kept, along with the largest (unnormalised) value of each profile so far, which is used
+        to normalise the profiles in place of their maximum over the whole track.
+
+        Near the start of the stream the largest values so far are poor estimates of the maxima (the first interval
+        would always be scored against itself, and so always be a boundary), so no boundary is decided until the
+        profiles of ``warm_up`` intervals are known. After that, a segment is returned as soon as the interval after
+        its last note is known to be a boundary, i.e. one note after it ends.
+
+        Args:
+            threshold: If the boundary strength of an interval is above this value, the notes are split there
+            pitch_weight: The relative weight of the changes in pitch
+            ioi_weight: The relative weight of the changes in onset
+            rest_weight: The relative weight of the changes in rest (offset->onset)
+            ticks_per_beat: The ticks per beat of the notes. The maximum inter-onset/rest interval is 4 beats, and no
+                boundaries are placed within the first 4 beats of the stream (counted from its first note, as a stream
+                such as a query may start at any time)
+            max_pitch_difference: The maximum value that a pitch interval can be
+            warm_up: The number of intervals whose profiles are known before any boundary is decided
+        """
+        self.threshold = threshold
+        self.weights = (pitch_weight, ioi_weight, rest_weight)
+        self.ticks_per_beat = ticks_per_beat
+        self.max_pitch_difference = max_pitch_difference
+        self.max_time_difference = ticks_per_beat * 4
+        self.warm_up = warm_up
+        # the notes of the current segment, the (pitch, ioi, rest) intervals between them, and the (unnormalised)
+        # profile values of the intervals whose neighbours are both known
+        self.notes: List[Note] = []
+        self.intervals: List[Tuple[int, int, int]] = []
+        self.values: List[Tuple[float, float, float]] = []
+        # the number of intervals of the current segment which have been checked, and aren't boundaries
+        self.num_checked = 0
+        # the interval before the first interval of the current segment (if there is one)
+        self.previous_interval: Optional[Tuple[int, int, int]] = None
+        # the largest value of the (pitch, ioi, rest) profiles so far, and the number of intervals they're taken from
+        self.maxima = [0.0, 0.0, 0.0]
+        self.num_values = 0
+        # the onset of the first note of the stream
+        self.start_time: Optional[int] = None
+
+    def add_note(self, note: Note) -> List[NoteArray]:
+        """
+        Add the next note of the stream (in order of onset)
+
+        Args:
+            note: The note to add
+
+        Returns:
+            The notes of each segment which this note completes (usually none or one, but the segments found during
+            the warm up are all returned at the end of it)
+        """
+        if self.start_time is None:
+            self.start_time = note.start_time
+        if len(self.notes) > 0:
+            self.intervals.append(self.__get_interval(self.notes[-1], note))
+            # the interval before the last one now has intervals on both sides
+            if len(self.intervals) >= 2:
+                self.__add_values(self.intervals[-1])
+        self.notes.append(note)
+        return self.__find_boundaries(self.num_values >= self.warm_up)
+
+    def finish(self) -> List[NoteArray]:
+        """
+        End the stream, returning the remaining notes
+
+        Returns:
+            A list of the segments left in the stream (which is empty if there are no notes left)
+        """
+        if len(self.intervals) > 0:
+            # the last interval has no interval after it
+            self.__add_values(None)
+        segments = self.__find_boundaries(True)
+        if len(self.notes) > 0:
+            segments.append(NoteArray.from_notes(self.notes))
+        self.notes = []
+        self.intervals = []
+        self.values = []
+        self.num_checked = 0
+        self.previous_interval = None
+        return segments
+
+    def __get_interval(self, first: Note, second: Note) -> Tuple[int, int, int]:
+        """
+        Returns the (pitch, ioi, rest) interval between two consecutive notes, truncated as in ``lbdm.lbdm``
+
+        Args:
+            first: The first note
+            second: The note after it
+
+        Returns:
+            The pitch, inter-onset and rest intervals between the notes
+        """
+        return (min(abs(second.pitch - first.pitch), self.max_pitch_difference),
+                min(second.start_time - first.start_time, self.max_time_difference),
+                min(second.start_time - first.end_time, self.max_time_difference))
+
+    def __add_values(self, next_interval: Optional[Tuple[int, int, int]]):
+        """
+        Compute the (unnormalised) profile values of the first interval of the current segment without any, now that
+        the interval after it is known.
+
+        Args:
+            next_interval: The interval after it, or None if it's the last interval of the stream
+        """
+        index = len(self.values)
+        interval = self.intervals[index]
+        previous = self.intervals[index - 1] if index > 0 else self.previous_interval
+        values = []
+        for feature in range(3):
+            # as in lbdm.lbdm, an interval without a neighbour uses its pitch interval in place of it
+            previous_value = previous[feature] if previous is not None else interval[0]
+            next_value = next_interval[feature] if next_interval is not None else interval[0]
+            value = interval[feature] * (LbdmStream.__degree_of_change(int(previous_value), int(interval[feature])) +
+                                         LbdmStream.__degree_of_change(int(interval[feature]), int(next_value))) + 1
+            self.maxima[feature] = max(self.maxima[feature], value)
+            values.append(value)
+        self.values.append((values[0], values[1], values[2]))
+        self.num_values += 1
+
+    def __find_boundaries(self, can_split: bool) -> List[NoteArray]:
+        """
+        Check each interval of the current segment whose profile values are known (and which hasn't been checked
+        already), splitting the segment at each boundary.
+
+        Args:
+            can_split: Whether boundaries can be decided yet (if not, no interval is checked)
+
+        Returns:
+            The notes before each boundary that was found
+        """
+        segments = []
+        while can_split and self.num_checked < len(self.values):
+            index = self.num_checked
+            strength = 0
+            for feature in range(3):
+                if self.maxima[feature] != 0:
+                    strength += self.weights[feature] * self.values[index][feature] / self.maxima[feature]
+
+            # ignore boundary if it's within the first few notes of the stream
+            if self.notes[index].end_time - self.start_time < self.ticks_per_beat * 4 or strength <= self.threshold:
+                self.num_checked += 1
+                continue
+            segments.append(NoteArray.from_notes(self.notes[:index + 1]))
+            self.notes = self.notes[index + 1:]
+            self.previous_interval = self.intervals[index]
+            self.intervals = self.intervals[index + 1:]
+            self.values = self.values[index + 1:]
+            self.num_checked = 0
+        return segments
+
+    @staticmethod
+    def __degree_of_change(x1: int, x2: int) -> float:
+        """
+        The relative difference between two intervals (the default change function of ``lbdm.lbdm``). Like it, this
+        raises a ZeroDivisionError for non-zero intervals which sum to 0 (i.e. a rest interval of an overlapping note
+        next to one of the opposite length).
+
+        Args:
+            x1: The first interval
+            x2: The second interval
+
+        Returns:
+            The relative difference between the intervals
+        """
+        if x1 == 0 and x2 == 0:
+            return 0
+        else:
+            return abs(x1 - x2) / (x1 + x2)
+
+
+class OnlineLbdmSegmenter(Segmenter):
+
+    def __init__(self, threshold: float = 0.5, pitch_weight: float = 0.25, ioi_weight: float = 0.5,
+                 rest_weight: float = 0.25, warm_up: int = 32):
+        """
+        A Segmenter which, like ``LbdmSegmenter``, splits music at the boundaries found by the LBDM algorithm, but
+        which segments the notes as they arrive rather than needing the whole track up front (see ``LbdmStream``). This
+        means the segments of a query being played (e.g. hummed) can be reduced and matched before it ends (see
+        ``query_graph_based.query_graph_progressive``).
+
+        As the profiles are normalised by their largest value *so far* rather than over the whole track, the
+        boundaries may differ from those of ``LbdmSegmenter``, especially near the start of a track (though no boundary
+        is decided until ``warm_up`` intervals are known, see ``LbdmStream``).
+
+        Args:
+            threshold: If the boundary strength of an interval is above this value, the notes are split there
+            pitch_weight: The relative weight of the changes in pitch
+            ioi_weight: The relative weight of the changes in onset
+            rest_weight: The relative weight of the changes in rest (offset->onset)
+            warm_up: The number of intervals whose profiles are known before any boundary is decided
+        """
+        super().__init__()
+        self.threshold = threshold
+        self.pitch_weight = pitch_weight
+        self.ioi_weight = ioi_weight
+        self.rest_weight = rest_weight
+        self.warm_up = warm_up
+
+    def create_stream(self, ticks_per_beat: int) -> LbdmStream:
+        """
+        Start segmenting a new stream of notes, e.g. a query as it is being played. Add each note to the stream with
+        ``LbdmStream.add_note``, and call ``LbdmStream.finish`` when the stream ends.
+
+        Args:
+            ticks_per_beat: The ticks per beat of the notes
+
+        Returns:
+            A new LbdmStream using the parameters of this segmenter
+        """
+        return LbdmStream(self.threshold, self.pitch_weight, self.ioi_weight, self.rest_weight, ticks_per_beat,
+                          warm_up=self.warm_up)
+
+    def create_segments(self, mid: MidiFile, track_index: int, **kwargs) -> List[NoteSegment]:
+        """
+        Create segments by feeding the notes of the track to an LbdmStream one at a time.
+
+        Args:
+            mid: The MIDI file to segment
+            track_index: the track to segment with respect to
+
+        Keyword Args:
+            chord_track: a track of the MIDI file only containing chords, if such a track exists
+
+        Returns:
+            A list of NoteSegments, the size and position of which being determined by the LBDM algorithm
+        """
+        return list(self.iter_segments(mid, track_index, **kwargs))
+
+    def iter_segments(self, mid: MidiFile, track_index: int, **kwargs) -> Iterator[NoteSegment]:
+        """
+        Yield each segment as soon as it's found, reading the notes of the track as they're needed (with
+        ``midtools.iter_notes``).
+
+        Args:
+            mid: The MIDI file to segment
+            track_index: the track to segment with respect to
+
+        Keyword Args:
+            chord_track: a track of the MIDI file only containing chords, if such a track exists
+
+        Returns:
+            An iterator over NoteSegments, the size and position of which being determined by the LBDM algorithm
+        """
+        chord_track_ind = None
+        if "chord_track" in kwargs.keys() and kwargs["chord_track"] is not None:
+            chord_track_ind = kwargs["chord_track"]
+        chord_track = mid.tracks[chord_track_ind] if chord_track_ind is not None else None
+
+        stream = self.create_stream(mid.ticks_per_beat)
+        for note in iter_notes(mid.tracks[track_index], chord_track=chord_track):
+            for notes in stream.add_note(note):
+                yield NoteSegment(mid, track_index, notes, chord_track_ind=chord_track_ind)
+        for notes in stream.finish():
+            yield NoteSegment(mid, track_index, notes, chord_track_ind=chord_track_ind)
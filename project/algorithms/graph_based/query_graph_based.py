@@ -1,45 +1,160 @@
+import heapq
 import pathlib
 import time
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple, Sequence, Iterator
 
-import networkx
+import numpy as np
 import pandas as pd
-from mido import MidiFile
-from networkx import astar_path_length
 from networkx.drawing.nx_pydot import write_dot
 from tqdm import tqdm
 
 from project.algorithms.core import constants
-from project.algorithms.graph_based.midi_graph import MidiGraph
+from project.algorithms.graph_based.fingerprint_index import FingerprintIndex
+from project.algorithms.graph_based.midi_graph import MidiGraph, IDENTIFYING, TERMINAL
+from project.algorithms.graph_based.online_lbdm_segmenter import OnlineLbdmSegmenter
+from project.algorithms.graph_based.query_overlay import QueryOverlay
+from project.algorithms.core.note_array import NoteArray
 from project.algorithms.core.note_segment import NoteSegment
 from project.algorithms.core.midtools import get_note_timeline
+from project.algorithms.core.smf_reader import SmfFile
 
 
-def query_graph(midi_path: str, melody_track: int, use_minimum: bool,
-                write_graphs: bool, graphs: List[MidiGraph], chord_track: Optional[int] = None) -> Dict[str, float]:
+def __score_graph(midi_graph: MidiGraph, query_notes: List[NoteArray], query_fingerprints: Dict[int, List[int]],
+                  chain_weights: List[float], nodes: Sequence[int],
+                  non_connected_penalty: float) -> Tuple[float, float, QueryOverlay]:
     """
-    Run *Query by Example*, trying to guess the parent song of the MIDI file located at ``midi_path``,
-    with the known set of songs as graphs ``graphs`` being used.
+    Lay a query over the graph of a song, and find the average and minimum distance between the query and the
+    original segments of the song.
 
     Args:
-        midi_path: The path to the Query MIDI file that we want to find the parent song of.
-        melody_track: The track containing the melody of the MIDI at midi_path
-        use_minimum: Whether to use the min distance between segments instead of the average distance
-        write_graphs: If True, writes graphs containing the query segment and the original graph to query_output/graphs/
-        graphs: The index of graphs to use
-        chord_track: The index of the track containing the chords of the Query MIDI file, if it exists
+        midi_graph: The graph of the song
+        query_notes: The notes of the query followed by the notes of each of its reductions
+        query_fingerprints: The fingerprint of each of ``query_notes``, mapped to their indices
+        chain_weights: The weight of each reduction of the query
+        nodes: The nodes of the graph which may need to be joined to the query (every node, unless some are known not
+            to need an edge)
+        non_connected_penalty: The weight of the edges to segments which don't match any reduction, and the distance
+            of segments with no path to the query
 
     Returns:
-        A dictionary containing the distance between the query and each known file in the indexed dataset.
+        The average and minimum distance, and the graph with the query laid over it
     """
+    # lay the query node and its reductions over the graph (rather than adding them to a copy of it)
+    overlay = QueryOverlay(midi_graph, chain_weights)
+    last_query_node = overlay.get_query_node(len(chain_weights))
+    original_nodes = midi_graph.get_nodes_of_kind(IDENTIFYING)
+    # iterate through each node in the graph of the music piece, adding edges between those nodes and the reductions
+    # we just computed for the query node
+    for node in nodes:
+        # find the query notes with the same fingerprint as this graph position, only loading its notes to make
+        # sure they really are the same (in case two fingerprints collide)
+        matches = [i for i in query_fingerprints.get(int(midi_graph.node_fingerprints[node]), [])
+                   if query_notes[i] == midi_graph.get_notes(node)]
+        if len(matches) > 0 and matches[0] == 0:
+            # dot.add_edge("query", node, label=0, color="blue")
+            continue
+        else:
+            if midi_graph.get_number_of_notes(node) == 1:
+                overlay.add_edge(last_query_node, node, non_connected_penalty)
+                continue
 
-    query_file = MidiFile(midi_path)
-    metric = "Minimum" if use_minimum else "Average"
-    non_connected_penalty = 100
-    curr_time = time.strftime(constants.TIME_FORMAT)
-    notes = get_note_timeline(query_file.tracks[melody_track], query_file.tracks[chord_track] if chord_track is not None else None)
-    query_segment = NoteSegment(query_file, melody_track, notes,chord_track)
+            if len(matches) > 0:
+                # the first matching reduction
+                overlay.add_edge(overlay.get_query_node(matches[0]), node, 0)
+                last_node = overlay.get_query_node(matches[0])
+            else:
+                last_node = last_query_node
+
+            if midi_graph.node_kinds[node] & TERMINAL:
+                # if there are no matching reductions
+                # add an edge of weight 1 between the last reduction and this node
+                # if it's the last reduced node
+                overlay.add_edge(last_node, node, non_connected_penalty)
+
+    # we've added the query segment and reductions: now we can compute the distance of the shortest path to every
+    # original segment at once
+    path_lengths = overlay.shortest_path_lengths(overlay.get_query_node(0), original_nodes)
+    is_connected = path_lengths != float("inf")
+    # add a large penalty for a lack of connections
+    for original_node in original_nodes[~is_connected].tolist():
+        print(f"No path between {midi_graph.node_names[original_node]} and query")
+    total_path_length = float(np.sum(path_lengths[is_connected])) + non_connected_penalty * \
+        int(np.count_nonzero(~is_connected))
+    min_path_length = float(np.min(path_lengths, initial=float("inf")))
+    return total_path_length / len(original_nodes), min_path_length, overlay
+
+
+def __get_lower_bound(midi_graph: MidiGraph, use_minimum: bool, chain_weights: List[float],
+                      non_connected_penalty: float, index: Optional[FingerprintIndex],
+                      matching_nodes: Optional[Dict[str, np.ndarray]]) -> float:
+    """
+    Returns a lower bound on the distance between a query and a song, without laying the query over its graph.
+
+    The query itself is never joined to the graph, so every path starts along the chain of the query, and can't be
+    shorter than its first reduction (if the query has no reductions, the query is only joined to the graph by penalty
+    edges). If the graphs are indexed, the distance of a song without any matching nodes is known exactly, and
+    otherwise (if the graph is a forest of chains, see ``MidiGraph.get_chains``) the segments without a matching node
+    can only be reached through a penalty edge.
 
+    Args:
+        midi_graph: The graph of the song
+        use_minimum: Whether the minimum distance between segments is used instead of the average distance
+        chain_weights: The weight of each reduction of the query
+        non_connected_penalty: The weight of the edges to segments which don't match any reduction
+        index: The FingerprintIndex of the graphs, if there is one
+        matching_nodes: The nodes of each song found in the index, if there is one
+
+    Returns:
+        A distance which the distance between the query and the song is at least
+    """
+    first_reduction = chain_weights[0] if len(chain_weights) > 0 else 0
+    shortest_path = first_reduction if len(chain_weights) > 0 else non_connected_penalty
+    if matching_nodes is None or not index.is_indexed(midi_graph):
+        return shortest_path
+
+    song_name = pathlib.Path(midi_graph.song.filename).stem
+    if song_name not in matching_nodes:
+        path_lengths = index.get_unmatched_path_lengths(midi_graph, sum(chain_weights), non_connected_penalty)
+        if path_lengths is None:
+            return shortest_path
+        average_path_length, min_path_length = path_lengths
+        return min_path_length if use_minimum else average_path_length
+    elif use_minimum:
+        return shortest_path
+
+    chains = midi_graph.get_chains()
+    if chains is None:
+        # a matching node may be shared by (and reach) any number of segments, so nothing more is known
+        return shortest_path
+    # the number of segments which have a node matching the query, which might be reached without a penalty edge
+    num_segments = int(index.num_segments[index.song_ids[song_name]])
+    num_matching = len(np.unique(chains[0][matching_nodes[song_name]]))
+    return (num_matching * shortest_path + (num_segments - num_matching) * (first_reduction + non_connected_penalty)) \
+        / num_segments
+
+
+def __rank_query(query_segment: NoteSegment, graphs: List[MidiGraph], use_minimum: bool, query_name: str,
+                 index: Optional[FingerprintIndex] = None, top_k: Optional[int] = None,
+                 graph_folder: Optional[str] = None) -> Dict[str, float]:
+    """
+    Find the distance between a query segment and each song (or only the ``top_k`` most similar songs), as described
+    in ``query_graph``.
+
+    Args:
+        query_segment: The query
+        graphs: The graphs of the songs
+        use_minimum: Whether to use the min distance between segments instead of the average distance
+        query_name: The name of the query (shown in the progress bar)
+        index: The FingerprintIndex of the graphs, if they've been indexed
+        top_k: If given, only the ``top_k`` most similar songs are scored (see ``query_graph``)
+        graph_folder: If given, the graph of each song with the query laid over it is written to this folder (and the
+            index isn't used)
+
+    Returns:
+        A dictionary containing the distance between the query and each song that was scored, in the order they were
+        scored
+    """
+    non_connected_penalty = 100
     query_reduced_segments = []
     current_segment = query_segment
 
@@ -49,107 +164,178 @@ def query_graph(midi_path: str, melody_track: int, use_minimum: bool,
         query_reduced_segments.append((weight, reduced_segment))
         current_segment = reduced_segment
 
+    # the fingerprint of the query (0) and each of its reductions (1 onwards), so that they can be matched with the
+    # nodes of each graph by comparing integers
+    query_notes = [query_segment.notes] + [r_segment.notes for _, r_segment in query_reduced_segments]
+    query_fingerprints: Dict[int, List[int]] = {}
+    for i, notes in enumerate(query_notes):
+        query_fingerprints.setdefault(notes.fingerprint, []).append(i)
+    chain_weights = [edge_weight for edge_weight, _ in query_reduced_segments]
+
+    # the nodes of each song which may match the query or one of its reductions, if the graphs have been indexed
+    matching_nodes = index.lookup(query_fingerprints.keys()) if index is not None and graph_folder is None else None
+
+    lower_bounds = [0.0] * len(graphs)
+    if top_k is not None:
+        # score the songs which might be the most similar first
+        lower_bounds = [__get_lower_bound(midi_graph, use_minimum, chain_weights, non_connected_penalty, index,
+                                          matching_nodes) for midi_graph in graphs]
+        order = sorted(range(len(graphs)), key=lambda graph_index: lower_bounds[graph_index])
+    else:
+        order = range(len(graphs))
+    # the distances of the top_k most similar songs so far, negated so the least similar of them is at the top
+    top_distances = []
+
     # for each graph file we know about, check the similarity
     # print("\nQuery reduction done, now checking each known graph file.")
     similarity_dict = {}
-    prog_bar = tqdm(graphs, desc=f"Graph Algorithm: {pathlib.Path(midi_path).stem} Progress")
-    for midi_graph in prog_bar:
-        # get a copy of the graph
-        graph = midi_graph.get_copy_of_graph()
-        source_mid_path = pathlib.Path(midi_graph.mid_file.filename).stem
+    prog_bar = tqdm(order, desc=f"Graph Algorithm: {query_name} Progress")
+    for graph_index in prog_bar:
+        midi_graph = graphs[graph_index]
+        if top_k is not None and len(top_distances) == top_k and lower_bounds[graph_index] >= -top_distances[0]:
+            # no song left can be more similar than the top_k so far
+            break
+        source_mid_path = pathlib.Path(midi_graph.song.filename).stem
         prog_bar.set_postfix({"current_graph": source_mid_path})
         # print("\n=====================\nOpening graph for " + source_mid_path + " for querying \n")
 
-        # due to issue in networkx have to reconvert to a float
-        for u, v, edge in graph.edges(data=True):
-            edge["label"] = float(edge["label"])
-        graph.add_node("query")  # add query node to graph so we can compute the shortest path lengths
-        last_node = "query"
-        for i, (edge_weight, reduced_segment) in enumerate(query_reduced_segments):
-            reduce_name = f"query_reduction_{i + 1}"
-            graph.add_node(reduce_name)
-            graph.add_edge(last_node, reduce_name, label=edge_weight, color="blue")
-            last_node = reduce_name
-        original_nodes = []
-        # iterate through each node in the graph of the music piece, adding edges between those nodes and the reductions
-        # we just computed for the query node
-        for node, node_data in graph.nodes(data=True):
-            if "query" in node or node == "root":  # ignore any nodes from the query or the root node
-                pass
-            else:
+        use_index = matching_nodes is not None and index.is_indexed(midi_graph)
+        path_lengths = None
+        if use_index and source_mid_path not in matching_nodes:
+            # none of the nodes match, so every path to the query uses a penalty edge: this can be found from the index
+            path_lengths = index.get_unmatched_path_lengths(midi_graph, sum(chain_weights), non_connected_penalty)
 
-                if "label" in node_data.keys() and ("original_segment" in node_data["label"]):
-                    original_nodes.append(node)
-
-                # load the mid at this graph position
-                g_segment: NoteSegment = node_data["segment"]
-
-                segment_timeline = g_segment.notes
-                if query_segment.notes == segment_timeline:
-                    # dot.add_edge("query", node, label=0, color="blue")
-                    continue
-                else:
-                    if len(segment_timeline) == 1:
-                        if len(query_reduced_segments) > 0:
-                            graph.add_edge(f"query_reduction_{len(query_reduced_segments)}", node,
-                                           label=non_connected_penalty, color="red")
-                        else:
-                            graph.add_edge("query", node, label=non_connected_penalty, color="red")
-                        continue
-
-                    last_node = "query"
-
-                    for i in range(len(query_reduced_segments)):
-                        _, r_segment = query_reduced_segments[i]
-
-                        if r_segment.notes == segment_timeline:
-                            graph.add_edge(f"query_reduction_{i + 1}", node, label=0, color="blue")
-                            last_node = f"query_reduction_{i + 1}"
-                            break
-                        last_node = f"query_reduction_{i + 1}"
-
-                    if "type" in node_data.keys() and node_data["type"] == "terminal":
-                        # if there are no matching reductions
-                        # add an edge of weight 1 between the last reduction and this node
-                        # if it's the last reduced node
-                        graph.add_edge(last_node, node, label=non_connected_penalty, color="red")
-
-        # we've added the query segment and reductions: now we can compute the distance of the shortest path
-        total_path_length = 0
-        min_path_length = float('inf')
-        for original_node in original_nodes:
-            try:
-                path_length = astar_path_length(graph, "query", original_node, weight="label")  #
-                total_path_length += path_length
-                min_path_length = min(min_path_length, path_length)
-            except networkx.NetworkXNoPath:
-                # add a large penalty for a lack of connections
-                total_path_length += non_connected_penalty
-                print(f"No path between {original_node} and query")
+        if path_lengths is not None:
+            average_path_length, min_path_length = path_lengths
+        else:
+            if use_index:
+                # only the nodes found in the index can match, and the other nodes only need an edge if they're the
+                # last reduction of their segment (which includes every node with a single note)
+                nodes = np.union1d(midi_graph.get_nodes_of_kind(TERMINAL),
+                                   matching_nodes.get(source_mid_path, np.empty(0, dtype=np.int64))).tolist()
+            else:
+                nodes = range(midi_graph.num_nodes)
+            average_path_length, min_path_length, overlay = __score_graph(midi_graph, query_notes, query_fingerprints,
+                                                                          chain_weights, nodes, non_connected_penalty)
+            if graph_folder is not None:
+                #  print("= --write_graphs: Writing graph to file=")
+                pathlib.Path(graph_folder).mkdir(exist_ok=True, parents=True)
+                write_dot(overlay.to_networkx(), f"{graph_folder}/output_{source_mid_path}.dot")
 
         if use_minimum:
-            # avg distance between source segments and query core
+            # min distance between source segments and query core
             similarity_dict[source_mid_path] = min_path_length
         else:
-            # min distance between source segments and query core
-            similarity_dict[source_mid_path] = total_path_length / len(original_nodes)
+            # avg distance between source segments and query core
+            similarity_dict[source_mid_path] = average_path_length
         #  print(f"Done: {metric} distance was {similarity_dict[source_mid_path]}")
-        if write_graphs:
-            #  print("= --write_graphs: Writing graph to file=")
-            pathlib.Path(f"query_output/graphs/{curr_time}_{pathlib.Path(midi_path).stem}")\
-                   .mkdir(exist_ok=True, parents=True)
+        if top_k is not None:
+            heapq.heappush(top_distances, -similarity_dict[source_mid_path])
+            if len(top_distances) > top_k:
+                heapq.heappop(top_distances)
+
+    return similarity_dict
+
+
+def query_graph(midi_path: str, melody_track: int, use_minimum: bool,
+                write_graphs: bool, graphs: List[MidiGraph], chord_track: Optional[int] = None,
+                index: Optional[FingerprintIndex] = None, top_k: Optional[int] = None) -> Dict[str, float]:
+    """
+    Run *Query by Example*, trying to guess the parent song of the MIDI file located at ``midi_path``,
+    with the known set of songs as graphs ``graphs`` being used.
 
-            write_dot(graph, f"query_output/graphs/{curr_time}_{pathlib.Path(midi_path).stem}"
-                             f"/output_{source_mid_path}.dot")
+    Args:
+        midi_path: The path to the Query MIDI file that we want to find the parent song of.
+        melody_track: The track containing the melody of the MIDI at midi_path
+        use_minimum: Whether to use the min distance between segments instead of the average distance
+        write_graphs: If True, writes graphs containing the query segment and the original graph to query_output/graphs/
+        graphs: The index of graphs to use
+        chord_track: The index of the track containing the chords of the Query MIDI file, if it exists
+        index: The FingerprintIndex of the graphs, if they've been indexed (e.g. by segment.py). Then only the nodes
+            which may match the query or one of its reductions are visited, and songs with no such node are scored
+            without visiting their graphs at all. The index isn't used if ``write_graphs`` is True.
+        top_k: If given, only the ``top_k`` most similar songs are ranked. The songs are scored in order of a lower
+            bound on their distance (which is much tighter with an index), stopping as soon as no song left can be more
+            similar than the ``top_k`` most similar songs so far. Songs with the same distance may be ranked in either
+            order.
+
+    Returns:
+        A dictionary containing the distance between the query and each known file in the indexed dataset (or only the
+        ``top_k`` most similar files).
+    """
+
+    query_file = SmfFile(midi_path)
+    metric = "Minimum" if use_minimum else "Average"
+    curr_time = time.strftime(constants.TIME_FORMAT)
+    notes = get_note_timeline(query_file.tracks[melody_track], query_file.tracks[chord_track] if chord_track is not None else None)
+    query_segment = NoteSegment(query_file, melody_track, notes,chord_track)
+
+    graph_folder = f"query_output/graphs/{curr_time}_{pathlib.Path(midi_path).stem}" if write_graphs else None
+    similarity_dict = __rank_query(query_segment, graphs, use_minimum, pathlib.Path(midi_path).stem, index=index,
+                                   top_k=top_k, graph_folder=graph_folder)
+
+    ranking = sorted(similarity_dict.items(), key=lambda item: item[1], reverse=True)
+    if top_k is not None:
+        print(f"\nScored {len(similarity_dict)} of {len(graphs)} songs to find the top {top_k}")
+        ranking = ranking[max(len(ranking) - top_k, 0):]
 
     print("\nDone: Final similarity rankings (least to most similar): ")
-    sorted_dict = {k: v for k, v in sorted(similarity_dict.items(), key=lambda item: item[1], reverse=True)}
+    sorted_dict = {k: v for k, v in ranking}
     series = pd.Series(sorted_dict)
 
-    for index, (mid_name, similarity) in enumerate(sorted_dict.items()):
-        print(f"\t[{len(sorted_dict.items()) - index}] {mid_name}: {similarity}")
+    for i, (mid_name, similarity) in enumerate(sorted_dict.items()):
+        print(f"\t[{len(sorted_dict.items()) - i}] {mid_name}: {similarity}")
 
     series.rename_axis(f"{metric} core distance from query core")
     pathlib.Path(f"query_output/rankings").mkdir(exist_ok=True, parents=True)
     series.to_csv(f"query_output/rankings/{pathlib.Path(midi_path).stem}.csv")
     return sorted_dict
+
+
+def query_graph_progressive(midi_path: str, melody_track: int, use_minimum: bool, graphs: List[MidiGraph],
+                            chord_track: Optional[int] = None, index: Optional[FingerprintIndex] = None,
+                            segmenter: Optional[OnlineLbdmSegmenter] = None) -> Iterator[Dict[str, float]]:
+    """
+    Run *Query by Example* on the MIDI file located at ``midi_path`` progressively, as if the query were being played:
+    the notes of the query are read one at a time and split into segments as they arrive (see
+    ``OnlineLbdmSegmenter.iter_segments``), and each segment is reduced and matched against ``graphs`` as soon as it
+    is complete, without waiting for the rest of the query. After each segment, the ranking of every song so far is
+    yielded: the distance of a song is the mean of its distances to the query segments so far (or the smallest of
+    them, if ``use_minimum`` is True).
+
+    Args:
+        midi_path: The path to the Query MIDI file that we want to find the parent song of.
+        melody_track: The track containing the melody of the MIDI at midi_path
+        use_minimum: Whether to use the min distance between segments instead of the average distance
+        graphs: The index of graphs to use
+        chord_track: The index of the track containing the chords of the Query MIDI file, if it exists
+        index: The FingerprintIndex of the graphs, if they've been indexed (see ``query_graph``)
+        segmenter: The segmenter splitting the query into segments (by default, an OnlineLbdmSegmenter with its
+            default parameters)
+
+    Returns:
+        An iterator over the rankings after each segment of the query: dictionaries containing the distance between
+        the query so far and each known file, from least to most similar
+    """
+    query_file = SmfFile(midi_path)
+    query_name = pathlib.Path(midi_path).stem
+    if segmenter is None:
+        segmenter = OnlineLbdmSegmenter()
+
+    # the distances between each song and every query segment so far
+    segment_distances: Dict[str, List[float]] = {}
+    for segment_index, query_segment in enumerate(segmenter.iter_segments(query_file, melody_track,
+                                                                          chord_track=chord_track)):
+        similarity_dict = __rank_query(query_segment, graphs, use_minimum, f"{query_name} (segment {segment_index})",
+                                       index=index)
+        for song_name, distance in similarity_dict.items():
+            segment_distances.setdefault(song_name, []).append(distance)
+
+        combine = min if use_minimum else np.mean
+        ranking = sorted(((song_name, float(combine(distances))) for song_name, distances in segment_distances.items()),
+                         key=lambda item: item[1], reverse=True)
+        print(f"\nAfter {segment_index + 1} query segment(s) ({query_segment.get_number_of_notes()} notes in the "
+              f"last), the similarity rankings are (least to most similar): ")
+        for i, (mid_name, similarity) in enumerate(ranking):
+            print(f"\t[{len(ranking) - i}] {mid_name}: {similarity}")
+        yield {k: v for k, v in ranking}
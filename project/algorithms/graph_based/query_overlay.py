@@ -0,0 +1,254 @@
+import heapq
+from typing import List, Tuple, Dict, Optional
+
+import networkx
+import numpy as np
+
+from project.algorithms.graph_based.midi_graph import MidiGraph
+
+
+class QueryOverlay:
+
+    def __init__(self, graph: MidiGraph, chain_weights: List[float]):
+        """
+        A query (and its chain of reductions) laid over a MidiGraph without changing it. The query nodes are given
+        the ids after the nodes of the graph: the query itself is ``graph.num_nodes``, and its ``i``th reduction is
+        ``graph.num_nodes + i``. Consecutive query nodes are joined by the weight of the reduction between them, and
+        edges between query nodes and nodes of the graph are added with ``add_edge``. Only these edges are stored, so
+        laying a query over a graph takes time proportional to the number of edges added, rather than the size of the
+        graph.
+
+        Args:
+            graph: The graph to lay the query over
+            chain_weights: The weight of each reduction of the query (so there are ``len(chain_weights) + 1`` query
+                nodes)
+        """
+        self.graph = graph
+        self.chain_weights = chain_weights
+        self.query_node = graph.num_nodes
+        # the edges added between query nodes and graph nodes, from both ends
+        self.__edges: Dict[int, Dict[int, float]] = {}
+
+    @property
+    def num_query_nodes(self) -> int:
+        """
+        Returns the number of query nodes (the query and each of its reductions)
+
+        Returns:
+            The number of query nodes
+        """
+        return len(self.chain_weights) + 1
+
+    def get_query_node(self, reduction: int) -> int:
+        """
+        Returns the id of a query node
+
+        Args:
+            reduction: The number of the reduction (0 for the query itself)
+
+        Returns:
+            The id of the query node
+        """
+        return self.query_node + reduction
+
+    def add_edge(self, query_node: int, node: int, weight: float):
+        """
+        Add an edge between a query node and a node of the graph. As with NetworkX, adding an edge between two nodes
+        which are already joined replaces the weight of the edge.
+
+        Args:
+            query_node: The id of the query node
+            node: The id of the node of the graph
+            weight: The weight of the edge
+        """
+        self.__edges.setdefault(query_node, {})[node] = weight
+        self.__edges.setdefault(node, {})[query_node] = weight
+
+    def get_neighbours(self, node: int) -> List[Tuple[int, float]]:
+        """
+        Returns the neighbours of a node (of the graph or of the query), including the edges of the overlay
+
+        Args:
+            node: The id of the node
+
+        Returns:
+            A list of (neighbour, weight) pairs
+        """
+        neighbours = []
+        if node < self.query_node:
+            indices, weights = self.graph.get_neighbours(node)
+            # the edge weights are stored as 32-bit floats, but the path lengths are added up as python floats
+            neighbours.extend(zip(indices.tolist(), weights.tolist()))
+        else:
+            reduction = node - self.query_node
+            if reduction > 0:
+                neighbours.append((node - 1, self.chain_weights[reduction - 1]))
+            if reduction < len(self.chain_weights):
+                neighbours.append((node + 1, self.chain_weights[reduction]))
+        neighbours.extend(self.__edges.get(node, {}).items())
+        return neighbours
+
+    def shortest_path_length(self, source: int, target: int) -> float:
+        """
+        Returns the length of the shortest path between two nodes, using Dijkstra's algorithm
+
+        Args:
+            source: The id of the node to start at
+            target: The id of the node to find the path to
+
+        Returns:
+            The length of the shortest path between the nodes, or infinity if there is no path between them
+        """
+        return self.__dijkstra(source, target).get(target, float("inf"))
+
+    def shortest_path_lengths(self, source: int, targets: np.ndarray) -> np.ndarray:
+        """
+        Returns the lengths of the shortest paths from one node to many others at once.
+
+        If the graph is a forest of chains (see ``MidiGraph.get_chains``) and the source is a query node, a path can
+        only move between chains through the query nodes. So the distances of the query nodes are found first, using
+        Dijkstra's algorithm over the query nodes alone (where two edges of the overlay onto the same chain act as an
+        edge between their query nodes). The distance of each target is then the shortest way onto its chain, plus
+        the distance along the chain (the difference in depth), which takes time proportional to the number of edges
+        of the overlay rather than the size of the graph. Otherwise, Dijkstra's algorithm is run once from the source
+        over the whole graph.
+
+        Args:
+            source: The id of the node to start at
+            targets: The ids of the nodes to find the paths to
+
+        Returns:
+            The length of the shortest path to each target, or infinity if there is no path to it
+        """
+        targets = np.asarray(targets, dtype=np.int64)
+        chains = self.graph.get_chains()
+        if chains is None or source < self.query_node:
+            distances = self.__dijkstra(source)
+            return np.array([distances.get(target, float("inf")) for target in targets.tolist()], dtype=np.float64)
+
+        roots, depths = chains
+        edges = [(query_node, node, weight)
+                 for query_node in range(self.query_node, self.query_node + self.num_query_nodes)
+                 for node, weight in self.__edges.get(query_node, {}).items()]
+        query_distances = self.__query_node_distances(source, edges, roots, depths)
+
+        lengths = np.full(len(targets), np.inf)
+        is_query_node = targets >= self.query_node
+        lengths[is_query_node] = query_distances[targets[is_query_node] - self.query_node]
+        if len(edges) == 0:
+            return lengths
+
+        edge_query_nodes, edge_nodes, edge_weights = (np.array(column) for column in zip(*edges))
+        edge_nodes = edge_nodes.astype(np.int64)
+        costs = query_distances[edge_query_nodes - self.query_node] + edge_weights
+        edge_roots = roots[edge_nodes]
+
+        # pair each edge with the targets on the same chain as it
+        graph_targets = np.flatnonzero(~is_query_node)
+        target_roots = roots[targets[graph_targets]]
+        order = np.argsort(target_roots, kind="stable")
+        sorted_roots = target_roots[order]
+        starts = np.searchsorted(sorted_roots, edge_roots, side="left")
+        counts = np.searchsorted(sorted_roots, edge_roots, side="right") - starts
+        pair_edges = np.repeat(np.arange(len(edges)), counts)
+        pair_positions = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + \
+            np.repeat(starts, counts)
+        pair_targets = graph_targets[order[pair_positions]]
+
+        np.minimum.at(lengths, pair_targets, costs[pair_edges] +
+                      np.abs(depths[targets[pair_targets]] - depths[edge_nodes[pair_edges]]))
+        return lengths
+
+    def __query_node_distances(self, source: int, edges: List[Tuple[int, int, float]], roots: np.ndarray,
+                               depths: np.ndarray) -> np.ndarray:
+        """
+        Find the length of the shortest path from a query node to each query node, when the graph is a forest of
+        chains (see ``shortest_path_lengths``)
+
+        Args:
+            source: The id of the query node to start at
+            edges: The (query node, node, weight) edges of the overlay
+            roots: The node at the start of the chain of each node of the graph
+            depths: The distance of each node of the graph along its chain
+
+        Returns:
+            The length of the shortest path to each query node (in order), or infinity if there is no path to it
+        """
+        neighbours: List[List[Tuple[int, float]]] = [[] for _ in range(self.num_query_nodes)]
+        for reduction, weight in enumerate(self.chain_weights):
+            neighbours[reduction].append((reduction + 1, weight))
+            neighbours[reduction + 1].append((reduction, weight))
+
+        # a path can leave the query chain onto a chain of the graph, and come back to a different query node
+        chain_edges: Dict[int, List[Tuple[int, float, float]]] = {}
+        for query_node, node, weight in edges:
+            chain_edges.setdefault(int(roots[node]), []).append((query_node - self.query_node, depths[node], weight))
+        for chain in chain_edges.values():
+            for first, first_depth, first_weight in chain:
+                for second, second_depth, second_weight in chain:
+                    if first != second:
+                        neighbours[first].append((second, first_weight + abs(first_depth - second_depth) +
+                                                  second_weight))
+
+        distances = np.full(self.num_query_nodes, np.inf)
+        distances[source - self.query_node] = 0
+        queue = [(0, source - self.query_node)]
+        while len(queue) > 0:
+            distance, node = heapq.heappop(queue)
+            if distance > distances[node]:
+                continue
+            for neighbour, weight in neighbours[node]:
+                if distance + weight < distances[neighbour]:
+                    distances[neighbour] = distance + weight
+                    heapq.heappush(queue, (distance + weight, neighbour))
+        return distances
+
+    def __dijkstra(self, source: int, target: Optional[int] = None) -> Dict[int, float]:
+        """
+        Find the length of the shortest path from a node to every other node, using Dijkstra's algorithm
+
+        Args:
+            source: The id of the node to start at
+            target: If given, stop as soon as the shortest path to this node is found
+
+        Returns:
+            A dictionary of the length of the shortest path to each node that was reached
+        """
+        distances = {source: 0}
+        visited = set()
+        queue = [(0, source)]
+        while len(queue) > 0:
+            distance, node = heapq.heappop(queue)
+            if node == target:
+                break
+            if node in visited:
+                continue
+            visited.add(node)
+            for neighbour, weight in self.get_neighbours(node):
+                new_distance = distance + weight
+                if neighbour not in distances or new_distance < distances[neighbour]:
+                    distances[neighbour] = new_distance
+                    heapq.heappush(queue, (new_distance, neighbour))
+        return distances
+
+    def to_networkx(self) -> networkx.Graph:
+        """
+        Create a NetworkX graph of the graph with the query laid over it (see ``MidiGraph.to_networkx``), e.g. to write
+        it as a dot file. The query nodes are called ``query`` and ``query_reduction_i``, with the edges between query
+        nodes and matching nodes coloured blue, and the other edges of the query coloured red.
+
+        Returns:
+            A new NetworkX graph
+        """
+        graph = self.graph.to_networkx()
+        names = self.graph.node_names + ["query"] + [f"query_reduction_{i + 1}"
+                                                     for i in range(len(self.chain_weights))]
+        for i in range(self.num_query_nodes):
+            graph.add_node(names[self.query_node + i])
+            if i > 0:
+                graph.add_edge(names[self.query_node + i - 1], names[self.query_node + i],
+                               label=self.chain_weights[i - 1], color="blue")
+        for query_node in range(self.query_node, self.query_node + self.num_query_nodes):
+            for node, weight in self.__edges.get(query_node, {}).items():
+                graph.add_edge(names[query_node], names[node], label=weight, color="blue" if weight == 0 else "red")
+        return graph
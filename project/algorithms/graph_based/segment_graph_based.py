@@ -3,29 +3,37 @@ import pathlib
 import sys
 import time
 import pickle
-from typing import Optional
+from typing import Optional, Union
 
 from mido import MidiFile
 
+from project.algorithms.core import scoring
+from project.algorithms.core.batch_reduction import BatchReduction
 from project.algorithms.core.chord import Chord
+from project.algorithms.core.feature_cache import get_cached_track_profile
+from project.algorithms.core.reduction_hierarchy import ReductionHierarchy
+from project.algorithms.core.segmenter import Segmenter
+from project.algorithms.core.smf_reader import SmfFile
 from project.algorithms.graph_based.midi_graph import MidiGraph
 from project.algorithms.graph_based.lbdm_segmenter import LbdmSegmenter
-from project.algorithms.core.midtools import is_note_on, is_note_off, is_monophonic
+from project.algorithms.core.midtools import is_note_on, is_note_off
 
 
-def segment_graph(midi_path: str, melody_track: int, output_folder: str,
-                  chord_track: Optional[int], save_combined: bool) -> int:
+def segment_graph(midi_path: Union[str, SmfFile], melody_track: int, output_folder: str,
+                  chord_track: Optional[int], save_combined: bool, segmenter: Optional[Segmenter] = None) -> int:
     time_start = time.time()
 
-    resolved_path = pathlib.Path(midi_path)
-    segmenter = LbdmSegmenter()
-    mid_file = MidiFile(filename=str(resolved_path))
+    # songs from a packed corpus have already been read
+    mid_file = midi_path if isinstance(midi_path, SmfFile) else SmfFile(filename=str(pathlib.Path(midi_path)))
+    resolved_path = pathlib.Path(mid_file.filename)
+    if segmenter is None:
+        segmenter = LbdmSegmenter()
     mid_name = resolved_path.stem
     print("\n=========================================================")
     print(f"Segmenting {mid_name}.mid to build up a graph of segments:")
     print("=========================================================")
-    if not is_monophonic(mid_file.tracks[melody_track]):
-        sys.stderr.write(f"Error for Midi File @ {midi_path}: "
+    if not get_cached_track_profile(mid_file, melody_track).is_monophonic:
+        sys.stderr.write(f"Error for Midi File @ {resolved_path}: "
                          f"this track is polyphonic, therefore it cannot be processed by this algorithm.\n")
         sys.stderr.flush()
         return -1
@@ -38,58 +46,56 @@ def segment_graph(midi_path: str, melody_track: int, output_folder: str,
 
     graph = MidiGraph(mid_file, melody_track, chord_track)
 
-    for (index, segment) in enumerate(segments):
-        midi_filepath = str(pathlib.Path(f"{mid_location}/midi_segments/segment_{index}.mid"))
-        graph.add_identifying_node(midi_filepath, segment)
-
     print("Starting recursive reduction")
+    scoring.reset_unknown_time_signature_counts()
+
+    # reduce every segment, one level at a time, and store each segment and its reductions together
+    reduction = BatchReduction.from_segments(segments)
+    hierarchies = ReductionHierarchy.from_batch_reduction(reduction)
 
-    segments_and_indices = list(enumerate(segments))
-    segment_dict = {}
-    i = 1
-    # recursively apply reduction
-    while any([segment.get_number_of_notes() > 1 for _, segment in segments_and_indices]):
+    for (index, hierarchy) in enumerate(hierarchies):
+        midi_filepath = str(pathlib.Path(f"{mid_location}/midi_segments/segment_{index}.mid"))
+        graph.add_identifying_node(midi_filepath, hierarchy)
+
+    for i in range(1, reduction.num_levels):
         print(f"Beginning reduction number {i}")
-        reduced_segments = []  # current segments and indices of those segments to be reduced
-        for (seg_ind, segment) in segments_and_indices:
-            # don't reduce if there's only one note left
-            if segment.get_number_of_notes() > 1:
-                weight, reduced_segment = segment.reduce_segment()
-                reduced_filepath = str(pathlib.Path(f"{mid_location}/midi_segments/segment_{seg_ind}_reduction_{i}.mid"))
-                reduced_segments.append((seg_ind, reduced_segment))
-                graph.add_node(reduced_filepath, reduced_segment)
-                if i > 1:
-                    graph.add_edge(
-                        n1=str(pathlib.Path(f"{mid_location}/midi_segments/segment_{seg_ind}_reduction_{i - 1}.mid")),
-                        n2=reduced_filepath, weight=weight)
-                else:
-                    graph.add_edge(n1=str(pathlib.Path(f"{mid_location}/midi_segments/segment_{seg_ind}.mid")),
-                                   n2=reduced_filepath, weight=weight)
-        segment_dict[i] = reduced_segments
-        segments_and_indices = reduced_segments
-        i += 1
+        for (seg_ind, hierarchy) in enumerate(hierarchies):
+            # segments with at most one note left aren't reduced any further
+            if i >= hierarchy.num_levels:
+                continue
+            reduced_filepath = str(pathlib.Path(f"{mid_location}/midi_segments/segment_{seg_ind}_reduction_{i}.mid"))
+            graph.add_node(reduced_filepath, hierarchy, i)
+            if i > 1:
+                graph.add_edge(
+                    n1=str(pathlib.Path(f"{mid_location}/midi_segments/segment_{seg_ind}_reduction_{i - 1}.mid")),
+                    n2=reduced_filepath, weight=hierarchy.get_weight(i))
+            else:
+                graph.add_edge(n1=str(pathlib.Path(f"{mid_location}/midi_segments/segment_{seg_ind}.mid")),
+                               n2=reduced_filepath, weight=hierarchy.get_weight(i))
 
     print("Done reducing as all segments have at most 1 note.")
+    unknown_time_signatures = scoring.get_unknown_time_signature_counts()
+    if len(unknown_time_signatures) > 0:
+        counts = ", ".join(f"{signature}: {count}" for signature, count in unknown_time_signatures.items())
+        sys.stderr.write(f"Warning for Midi File @ {resolved_path}: some notes are in time signatures with no known "
+                         f"beat strengths, so default strengths were used ({counts} notes).\n")
+        sys.stderr.flush()
     print("Saving graph structure")
     with open(str(pathlib.Path(f"{mid_location}/graph.gpickle")), "wb") as fh:
         pickle.dump(graph, fh, protocol=pickle.HIGHEST_PROTOCOL)
     print("Graph saved")
 
     if save_combined:
-        combined_dict = {}
-        for (iteration, r_segments) in segment_dict.items():
-            for (seg_ind, segment) in r_segments:
-                if seg_ind not in combined_dict.keys():
-                    combined_dict[seg_ind] = []
-                combined_dict[seg_ind].append(segment)
         print("--saved_combined specified: saving combined segments...")
-        for (segment_index, indexed_segments) in combined_dict.items():
-            new_file = MidiFile(**indexed_segments[0].get_file_metadata())
+        for (segment_index, hierarchy) in enumerate(hierarchies):
+            if hierarchy.num_levels < 2:
+                continue
+            new_file = MidiFile(**segments[segment_index].get_file_metadata())
             original_track = new_file.add_track()
             segments[segment_index].copy_notes_to_track(original_track)
-            for segment in indexed_segments:
+            for level in range(1, hierarchy.num_levels):
                 track = new_file.add_track()
-                segment.copy_notes_to_track(track)
+                hierarchy.get_segment(level, mid_file, melody_track).copy_notes_to_track(track)
 
             new_file.save(filename=f"{mid_location}/combined_segment_{segment_index}.mid")
         print("Combined segments saved.")
@@ -1,18 +1,32 @@
+from typing import Tuple
+
 import project.algorithms.core.constants as constants
+from project.algorithms.core.interning import Interned
 
 
-class TimeSignature:
+class TimeSignature(metaclass=Interned):
+    __slots__ = ("numerator", "denominator", "intern_id")
 
     def __init__(self, numerator: int, denominator: int):
         """
-        A class representing a TimeSignature in a simple way
+        A class representing a TimeSignature in a simple way. Time signatures are interned (see ``Interned``), so
+        they must not be modified.
 
         Args:
             numerator: The top number of a time signature
             denominator: The bottom of a time signature
         """
-        self.numerator = numerator
-        self.denominator = denominator
+        self.numerator = int(numerator)
+        self.denominator = int(denominator)
+
+    def intern_key(self) -> Tuple[int, int]:
+        """
+        Returns the value identifying this time signature when it is interned (see ``Interned``)
+
+        Returns:
+            The numerator and denominator of the time signature
+        """
+        return self.numerator, self.denominator
 
     @staticmethod
     def default():
@@ -27,11 +41,18 @@ class TimeSignature:
     def __repr__(self):
         return f"({self.numerator} {self.denominator})"
 
+    def __reduce__(self):
+        # unpickle through the constructor, so unpickled signatures are interned too
+        return TimeSignature, (self.numerator, self.denominator)
+
+
+class KeySignature(metaclass=Interned):
+    __slots__ = ("note", "minor", "intern_id")
 
-class KeySignature:
     def __init__(self, note: str, minor: bool):
         """
-        A class representing a KeySignature in a simple way. Based on a textual representation
+        A class representing a KeySignature in a simple way. Based on a textual representation. Key signatures are
+        interned (see ``Interned``), so they must not be modified.
 
         Args:
             note: The pitch class of the note e.g. 0 -> C 5 -> F
@@ -45,7 +66,16 @@ class KeySignature:
             raise ValueError(f"Error: note ''{note}'' could not be parsed into a pitch number"
                              f"when trying to create a valid key signature ")
 
-        self.minor = minor
+        self.minor = bool(minor)
+
+    def intern_key(self) -> Tuple[int, bool]:
+        """
+        Returns the value identifying this key signature when it is interned (see ``Interned``)
+
+        Returns:
+            The pitch class of the key's note, and whether the key is minor
+        """
+        return self.note, self.minor
 
     @staticmethod
     def default():
@@ -59,3 +89,7 @@ class KeySignature:
 
     def __repr__(self):
         return "{} {}".format(constants.TWELVE_NOTE_SCALE_SHARP[self.note], "minor" if self.minor else "major")
+
+    def __reduce__(self):
+        # unpickle through the constructor, so unpickled signatures are interned too
+        return KeySignature, (constants.TWELVE_NOTE_SCALE_SHARP[self.note], self.minor)
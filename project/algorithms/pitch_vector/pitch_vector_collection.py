@@ -1,17 +1,27 @@
-from typing import List
+import copy
+from typing import List, Union
 
-from mido import MidiFile
+import numpy as np
+from mido import MidiFile, MidiTrack
+from project.algorithms.core.midtools import get_track_tempo_map
+from project.algorithms.core.smf_reader import SmfFile, SmfTrack
+from project.algorithms.core.song_registry import Song, register_song, get_song_file, register_song_track
+from project.algorithms.core.tempo_map import TempoMap
 from project.algorithms.pitch_vector.pitch_vector_segment import PitchVectorSegment
 
 
 class PitchVectorCollection:
-    def __init__(self, mid_file: MidiFile, vectors: List[PitchVectorSegment], window_size: float, observations: int,
+    def __init__(self, mid_file: Union[MidiFile, SmfFile, Song], vectors: List[PitchVectorSegment], window_size: float, observations: int,
                  melody_track: int):
         """
         A collection of pitch vectors. Use to serialize the pitch vectors for each song to disk.
 
+        The melody track of the song and its tempo map are stored along with the vectors (they're small compared to the
+        whole file), and registered with the song registry when the collection is loaded, so querying never needs to
+        read the song's MIDI file again (see ``song_registry.get_song_track``).
+
         Args:
-            mid_file: The MIDI file the pitch vectors were created from
+            mid_file: The MIDI file the pitch vectors were created from (only its Song and melody track are kept)
             vectors: The pitch vectors themselves, produced from pitch_vector_segmenter
             window_size: The window size used when segmenting
             observations: The number of dimensions per pitch vector
@@ -19,9 +29,45 @@ class PitchVectorCollection:
         """
 
         self.vectors = vectors
-        self.mid_file = mid_file
+        self.song = register_song(mid_file)
         self.window_size = window_size
         self.observations = observations
         self.melody_track = melody_track
+        track = get_song_file(mid_file).tracks[melody_track]
+        # copy the track, so a track viewing a (memory-mapped) corpus is stored as arrays of its own
+        self.track: Union[MidiTrack, SmfTrack] = PitchVectorCollection.__copy_track(track)
+        self.tempo_map: TempoMap = get_track_tempo_map(self.track, self.song.ticks_per_beat)
+        register_song_track(self.song, self.melody_track, self.track, self.tempo_map)
+
+    @property
+    def mid_file(self) -> Union[MidiFile, SmfFile]:
+        """
+        Returns the MIDI file the pitch vectors were created from, reading it again if it's no longer in memory
+
+        Returns:
+            The MIDI file the pitch vectors were created from
+        """
+        return get_song_file(self.song)
 
+    @staticmethod
+    def __copy_track(track: Union[MidiTrack, SmfTrack]) -> Union[MidiTrack, SmfTrack]:
+        """
+        Copy a track, so that none of its arrays are views of another array
+
+        Args:
+            track: The track to copy
+
+        Returns:
+            A copy of the track
+        """
+        if not isinstance(track, SmfTrack):
+            return copy.deepcopy(track)
+        track = copy.copy(track)
+        for name, value in vars(track).items():
+            if isinstance(value, np.ndarray):
+                setattr(track, name, np.array(value))
+        return track
 
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        register_song_track(self.song, self.melody_track, self.track, self.tempo_map)
@@ -1,14 +1,17 @@
 import numpy as np
 import pickle
 
+from typing import Union
 from mido import MidiTrack, MidiFile
 
 from project.algorithms.core.midi_segment import MidiSegment
+from project.algorithms.core.smf_reader import SmfFile
+from project.algorithms.core.song_registry import Song
 
 
 class PitchVectorSegment(MidiSegment):
 
-    def __init__(self, file: MidiFile, melody_track_ind: int, pitch_vector: np.ndarray, pitch_modifier: float,
+    def __init__(self, file: Union[MidiFile, SmfFile, Song], melody_track_ind: int, pitch_vector: np.ndarray, pitch_modifier: float,
                  start_offset: float):
         """
         A segment of a MIDI file represent as a multidimensional vector. Each component of the vector is an
@@ -16,7 +19,7 @@ class PitchVectorSegment(MidiSegment):
 
 
         Args:
-            file: The file the pitch vector was extracted from
+            file: The file the pitch vector was extracted from (or its Song)
             melody_track_ind: The specific MIDI track the vector was extracted from
             pitch_vector: The vector itself, normalized to have 0 mean
             pitch_modifier: A value, which when added to pitch_vector, produces the original vector
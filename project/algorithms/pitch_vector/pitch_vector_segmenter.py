@@ -1,11 +1,13 @@
 import numpy as np
 
-from typing import List
+from collections import deque
+from typing import List, Iterator, Deque
 
-from mido import MidiFile, MidiTrack, bpm2tempo, tick2second
+from mido import MidiFile, MidiTrack
 from project.algorithms.pitch_vector.pitch_vector_segment import PitchVectorSegment
 from project.algorithms.core.segmenter import Segmenter
-from project.algorithms.core.midtools import get_track_tempo_changes, is_note_on
+from project.algorithms.core.feature_cache import get_cached_tempo_map
+from project.algorithms.core.midtools import get_note_on_indices, get_message_notes, has_end_of_track, iter_notes
 
 
 class PitchVectorSegmenter(Segmenter):
@@ -39,61 +41,32 @@ class PitchVectorSegmenter(Segmenter):
         return float(mean_pitch)
 
     @staticmethod
-    def __get_observations(track: MidiTrack, start_index: int, num_obs: int, window_size: float,
-                           tempo: int, ticks_per_beat: int) -> np.ndarray:
+    def __get_observations(note_on_times: np.ndarray, note_on_pitches: np.ndarray, start_time: float,
+                           num_obs: int, window_size: float, track_end: float) -> np.ndarray:
         """
-        Returns a pitch vector with *observations* of the pitch throughout a time window starting at the note onset of
-        the note at ``start_index``, and stopping after ``window_size`` seconds.
+        Returns a pitch vector with *observations* of the pitch throughout a time window starting at ``start_time``
+        (the onset of a note), and stopping after ``window_size`` seconds. The pitch observed at each point is the
+        pitch of the last note to start at or before that point.
 
         Args:
-            track: The MidiTrack to get the observations from.
-            start_index: The start index of the note to begin the pitch vector from
+            note_on_times: The time (in seconds) of every note onset within the track, in order
+            note_on_pitches: The pitch of every note onset within the track
+            start_time: The time (in seconds) to begin the pitch vector from
             num_obs: The number of points to observe the pitch at.
             window_size: The size of the vector in terms of time in seconds
-            tempo: The initial tempo of the song at the start of the vector
-            ticks_per_beat: The ticks per beat of the MIDI file the track is taken from
+            track_end: The time (in seconds) at which the track ends
 
         Returns:
-            A numpy array which is a pitch vector
+            A numpy array which is a pitch vector, or an empty array if the window goes past the end of the track
         """
         time_to_advance = window_size / (num_obs - 1)
-        pv_arr = np.empty(num_obs, dtype=float)
-
-        current_delta = track[start_index].time
-        current_index = start_index
-        current_tempo = tempo
-        # derive current time from j? current_time = j * (window_size / (num_obs - 1))
-        # current msg time = prev message times + tick2second(msg.time,ticks_per_beat,tempo)
-        # if current msg time <= current time position is according to j
-        #  check what the message is: if tempo, update the tempo
-        #                             if note on, update the pitch
-        # else do nothing
-        # current msg time += this msg time
-        for j in range(num_obs):
-            note_observed = False
-            max_time_delta = j * time_to_advance
-            for message in track[current_index:]:
-                msg_length = tick2second(message.time, ticks_per_beat, tempo)
-                if current_delta + msg_length > max_time_delta:
-                    break
-                else:
-                    current_delta += msg_length
-                    current_index += 1
-                    if message.type == "set_tempo":
-                        current_tempo = message.tempo
-                    elif is_note_on(message):
-                        pv_arr[j:] = message.note  # default is that the last note playing for all notes after this
-                        # is this note
-                        # (i.e. if there's no note on since the last detected one thats what note is playing)
-                        note_observed = True
-                    elif message.type == "end_of_track":
-                        if j == num_obs - 1 and current_delta == max_time_delta:
-                            break  # end of track but not exceeding it (so if the vector goes right to the end
-                            # that's fine, but any further is not
-
-                        return np.empty(0)  # don't extract if pitch vector exceeds end of song
-
-        return pv_arr
+        observation_times = start_time + np.arange(num_obs) * time_to_advance
+        if observation_times[-1] > track_end:
+            return np.empty(0)  # don't extract if pitch vector exceeds end of song
+
+        # (i.e. if there's no note on since the last detected one, the last detected note is what is playing)
+        last_note_on = np.searchsorted(note_on_times, observation_times, side="right") - 1
+        return note_on_pitches[last_note_on].astype(float)
 
     def create_segments(self, mid: MidiFile, track_index: int, **kwargs) -> List[PitchVectorSegment]:
         """
@@ -104,25 +77,88 @@ class PitchVectorSegmenter(Segmenter):
             track_index: The index of the track to create segments from
             **kwargs: Not used
 
+        Keyword Args:
+            tempo_map: the TempoMap of the track, if it has already been built
+
         Returns:
             A list of segments of this MIDI file represented as vectors.
         """
         track: MidiTrack = mid.tracks[track_index]
+        if "tempo_map" in kwargs and kwargs["tempo_map"] is not None:
+            tempo_map = kwargs["tempo_map"]
+        else:
+            tempo_map = get_cached_tempo_map(mid, track_index)
         pitch_vector_segments = []
-        delta_t = 0
-        tempo = bpm2tempo(120)
-
-        for i, msg in enumerate(track):
-            delta_t += tick2second(msg.time, mid.ticks_per_beat, tempo)
-            if is_note_on(msg):
-                pv_arr = self.__get_observations(track, i, self.observations, self.window_size, tempo,
-                                                 mid.ticks_per_beat)
-                if len(pv_arr) == 0:
-                    break
-                pitch_modifier = self.__normalize_pv(pv_arr)  # normalize to have mean of 0
-                start_offset = delta_t
-                pitch_vector_segments.append(PitchVectorSegment(mid, track_index, pv_arr, pitch_modifier, start_offset))
-            elif msg.type == "set_tempo":
-                tempo = msg.tempo
+
+        note_on_indices = get_note_on_indices(track)
+        if len(note_on_indices) == 0:
+            return pitch_vector_segments
+        note_on_times = tempo_map.message_seconds[note_on_indices]
+        note_on_pitches = get_message_notes(track, note_on_indices)
+        if has_end_of_track(track):
+            track_end = float(tempo_map.message_seconds[-1])
+        else:
+            track_end = float("inf")
+
+        for start_time in note_on_times.tolist():
+            pv_arr = self.__get_observations(note_on_times, note_on_pitches, start_time, self.observations,
+                                             self.window_size, track_end)
+            if len(pv_arr) == 0:
+                break
+            pitch_modifier = self.__normalize_pv(pv_arr)  # normalize to have mean of 0
+            pitch_vector_segments.append(PitchVectorSegment(mid, track_index, pv_arr, pitch_modifier, start_time))
 
         return pitch_vector_segments
+
+    def iter_segments(self, mid: MidiFile, track_index: int, **kwargs) -> Iterator[PitchVectorSegment]:
+        """
+        Yield the same segments as ``create_segments``, one at a time. The notes of the track are read as they're
+        needed (with ``midtools.iter_notes``), so only the notes within the current window are held in memory.
+
+        Args:
+            mid: The file to segment
+            track_index: The index of the track to create segments from
+            **kwargs: Not used
+
+        Keyword Args:
+            tempo_map: the TempoMap of the track, if it has already been built
+
+        Returns:
+            An iterator over the segments of this MIDI file represented as vectors.
+        """
+        track: MidiTrack = mid.tracks[track_index]
+        if "tempo_map" in kwargs and kwargs["tempo_map"] is not None:
+            tempo_map = kwargs["tempo_map"]
+        else:
+            tempo_map = get_cached_tempo_map(mid, track_index)
+        if has_end_of_track(track):
+            track_end = float(tempo_map.message_seconds[-1])
+        else:
+            track_end = float("inf")
+
+        notes = iter_notes(track, tempo_map)
+        # the onset (in seconds) and pitch of each note from the start of the current window to just after its end
+        window_times: Deque[float] = deque()
+        window_pitches: Deque[int] = deque()
+        # the time from the first observation of a window to the last
+        window_length = self.window_size
+        while True:
+            # read notes until one starts after the end of the current window (or there are no notes left)
+            while len(window_times) == 0 or window_times[-1] <= window_times[0] + window_length:
+                note = next(notes, None)
+                if note is None:
+                    break
+                window_times.append(note.start_time)
+                window_pitches.append(note.pitch)
+            if len(window_times) == 0:
+                return
+
+            start_time = window_times[0]
+            pv_arr = self.__get_observations(np.array(window_times), np.array(window_pitches), start_time,
+                                             self.observations, self.window_size, track_end)
+            if len(pv_arr) == 0:
+                return
+            pitch_modifier = self.__normalize_pv(pv_arr)  # normalize to have mean of 0
+            yield PitchVectorSegment(mid, track_index, pv_arr, pitch_modifier, start_time)
+            window_times.popleft()
+            window_pitches.popleft()
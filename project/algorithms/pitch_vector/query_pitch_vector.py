@@ -7,7 +7,7 @@ import numpy as np
 import pandas as pd
 
 from typing import Dict, Tuple
-from mido import MidiFile, tick2second
+from mido import tick2second
 from nearpy import Engine
 from tqdm import tqdm
 
@@ -15,7 +15,9 @@ from project.algorithms.pitch_vector.pitch_vector_segmenter import PitchVectorSe
 from project.algorithms.pitch_vector.recursive_alignment import recursive_alignment
 from project.algorithms.pitch_vector.vector_candidate import VectorCandidate
 from project.algorithms.core.midtools import get_start_offset, get_end_offset, get_note_timeline, \
-    get_notes_in_time_range
+    get_notes_in_time_range, get_track_tempo_map
+from project.algorithms.core.smf_reader import SmfFile
+from project.algorithms.core.song_registry import get_song_track
 
 
 def query_pitch_vector(midi_path: str, vector_map: Dict[Tuple[float, int], Engine],
@@ -38,18 +40,23 @@ def query_pitch_vector(midi_path: str, vector_map: Dict[Tuple[float, int], Engin
     # then segment the query based on the different window sizes and observations
     # in the database Engine
 
-    query_mid = MidiFile(midi_path)
+    query_mid = SmfFile(midi_path)
     query_track = query_mid.tracks[melody_track]
-    query_start, start_index = get_start_offset(query_track, query_mid.ticks_per_beat)
-    query_end, end_index = get_end_offset(query_track, query_mid.ticks_per_beat)
-    query_notes = get_notes_in_time_range(query_track, query_mid.ticks_per_beat, query_start, query_end)
-    query_mean_pitch = sum(map(lambda n: n.pitch, query_notes)) / len(query_notes)
-    query_notes_norm = list(map(lambda n: n.normalize(query_mean_pitch, query_start, query_end), query_notes))
+    query_tempo_map = get_track_tempo_map(query_track, query_mid.ticks_per_beat)
+    query_start, start_index = get_start_offset(query_track, query_mid.ticks_per_beat, query_tempo_map)
+    query_end, end_index = get_end_offset(query_track, query_mid.ticks_per_beat, query_tempo_map)
+    query_notes = get_notes_in_time_range(query_track, query_mid.ticks_per_beat, query_start, query_end,
+                                          tempo_map=query_tempo_map)
+    query_mean_pitch = float(np.mean(query_notes.pitches))
+    query_notes_norm = query_notes.normalize(query_mean_pitch, query_start, query_end)
 
     print("Compare the query segment with the database of vectors")
 
     similarity_map = {}
     matched_vectors = {}
+    # candidates often come from the same songs, so only build the tempo map of each song's track once (unless it was
+    # stored with the song's pitch vectors)
+    song_tempo_maps = {}
     for (window_size, observations), engine in vector_map.items():
         candidates = []
         # segment the query song
@@ -60,7 +67,7 @@ def query_pitch_vector(midi_path: str, vector_map: Dict[Tuple[float, int], Engin
 
         for modifier in window_modifiers:
             segmenter = PitchVectorSegmenter(window_size * modifier, observations)
-            query_segments = segmenter.create_segments(query_mid, melody_track)
+            query_segments = segmenter.create_segments(query_mid, melody_track, tempo_map=query_tempo_map)
             for query_segment in query_segments:
                 neighbours = engine.neighbours(query_segment.pitch_vector)
                 for vec, (mid_file, cand_offset, pitch_mod, cand_track), distance in neighbours:
@@ -71,10 +78,15 @@ def query_pitch_vector(midi_path: str, vector_map: Dict[Tuple[float, int], Engin
 
         for candidate in tqdm(candidates, desc="Testing candidate segments"):
             start, end = candidate.get_candidate_segment_bounds(query_start, query_end)
-            song_track = candidate.song_ident.tracks[candidate.song_track]
-            candidate_notes = get_notes_in_time_range(song_track, candidate.ticks_per_beat, start, end)
-            mean_pitch = sum(map(lambda n: n.pitch, candidate_notes)) / len(candidate_notes)
-            norm_notes = list(map(lambda n: n.normalize(mean_pitch, start, end - start), candidate_notes))
+            song_track, tempo_map = get_song_track(candidate.song_ident, candidate.song_track)
+            song_key = (id(candidate.song_ident), candidate.song_track)
+            if song_key not in song_tempo_maps:
+                song_tempo_maps[song_key] = tempo_map if tempo_map is not None else \
+                    get_track_tempo_map(song_track, candidate.ticks_per_beat)
+            candidate_notes = get_notes_in_time_range(song_track, candidate.ticks_per_beat, start, end,
+                                                      tempo_map=song_tempo_maps[song_key])
+            mean_pitch = float(np.mean(candidate_notes.pitches))
+            norm_notes = candidate_notes.normalize(mean_pitch, start, end - start)
             dist = recursive_alignment(query_notes_norm, norm_notes, [(0.45, 0.45), (0.5, 0.5), (0.55, 0.55)], 2)
 
             song_name = pathlib.Path(candidate.song_ident.filename).stem
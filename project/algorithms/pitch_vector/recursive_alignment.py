@@ -1,7 +1,8 @@
 from math import floor
-from typing import List, Tuple, Optional
+from typing import List, Tuple, Optional, Union
 
 from project.algorithms.core.note import Note
+from project.algorithms.core.note_array import NoteArray
 
 import numpy as np
 
@@ -39,7 +40,24 @@ def __linear_scaling(query: List[Note], candidate: List[Note]) -> float:
     return -dist
 
 
-def __dynamic_time_warping(query: List[Note], candidate: List[Note]) -> float:
+def __dist_matrix(query: NoteArray, candidate: NoteArray, max_value: float = 10000) -> np.ndarray:
+    """
+    The distance measure ``__dist`` evaluated between every note of the query and every note of the candidate.
+
+    Args:
+        query: The series of notes from the query
+        candidate: The series of notes from the candidate
+        max_value: The upper limit for what the distance can be at maximum.
+
+    Returns:
+        A (len(query), len(candidate)) matrix where element [i, j] is the distance between query[i] and candidate[j]
+    """
+    pitch_difference = query.pitches[:, np.newaxis] - candidate.pitches[np.newaxis, :]
+    start_difference = query.start_times[:, np.newaxis] - candidate.start_times[np.newaxis, :]
+    return np.minimum((pitch_difference ** 2) + (start_difference ** 2), max_value)
+
+
+def __dynamic_time_warping(query: NoteArray, candidate: NoteArray) -> float:
     """
     A dynamic programming algorithm for calculating the distance between a query and candidate list of notes. DTW
     tries to find the best alignment between the two sets of notes.
@@ -53,12 +71,13 @@ def __dynamic_time_warping(query: List[Note], candidate: List[Note]) -> float:
     """
     if len(query) == 0 or len(candidate) == 0:
         return 0
+    costs = __dist_matrix(query, candidate).tolist()
     dtw = np.zeros((len(query), len(candidate)), dtype=float)
     dtw += np.inf
     dtw[0, 0] = 0
     for i in range(1, len(query)):
         for j in range(1, len(candidate)):
-            cost = __dist(query[i], candidate[j])
+            cost = costs[i][j]
             dtw[i, j] = cost + min(dtw[i - 1, j],
                                    dtw[i, j - 1],
                                    dtw[i - 1, j - 1])
@@ -66,7 +85,7 @@ def __dynamic_time_warping(query: List[Note], candidate: List[Note]) -> float:
     return dtw[len(query) - 1, len(candidate) - 1]
 
 
-def recursive_alignment(query: List[Note], candidate: List[Note],
+def recursive_alignment(query: Union[NoteArray, List[Note]], candidate: Union[NoteArray, List[Note]],
                         scale_pairs: List[Tuple[float, float]], rec_depth: int = 1) -> float:
     """
     Return the distance between two sets of notes using recursive alignment.
@@ -80,6 +99,8 @@ def recursive_alignment(query: List[Note], candidate: List[Note],
     Returns:
         The distance between the query and candidate after recursive alignment aligned the notes as best it could.
     """
+    query = NoteArray.from_notes(query)
+    candidate = NoteArray.from_notes(candidate)
     i = 0
     j = floor(len(candidate) / 2)
     min_score: Optional[float] = None
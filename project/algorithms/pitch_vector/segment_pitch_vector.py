@@ -1,19 +1,20 @@
 import pathlib
 import pickle
 import time
+from typing import Union
 
-from mido import MidiFile
-
+from project.algorithms.core.smf_reader import SmfFile
 from project.algorithms.pitch_vector.pitch_vector_collection import PitchVectorCollection
 from project.algorithms.pitch_vector.pitch_vector_segmenter import PitchVectorSegmenter
 
 
-def segment_pitch_vector(midi_path: str, melody_track: int, output_folder: str,
+def segment_pitch_vector(midi_path: Union[str, SmfFile], melody_track: int, output_folder: str,
                          window_size: float = 3.0, num_observations: int = 20) -> int:
     time_start = time.time()
-    resolved_path = pathlib.Path(midi_path)
+    # songs from a packed corpus have already been read
+    mid_file = midi_path if isinstance(midi_path, SmfFile) else SmfFile(filename=str(pathlib.Path(midi_path)))
+    resolved_path = pathlib.Path(mid_file.filename)
     segmenter = PitchVectorSegmenter(window_size, num_observations)
-    mid_file = MidiFile(filename=str(resolved_path))
     mid_name = resolved_path.stem
     print("\n=========================================================")
     print(f"Segmenting {mid_name}.mid into several pitch vectors:")
@@ -1,11 +1,11 @@
 from typing import Tuple
 
-from mido import MidiFile
+from project.algorithms.core.song_registry import Song
 
 
 class VectorCandidate:
     def __init__(self, query_offset: float, window_modifier: float, candidate_offset: float,
-                 song_ident: MidiFile, song_track: int):
+                 song_ident: Song, song_track: int):
         self.query_offset = query_offset
         self.window_modifier = window_modifier
         self.candidate_offset = candidate_offset
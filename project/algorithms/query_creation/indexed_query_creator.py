@@ -4,13 +4,13 @@ from typing import List, Optional
 from multiprocessing.pool import Pool
 
 import numpy as np
-from mido import MidiFile
 
-from tqdm import tqdm
 
+from project.algorithms.core.corpus import Corpus, is_corpus
 from project.algorithms.core.midi_segment import MidiSegment
-from project.algorithms.core.midtools import is_monophonic
+from project.algorithms.core.feature_cache import get_cached_track_profile
 from project.algorithms.core.note_segment import NoteSegment
+from project.algorithms.core.smf_reader import SmfFile
 from project.algorithms.core.segmenter import Segmenter
 from project.algorithms.query_creation.query_creator import QueryCreator
 
@@ -33,7 +33,8 @@ class IndexedQueryCreator(QueryCreator):
         """
         Create query ``NoteSegments`` based on this classes designated `Segmenter`` object
         Args:
-            mid_folder: A path to the folder containing the MIDI files to create segments from
+            mid_folder: A path to the folder containing the MIDI files to create segments from (or to a packed
+                corpus of MIDI files)
             num_queries: The max number of query MIDI files to generate.
             melody_track: The track of on which the segmentation should be based
             segmenter_args: Any extra arguments for the chosen segmenter
@@ -49,16 +50,20 @@ class IndexedQueryCreator(QueryCreator):
         print("Loading MIDI files")
 
         # get all midi files
-        all_mids = list(map(lambda path: MidiFile(path), mid_location.glob("*.mid")))
+        if is_corpus(mid_folder):
+            all_mids = list(Corpus(mid_folder))
+        else:
+            all_mids = list(map(lambda path: SmfFile(str(path)), mid_location.glob("*.mid")))
         print(f"{len(all_mids)} MIDI files found")
         # remove any polyphonic files
-        available_mids = list(filter(lambda file: is_monophonic(file.tracks[melody_track]), all_mids))
+        available_mids = list(filter(lambda file: get_cached_track_profile(file, melody_track).is_monophonic, all_mids))
         print(f"{len(all_mids) - len(available_mids)} polyphonic MIDIs ignored. Total is now {len(available_mids)}")
 
         # create segments, then sample from them
-        segments = []
-        for mid in tqdm(available_mids, desc="Segmenting MIDI files"):
-            segments.extend(self.segmenter.create_segments(mid, melody_track, **segmenter_args))
+        print("Segmenting MIDI files")
+        segments = [segment for file_segments in
+                    self.segmenter.create_batch_segments(available_mids, melody_track, **segmenter_args)
+                    for segment in file_segments]
 
         total_length = len(segments)
         print(f"Created {total_length} segments.")
@@ -6,6 +6,7 @@ import project.server.query_handler_pb2_grpc as query_handler_pb2_grpc
 from project.algorithms.pitch_vector.query_pitch_vector import query_pitch_vector
 from project.algorithms.graph_based.query_graph_based import query_graph
 from project.algorithms.create_datasets import create_dataset_pv, create_dataset_graph
+from project.algorithms.graph_based.fingerprint_index import FingerprintIndex
 
 
 class QueryServicer(query_handler_pb2_grpc.QueryHandlerServicer):
@@ -19,13 +20,14 @@ class QueryServicer(query_handler_pb2_grpc.QueryHandlerServicer):
         print("Loading Graph Dataset")
         graph_dataset_start = time.time()
         self.graph_dataset = create_dataset_graph(graph_dataset)
+        self.graph_index = FingerprintIndex.load(graph_dataset)
         graph_dataset_end = time.time()
         print(f"Graph dataset loaded. It took {graph_dataset_end - graph_dataset_start}s")
 
     def QueryGraph(self, request, context):
         time_start = time.time()
         ranking = query_graph(request.query_mid, request.melody_track, request.use_minimum, False, self.graph_dataset,
-                              chord_track=request.chord_track)
+                              chord_track=request.chord_track, index=self.graph_index)
         time_end = time.time()
         return query_handler_pb2.QueryResponse(ranking=ranking, query_time=time_end-time_start, extra_info={})
 
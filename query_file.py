@@ -7,10 +7,12 @@ import time
 import datetime
 
 
-from project.algorithms.graph_based.query_graph_based import query_graph
+from project.algorithms.graph_based.query_graph_based import query_graph, query_graph_progressive
 from project.algorithms.pitch_vector.query_pitch_vector import query_pitch_vector
 from project.algorithms.create_datasets import create_dataset_pv, create_dataset_graph
+from project.algorithms.graph_based.fingerprint_index import FingerprintIndex
 import project.algorithms.core.constants as constants
+from project.algorithms.core.feature_cache import configure_feature_cache
 
 if __name__ == "__main__":
     start_time = time.time()
@@ -44,6 +46,14 @@ if __name__ == "__main__":
                                                                    " segment and segments in the MIDI instead of the "
                                                                    "average (this only is relevant for the "
                                                                    "graph based algorithm)")
+    parser.add_argument("--top_k", type=int, default=None,
+                        help="If set, only rank this many most similar songs, skipping songs which can't be among "
+                             "them (this only is relevant for the graph based algorithm) (default: every song)")
+    parser.add_argument("--progressive", action="store_true",
+                        help="If set, read the query one note at a time as if it were being played, matching each "
+                             "segment of it (found with the online LBDM segmenter) as soon as it's complete, and "
+                             "showing the rankings after each segment (this only is relevant for the graph based "
+                             "algorithm) (default: %(default)s)")
     parser.add_argument("--pv_veclength", type=int, default=16,
                         help="The size of the projection vectors used for the locality senstive hashing algorithm "
                              "(only relevant to the pitch vector algorithm) (default: %(default)s)")
@@ -52,12 +62,32 @@ if __name__ == "__main__":
                                                                       "from python's cProfile module "
                                                                       "(default: %(default)s)")
 
+    parser.add_argument("--cache_dir", type=str, default=None,
+                        help="If set, cache the features computed from each MIDI file (note timelines, tempo maps "
+                             "etc.) in this folder, so they aren't computed again next time. The folder can also be "
+                             f"set with the {constants.FEATURE_CACHE_DIR_VARIABLE} environment variable "
+                             "(default: no cache)")
+
+    parser.add_argument("--no_cache", action="store_true",
+                        help=f"If set, don't cache features, even if {constants.FEATURE_CACHE_DIR_VARIABLE} is set "
+                             "(default: %(default)s)")
+
     args = parser.parse_args()
+    configure_feature_cache(args.cache_dir, not args.no_cache)
     if args.algorithm[0] == "graph":
         print("Graph algorithm chosen: initialising dataset")
         graphs = create_dataset_graph(args.dataset_folder)
+        index = FingerprintIndex.load(args.dataset_folder)
+        if index is None:
+            print("The dataset has no fingerprint index (see segment.py), so every graph will be searched")
         print("Done. Querying starting...")
-        query_graph(args.midi_path, args.melody_track, args.use_minimum, args.write_graphs, graphs, args.chord_track)
+        if args.progressive:
+            for _ in query_graph_progressive(args.midi_path, args.melody_track, args.use_minimum, graphs,
+                                             args.chord_track, index=index):
+                pass
+        else:
+            query_graph(args.midi_path, args.melody_track, args.use_minimum, args.write_graphs, graphs,
+                        args.chord_track, index=index, top_k=args.top_k)
     elif args.algorithm[0] == "pitch_vector":
         print("Pitch Vector algorithm chosen: initialising dataset")
         pv_collections = create_dataset_pv(args.dataset_folder, args.pv_veclength)
@@ -14,6 +14,12 @@ from multiprocessing import Pool
 
 import project.algorithms.core.constants as constants
 from project.algorithms.core.chord import Chord
+from project.algorithms.core.corpus import Corpus, is_corpus
+from project.algorithms.core.feature_cache import configure_feature_cache
+from project.algorithms.graph_based.fingerprint_index import FingerprintIndex
+from project.algorithms.graph_based.lbdm_clustering_segmenter import LbdmClusteringSegmenter
+from project.algorithms.graph_based.lbdm_segmenter import LbdmSegmenter
+from project.algorithms.graph_based.online_lbdm_segmenter import OnlineLbdmSegmenter
 from project.algorithms.graph_based.segment_graph_based import segment_graph
 from project.algorithms.pitch_vector.segment_pitch_vector import segment_pitch_vector
 
@@ -23,7 +29,8 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Split a MIDI file into several segments "
                                                  "so it may be queried for similarity")
     parser.add_argument("midi_paths", nargs="+", type=str,
-                        help="Path to MIDI file(s) to segment")
+                        help="Path to MIDI file(s) to segment. Corpus files created by pack_corpus.py can also be "
+                             "given, in which case every MIDI file in the corpus is segmented")
 
     parser.add_argument("-o", "--output_folder", type=str, default=f"{time.strftime(constants.TIME_FORMAT)}",
                         help="Folder to put the output of the segmentation. This folder "
@@ -43,6 +50,13 @@ if __name__ == '__main__':
                         help="The track containing the chords in the MIDI file (if such a track exists) (only "
                              "relevant for the graph based algorithm)")
 
+    parser.add_argument("--segmenter", default="lbdm", choices=["lbdm", "lbdm_clustering", "online_lbdm"],
+                        help="How the graph based algorithm segments each file: \"lbdm\" splits the file where its "
+                             "LBDM boundary profile is above a fixed threshold, \"lbdm_clustering\" chooses the "
+                             "threshold of each file by clustering its profile, and \"online_lbdm\" reads the notes of "
+                             "the file as they're needed, normalising the profile by its maximum so far "
+                             "(default: %(default)s)")
+
     parser.add_argument("--n_processes", type=int, default=1,
                         help="The number of processes that should be used to segment the music (segmenting one MIDI "
                              "file per process) (default: %(default)s)")
@@ -58,7 +72,18 @@ if __name__ == '__main__':
                              "into one MIDI file (as well as the usual reduced "
                              "segments normally) (default: %(default)s)")
 
+    parser.add_argument("--cache_dir", type=str, default=None,
+                        help="If set, cache the features computed from each MIDI file (note timelines, tempo maps "
+                             "etc.) in this folder, so they aren't computed again next time. The folder can also be "
+                             f"set with the {constants.FEATURE_CACHE_DIR_VARIABLE} environment variable "
+                             "(default: no cache)")
+
+    parser.add_argument("--no_cache", action="store_true",
+                        help=f"If set, don't cache features, even if {constants.FEATURE_CACHE_DIR_VARIABLE} is set "
+                             "(default: %(default)s)")
+
     args = parser.parse_args()
+    configure_feature_cache(args.cache_dir, not args.no_cache)
     err_count = 0
     count = 0
     time_taken = 0
@@ -66,7 +91,11 @@ if __name__ == '__main__':
     for mid_path in args.midi_paths:
         globbed_paths = glob.glob(mid_path)
         for path in globbed_paths:
-            paths.append(path)
+            if is_corpus(path):
+                # the songs are already read, so they're segmented straight from the corpus
+                paths.extend(Corpus(path))
+            else:
+                paths.append(path)
 
     if len(paths) == 0:
         sys.stderr.write("Error: no MIDI files correspond to the path(s) given\n")
@@ -74,8 +103,14 @@ if __name__ == '__main__':
 
     if args.algorithm[0] == "graph":
         graph_start = time.time()
+        if args.segmenter == "lbdm_clustering":
+            segmenter = LbdmClusteringSegmenter()
+        elif args.segmenter == "online_lbdm":
+            segmenter = OnlineLbdmSegmenter()
+        else:
+            segmenter = LbdmSegmenter()
         graph_func = partial(segment_graph, melody_track=args.melody_track, output_folder=args.output_folder,
-                             chord_track=args.chord_track, save_combined=args.save_combined)
+                             chord_track=args.chord_track, save_combined=args.save_combined, segmenter=segmenter)
 
         errors = []
         if args.n_processes == 1:
@@ -90,6 +125,13 @@ if __name__ == '__main__':
             if error != 0:
                 err_count += 1
             count += 1
+
+        # index every graph in the output folder (including any segmented before), so queries only need to visit the
+        # nodes which match them
+        print("Indexing the fingerprints of the graphs in the output folder")
+        index = FingerprintIndex.from_folder(args.output_folder)
+        index.save(args.output_folder)
+        print(f"Done: indexed {len(index)} graphs")
         graph_end = time.time()
         time_taken = graph_end - graph_start
 
@@ -99,7 +141,7 @@ if __name__ == '__main__':
         errors = []
         if args.n_processes == 1:
             for path in paths:
-                error = pitch_func(paths)
+                error = pitch_func(path)
                 errors.append(error)
         else:
             with Pool(args.n_processes) as p: